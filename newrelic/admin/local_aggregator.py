@@ -0,0 +1,76 @@
+# Copyright 2010 New Relic, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import print_function
+
+from newrelic.admin import command, usage
+
+
+@command(
+    "local-aggregator",
+    "config_file [socket_path]",
+    """Runs a local aggregator for the harvest data of processes which have
+the 'local_aggregator.enabled' setting enabled, such as the workers of a
+prefork web server. The data of all the processes for an application is
+merged and reported to the data collector by the aggregator in a single
+harvest. The aggregator listens on <socket_path>, or if not supplied the
+'local_aggregator.socket_path' setting from <config_file>.""",
+)
+def local_aggregator(args):
+    import os
+    import sys
+    import time
+
+    if len(args) == 0:
+        usage("local-aggregator")
+        sys.exit(1)
+
+    from newrelic.config import initialize
+    from newrelic.core.agent import agent_instance
+    from newrelic.core.config import global_settings
+    from newrelic.core.local_aggregator import LocalAggregator, socket_path
+
+    config_file = args[0]
+    environment = os.environ.get("NEW_RELIC_ENVIRONMENT")
+
+    if config_file == "-":
+        config_file = os.environ.get("NEW_RELIC_CONFIG_FILE")
+
+    initialize(config_file, environment, ignore_errors=False)
+
+    settings = global_settings()
+
+    # The aggregator itself must always report to the data collector.
+
+    settings.local_aggregator.enabled = False
+
+    if len(args) >= 2:
+        path = args[1]
+    else:
+        path = socket_path(settings)
+
+    aggregator = LocalAggregator(path, agent_instance(), settings.local_aggregator.timeout)
+    aggregator.start()
+
+    print("Local aggregator listening on %s" % path)
+
+    try:
+        while True:
+            time.sleep(1.0)
+
+    except KeyboardInterrupt:
+        pass
+
+    finally:
+        aggregator.stop()
@@ -166,16 +166,19 @@ class Application(object):
         if self.active:
             self._agent.record_log_event(self._name, message, level, timestamp, priority=priority)
 
+    def should_sample_log_event(self, priority):
+        return self._agent.should_sample_log_event(self._name, priority)
+
     def normalize_name(self, name, rule_type="url"):
         if self.active:
             return self._agent.normalize_name(self._name, name, rule_type)
         return name, False
 
-    def compute_sampled(self):
+    def compute_sampled(self, transaction_name=None):
         if not self.active or not self.settings.distributed_tracing.enabled:
             return False
 
-        return self._agent.compute_sampled(self._name)
+        return self._agent.compute_sampled(self._name, transaction_name)
 
 
 def application_instance(name=None, activate=True):
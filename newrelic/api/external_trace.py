@@ -19,6 +19,7 @@ from newrelic.api.time_trace import TimeTrace, current_trace
 from newrelic.common.async_wrapper import async_wrapper as get_async_wrapper
 from newrelic.common.object_wrapper import FunctionWrapper, wrap_object
 from newrelic.core.external_node import ExternalNode
+from newrelic.core.string_table import intern_string
 
 
 class ExternalTrace(CatHeaderMixin, TimeTrace):
@@ -51,9 +52,9 @@ class ExternalTrace(CatHeaderMixin, TimeTrace):
 
     def create_node(self):
         return ExternalNode(
-            library=self.library,
+            library=intern_string(self.library),
             url=self.url,
-            method=self.method,
+            method=intern_string(self.method),
             children=self.children,
             start_time=self.start_time,
             end_time=self.end_time,
@@ -19,6 +19,7 @@ from newrelic.common.async_wrapper import async_wrapper as get_async_wrapper
 from newrelic.common.object_names import callable_name
 from newrelic.common.object_wrapper import FunctionWrapper, wrap_object
 from newrelic.core.function_node import FunctionNode
+from newrelic.core.string_table import intern_string
 
 
 class FunctionTrace(TimeTrace):
@@ -73,8 +74,8 @@ class FunctionTrace(TimeTrace):
 
     def create_node(self):
         return FunctionNode(
-            group=self.group,
-            name=self.name,
+            group=intern_string(self.group),
+            name=intern_string(self.name),
             children=self.children,
             start_time=self.start_time,
             end_time=self.end_time,
@@ -18,7 +18,7 @@ import re
 import warnings
 from logging import Formatter, LogRecord
 
-from newrelic.api.time_trace import get_linking_metadata
+from newrelic.api.time_trace import _linking_metadata
 from newrelic.api.transaction import current_transaction, record_log_event
 from newrelic.common import agent_http
 from newrelic.common.object_names import parse_exc_info
@@ -62,7 +62,9 @@ class NewRelicContextFormatter(Formatter):
             "file.name": record.pathname,
             "line.number": record.lineno,
         }
-        output.update(get_linking_metadata())
+        service_metadata, trace_metadata = _linking_metadata()
+        output.update(service_metadata)
+        output.update(trace_metadata)
 
         DEFAULT_LOG_RECORD_KEYS = cls.DEFAULT_LOG_RECORD_KEYS
         if len(record.__dict__) > len(DEFAULT_LOG_RECORD_KEYS):
@@ -89,11 +91,12 @@ class NewRelicContextFormatter(Formatter):
 class NewRelicLogForwardingHandler(logging.Handler):
     def emit(self, record):
         try:
-            # Avoid getting local log decorated message
+            # Avoid getting local log decorated message. The message is
+            # only formatted if the log event is retained.
             if hasattr(record, "_nr_original_message"):
-                message = record._nr_original_message()
+                message = record._nr_original_message
             else:
-                message = record.getMessage()
+                message = record.getMessage
 
             record_log_event(message, record.levelname, int(record.created * 1000))
         except Exception:
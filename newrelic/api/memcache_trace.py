@@ -18,6 +18,7 @@ from newrelic.api.time_trace import TimeTrace, current_trace
 from newrelic.common.async_wrapper import async_wrapper as get_async_wrapper
 from newrelic.common.object_wrapper import FunctionWrapper, wrap_object
 from newrelic.core.memcache_node import MemcacheNode
+from newrelic.core.string_table import intern_string
 
 
 class MemcacheTrace(TimeTrace):
@@ -39,7 +40,7 @@ class MemcacheTrace(TimeTrace):
 
     def create_node(self):
         return MemcacheNode(
-            command=self.command,
+            command=intern_string(self.command),
             children=self.children,
             start_time=self.start_time,
             end_time=self.end_time,
@@ -19,6 +19,7 @@ from newrelic.api.time_trace import TimeTrace, current_trace
 from newrelic.common.async_wrapper import async_wrapper as get_async_wrapper
 from newrelic.common.object_wrapper import FunctionWrapper, wrap_object
 from newrelic.core.message_node import MessageNode
+from newrelic.core.string_table import intern_string
 
 
 class MessageTrace(CatHeaderMixin, TimeTrace):
@@ -83,8 +84,8 @@ class MessageTrace(CatHeaderMixin, TimeTrace):
             end_time=self.end_time,
             duration=self.duration,
             exclusive=self.exclusive,
-            destination_name=self.destination_name,
-            destination_type=self.destination_type,
+            destination_name=intern_string(self.destination_name),
+            destination_type=intern_string(self.destination_type),
             params=self.params,
             guid=self.guid,
             agent_attributes=self.agent_attributes,
@@ -15,6 +15,7 @@
 import newrelic.api.object_wrapper
 import newrelic.api.time_trace
 import newrelic.core.solr_node
+import newrelic.core.string_table
 
 
 class SolrTrace(newrelic.api.time_trace.TimeTrace):
@@ -41,8 +42,8 @@ class SolrTrace(newrelic.api.time_trace.TimeTrace):
 
     def create_node(self):
         return newrelic.core.solr_node.SolrNode(
-            library=self.library,
-            command=self.command,
+            library=newrelic.core.string_table.intern_string(self.library),
+            command=newrelic.core.string_table.intern_string(self.command),
             children=self.children,
             start_time=self.start_time,
             end_time=self.end_time,
@@ -19,6 +19,7 @@ import sys
 import time
 import traceback
 import warnings
+import weakref
 
 from newrelic.api.settings import STRIP_EXCEPTION_MESSAGE
 from newrelic.common.object_names import parse_exc_info
@@ -28,6 +29,12 @@ from newrelic.core.code_level_metrics import (
     extract_code_from_traceback,
 )
 from newrelic.core.config import is_expected_error, should_ignore_error
+
+try:
+    from types import MappingProxyType
+except ImportError:
+    MappingProxyType = None
+from newrelic.core.internal_metrics import perf_counter_ns
 from newrelic.core.trace_cache import trace_cache
 
 from newrelic.packages import six
@@ -99,6 +106,10 @@ class TimeTrace(object):
             self.parent = None
             return self
 
+        overhead = transaction._agent_overhead
+        if overhead is not None:
+            overhead_start = perf_counter_ns()
+
         parent.increment_child_count()
 
         self.root = parent.root
@@ -124,6 +135,9 @@ class TimeTrace(object):
         if self._source is not None:
             self.add_code_level_metrics(self._source)
 
+        if overhead is not None:
+            overhead.record("TimeTrace/Enter", overhead_start)
+
         return self
 
     def __exit__(self, exc, value, tb):
@@ -151,6 +165,10 @@ class TimeTrace(object):
         if not transaction:
             return
 
+        overhead = transaction._agent_overhead
+        if overhead is not None:
+            overhead_start = perf_counter_ns()
+
         # If recording of time for transaction has already been
         # stopped, then that time has to be used.
 
@@ -191,6 +209,9 @@ class TimeTrace(object):
             # we may have children still running if we're async
             trace_cache().pop_current(self)
 
+        if overhead is not None:
+            overhead.record("TimeTrace/Exit", overhead_start)
+
     def add_custom_attribute(self, key, value):
         settings = self.settings
         if not settings:
@@ -543,8 +564,10 @@ class TimeTrace(object):
         node = self.create_node()
 
         if node:
-            transaction._process_node(node)
-            parent.process_child(node, self.is_async)
+            retain = transaction._process_node(node)
+            if retain and transaction._span_compression and not self.is_async:
+                retain = not transaction._compress_node(parent.children, node)
+            parent.process_child(node, self.is_async, retain)
 
         # ----------------------------------------------------------------------
         # SYNC  | The parent will not have exited yet, so no node will be
@@ -592,8 +615,14 @@ class TimeTrace(object):
             # call parent exclusive duration delta
             self.parent.update_async_exclusive_time(min_child_start_time, exclusive_duration_remaining)
 
-    def process_child(self, node, is_async):
-        self.children.append(node)
+    def process_child(self, node, is_async, retain=True):
+        # A node which was folded by the transaction is not kept as a
+        # child, so it is no longer counted as one either.
+        if retain:
+            self.children.append(node)
+        else:
+            self.child_count -= 1
+
         if is_async:
 
             # record the lowest start time
@@ -665,12 +694,23 @@ def get_trace_linking_metadata():
         return {}
 
 
-def get_service_linking_metadata(application=None, settings=None):
-    metadata = {
-        "entity.type": "SERVICE",
-    }
+_SERVICE_ENTITY_METADATA = {"entity.type": "SERVICE"}
+
+if MappingProxyType is not None:
+    _SERVICE_ENTITY_METADATA = MappingProxyType(_SERVICE_ENTITY_METADATA)
+
+# The service linking metadata for each settings object, held weakly so
+# that it is discarded along with the settings at the end of an agent run.
+
+_service_linking_cache = weakref.WeakKeyDictionary()
+
+
+def _service_linking_metadata(application=None, settings=None, trace=None):
+    # Returns the service linking metadata for the settings, which is
+    # shared between callers as a read only mapping. The metadata is only
+    # rebuilt when the settings change, such as on a new agent run. Where
+    # read only mappings are not available, each caller gets a copy.
 
-    trace = current_trace()
     if settings is None and trace:
         txn = trace.transaction
         if txn:
@@ -685,21 +725,65 @@ def get_service_linking_metadata(application=None, settings=None):
         if application is not None:
             settings = application.settings
 
-    if settings:
-        metadata["entity.name"] = settings.app_name
+    if not settings:
+        metadata = _SERVICE_ENTITY_METADATA
+
+    else:
+        app_name = settings.app_name
         entity_guid = settings.entity_guid
-        if entity_guid:
-            metadata["entity.guid"] = entity_guid
-        metadata["hostname"] = platform.uname()[1]
+
+        try:
+            cache = _service_linking_cache.get(settings)
+        except TypeError:
+            cache = None
+
+        if cache is None or cache[0] != app_name or cache[1] != entity_guid:
+            metadata = {
+                "entity.type": "SERVICE",
+                "entity.name": app_name,
+            }
+            if entity_guid:
+                metadata["entity.guid"] = entity_guid
+            metadata["hostname"] = platform.uname()[1]
+
+            if MappingProxyType is not None:
+                metadata = MappingProxyType(metadata)
+
+            cache = (app_name, entity_guid, metadata)
+
+            try:
+                _service_linking_cache[settings] = cache
+            except TypeError:
+                pass
+
+        metadata = cache[2]
+
+    if MappingProxyType is None:
+        return dict(metadata)
 
     return metadata
 
 
-def get_linking_metadata(application=None):
-    metadata = get_service_linking_metadata()
+def _linking_metadata():
+    # Returns the shared service linking metadata and the trace linking
+    # metadata for the current trace, leaving it to the caller to merge
+    # them where required.
+
     trace = current_trace()
+    service_metadata = _service_linking_metadata(trace=trace)
     if trace:
-        metadata.update(trace._get_trace_linking_metadata())
+        return service_metadata, trace._get_trace_linking_metadata()
+    return service_metadata, {}
+
+
+def get_service_linking_metadata(application=None, settings=None):
+    return dict(_service_linking_metadata(application, settings, current_trace()))
+
+
+def get_linking_metadata(application=None):
+    service_metadata, trace_metadata = _linking_metadata()
+    metadata = dict(service_metadata)
+    metadata.update(trace_metadata)
     return metadata
 
 
@@ -23,10 +23,13 @@ import threading
 import time
 import warnings
 import weakref
-from collections import OrderedDict
+from collections import OrderedDict, namedtuple
 
+import newrelic.core.aggregate_node
 import newrelic.core.database_node
+import newrelic.core.datastore_node
 import newrelic.core.error_node
+import newrelic.core.external_node
 import newrelic.core.root_node
 import newrelic.core.transaction_node
 from newrelic.api.application import application_instance
@@ -34,8 +37,8 @@ from newrelic.api.time_trace import TimeTrace, get_linking_metadata
 from newrelic.common.encoding_utils import (
     DistributedTracePayload,
     NrTraceState,
+    TraceContextTemplate,
     W3CTraceParent,
-    W3CTraceState,
     base64_decode,
     convert_to_cat_metadata_value,
     deobfuscate,
@@ -44,6 +47,7 @@ from newrelic.common.encoding_utils import (
     json_decode,
     json_encode,
     obfuscate,
+    trace_state_cache,
     snake_case,
 )
 from newrelic.core.attribute import (
@@ -67,9 +71,16 @@ from newrelic.core.config import (
     ML_EVENT_RESERVOIR_SIZE,
 )
 from newrelic.core.custom_event import create_custom_event
+from newrelic.core.internal_metrics import AgentOverhead, perf_counter_ns
 from newrelic.core.log_event_node import LogEventNode
-from newrelic.core.stack_trace import exception_stack
-from newrelic.core.stats_engine import CustomMetrics, DimensionalMetrics, SampledDataSet
+from newrelic.core.stack_trace import capture_exception_stack
+from newrelic.core.stats_engine import (
+    CustomMetrics,
+    DimensionalMetrics,
+    SampledDataSet,
+    ScopedMetrics,
+)
+from newrelic.core.string_table import intern_pool
 from newrelic.core.thread_utilization import utilization_tracker
 from newrelic.core.trace_cache import (
     TraceCacheActiveTraceError,
@@ -80,6 +91,30 @@ from newrelic.packages import six
 
 _logger = logging.getLogger(__name__)
 
+# Stand ins for the stats engine and root node used when recording the
+# metrics for nodes folded once a transaction exceeds its node budget.
+
+_FOLDED_NODE_SCOPE = object()
+_FoldedNodeStats = namedtuple("_FoldedNodeStats", ["settings"])
+_FoldedNodeRoot = namedtuple("_FoldedNodeRoot", ["path", "type"])
+
+# Exit nodes which can be compressed when repeated as consecutive
+# siblings, with the key identifying their name and destination.
+
+_COMPRESSIBLE_NODE_TYPES = (
+    newrelic.core.database_node.DatabaseNode,
+    newrelic.core.datastore_node.DatastoreNode,
+    newrelic.core.external_node.ExternalNode,
+)
+
+
+def _compression_key(node):
+    if type(node) is newrelic.core.external_node.ExternalNode:
+        return (node.name,)
+
+    return (node.name, node.instance_hostname, node.port_path_or_id, node.database_name)
+
+
 DISTRIBUTED_TRACE_KEYS_REQUIRED = ("ty", "ac", "ap", "tr", "ti")
 DISTRIBUTED_TRACE_TRANSPORT_TYPES = set(("HTTP", "HTTPS", "Kafka", "JMS", "IronMQ", "AMQP", "Queue", "Other"))
 DELIMITER_FORMAT_RE = re.compile("[ \t]*,[ \t]*")
@@ -220,6 +255,14 @@ class Transaction(object):
 
         self._string_cache = {}
 
+        self._node_budget = None
+        self._folded_nodes = {}
+        self._folded_metrics = ScopedMetrics()
+        self._folded_context = None
+
+        self._span_compression = False
+        self._propagated_guids = set()
+
         self._custom_params = OrderedDict()
         self._request_params = {}
 
@@ -293,6 +336,7 @@ class Transaction(object):
         self._sampled = None
 
         self._distributed_trace_state = 0
+        self._trace_context_template = None
 
         self.client_cross_process_id = None
         self.client_account_id = None
@@ -337,7 +381,15 @@ class Transaction(object):
                 if self._settings:
                     self.enabled = True
 
+        self._agent_overhead = None
+
         if self._settings:
+            if self._settings.agent_overhead.enabled:
+                self._agent_overhead = AgentOverhead()
+
+            self._node_budget = self._settings.agent_limits.transaction_node_budget
+            self._span_compression = self._settings.span_compression.enabled
+
             self._custom_events = SampledDataSet(
                 capacity=self._settings.event_harvest_config.harvest_limits.custom_event_data
             )
@@ -517,6 +569,11 @@ class Transaction(object):
 
         request_params = self.request_parameters
 
+        if self._agent_overhead is not None:
+            self._agent_attributes["agent.overhead"] = self._agent_overhead.duration
+            for name, value in self._agent_overhead.metrics():
+                self.record_custom_metric(name, value)
+
         root.update_with_transaction_custom_attributes(self._custom_params)
 
         # Update agent attributes and include them on the root node
@@ -529,7 +586,7 @@ class Transaction(object):
 
         root_node = newrelic.core.root_node.RootNode(
             name=self.name_for_metric,
-            children=tuple(root.children),
+            children=tuple(root.children) + tuple(self._folded_nodes.values()),
             start_time=self.start_time,
             end_time=self.end_time,
             exclusive=exclusive,
@@ -639,6 +696,9 @@ class Transaction(object):
             root=root_node,
         )
 
+        if self._folded_metrics:
+            node.folded_metrics = self._rescope_folded_metrics()
+
         # Clear settings as we are all done and don't need it
         # anymore.
 
@@ -998,7 +1058,10 @@ class Transaction(object):
             self._priority = float("%.6f" % random.random())  # nosec
 
         if self._sampled is None:
-            self._sampled = self._application.compute_sampled()
+            if self._settings and self._settings.sampling_budgets.enabled:
+                self._sampled = self._application.compute_sampled(self.path)
+            else:
+                self._sampled = self._application.compute_sampled()
             if self._sampled:
                 self._priority += 1
 
@@ -1053,6 +1116,8 @@ class Transaction(object):
         data = self._create_distributed_trace_data()
         if guid and data and "id" in data:
             data["id"] = guid
+            if self._span_compression:
+                self._propagated_guids.add(guid)
         return data
 
     def _create_distributed_trace_data(self):
@@ -1087,6 +1152,8 @@ class Transaction(object):
         current_span = trace_cache().current_trace()
         if settings.span_events.enabled and settings.collect_span_events and current_span:
             data["id"] = current_span.guid
+            if self._span_compression:
+                self._propagated_guids.add(current_span.guid)
 
         self._distributed_trace_state |= CREATED_DISTRIBUTED_TRACE
 
@@ -1121,23 +1188,22 @@ class Transaction(object):
         try:
             data = data or self._create_distributed_trace_data()
             if data:
-                traceparent = W3CTraceParent(data).text()
-                yield ("traceparent", traceparent)
+                # Only the span id and timestamp change between the
+                # headers created for a transaction, so the remainder of
+                # the headers are precomputed.
 
-                tracestate = NrTraceState(data).text()
-                if self.tracestate:
-                    tracestate += "," + self.tracestate
-                yield ("tracestate", tracestate)
+                template = self._trace_context_template
+                if template is None or template.key != TraceContextTemplate.template_key(data, self.tracestate):
+                    template = self._trace_context_template = TraceContextTemplate(data, self.tracestate)
+
+                yield ("traceparent", template.traceparent(data))
+                yield ("tracestate", template.tracestate(data))
 
                 self._record_supportability("Supportability/TraceContext/Create/Success")
 
                 if not self._settings.distributed_tracing.exclude_newrelic_header:
                     # Insert New Relic dt headers for backwards compatibility
-                    payload = DistributedTracePayload(
-                        v=DistributedTracePayload.version,
-                        d=data,
-                    )
-                    yield ("newrelic", payload.http_safe())
+                    yield ("newrelic", template.payload(data))
                     self._record_supportability("Supportability/DistributedTrace/CreatePayload/Success")
 
         except:
@@ -1147,7 +1213,14 @@ class Transaction(object):
                 self._record_supportability("Supportability/DistributedTrace/CreatePayload/Exception")
 
     def insert_distributed_trace_headers(self, headers):
+        overhead = self._agent_overhead
+        if overhead is None:
+            headers.extend(self._generate_distributed_trace_headers())
+            return
+
+        overhead_start = perf_counter_ns()
         headers.extend(self._generate_distributed_trace_headers())
+        overhead.record("DistributedTrace/CreateHeaders", overhead_start)
 
     def _can_accept_distributed_trace_headers(self):
         if not self.enabled:
@@ -1281,6 +1354,17 @@ class Transaction(object):
         self._distributed_trace_state = ACCEPTED_DISTRIBUTED_TRACE
 
     def accept_distributed_trace_headers(self, headers, transport_type="HTTP"):
+        overhead = self._agent_overhead
+        if overhead is None:
+            return self._accept_distributed_trace_headers(headers, transport_type)
+
+        overhead_start = perf_counter_ns()
+        try:
+            return self._accept_distributed_trace_headers(headers, transport_type)
+        finally:
+            overhead.record("DistributedTrace/AcceptHeaders", overhead_start)
+
+    def _accept_distributed_trace_headers(self, headers, transport_type):
         if not self._can_accept_distributed_trace_headers():
             return False
 
@@ -1317,13 +1401,12 @@ class Transaction(object):
             if tracestate:
                 tracestate = ensure_str(tracestate)
                 try:
-                    vendors = W3CTraceState.decode(tracestate)
                     trusted_account_key = self._settings.trusted_account_key or (
                         self._settings.serverless_mode.enabled and self._settings.account_id
                     )
-                    payload = vendors.pop(trusted_account_key + "@nr", "")
-                    self.tracing_vendors = ",".join(vendors.keys())
-                    self.tracestate = vendors.text(limit=31)
+                    payload, self.tracing_vendors, self.tracestate = trace_state_cache().decode(
+                        tracestate, trusted_account_key
+                    )
                 except:
                     self._record_supportability("Supportability/TraceContext/TraceState/Parse/Exception")
                 else:
@@ -1535,6 +1618,30 @@ class Transaction(object):
         ):
             return
 
+        if priority is None:
+            priority = random.random()  # nosec
+
+        # The message may be passed as a callable so that formatting it
+        # can be deferred until it is known the event will be retained.
+        # Once the transaction is merged, the event takes the priority of
+        # the transaction where that is higher, which is raised further if
+        # the transaction is yet to be sampled and then is. It is only
+        # kept if it can be admitted to the harvest reservoir at that
+        # priority.
+
+        merged_priority = self._priority if self._priority is not None else 1.0
+        if self._sampled is None:
+            merged_priority += 1
+
+        if not self._log_events.should_sample(priority) or not self._application.should_sample_log_event(
+            max(priority, merged_priority)
+        ):
+            self._log_events.discard()
+            return
+
+        if callable(message):
+            message = message()
+
         timestamp = timestamp if timestamp is not None else time.time()
         level = str(level) if level is not None else "UNKNOWN"
 
@@ -1615,7 +1722,7 @@ class Transaction(object):
             message=message,
             expected=expected,
             span_id=span_id,
-            stack_trace=exception_stack(tb),
+            stack_trace=capture_exception_stack(tb),
             custom_params=custom_params,
             source=source,
             error_group_name=error_group_name,
@@ -1675,27 +1782,132 @@ class Transaction(object):
             self._ml_events.add(event, priority=self.priority)
 
     def _intern_string(self, value):
+        # Strings are shared across transactions through the process wide
+        # intern pool, falling back to sharing them only within this
+        # transaction when the pool is disabled.
+
+        pool = intern_pool()
+        if pool.maximum:
+            return pool.intern(value)
         return self._string_cache.setdefault(value, value)
 
     def _process_node(self, node):
+        # Returns whether the node should be retained by its parent. Once
+        # the transaction has gone over its node budget the node is instead
+        # folded into an aggregate node so that memory use is bounded by
+        # the number of distinct node names rather than by the number of
+        # nodes.
+
         self._trace_node_count += 1
         node.node_count = self._trace_node_count
         self.total_time += node.exclusive
 
+        retain = True
+
+        budget = self._node_budget
+        if budget is not None and self._trace_node_count > budget:
+            self._fold_node(node)
+            retain = False
+
         if type(node) is newrelic.core.database_node.DatabaseNode:
             settings = self._settings
             if not settings:
-                return
+                return retain
             if not settings.collect_traces:
-                return
+                return retain
             if not settings.slow_sql.enabled and not settings.transaction_tracer.explain_enabled:
-                return
+                return retain
             if settings.transaction_tracer.record_sql == "off":
-                return
+                return retain
             if node.duration < settings.transaction_tracer.explain_threshold:
-                return
+                return retain
             self._slow_sql.append(node)
 
+        return retain
+
+    def _record_folded_metrics(self, node):
+        # The metrics for the node, and for any children it retained, are
+        # recorded now as the node will not be reachable from the root node
+        # when the transaction exits. The transaction may still be renamed
+        # before it exits, so scoped metrics are recorded against a
+        # placeholder scope which is replaced on exit. Returns the name of
+        # the scoped metric for the node.
+
+        if self._folded_context is None:
+            self._folded_context = (
+                _FoldedNodeStats(settings=self._settings),
+                _FoldedNodeRoot(path=_FOLDED_NODE_SCOPE, type=self.type),
+            )
+
+        stats, root = self._folded_context
+
+        name = None
+
+        for metric in node.time_metrics(stats, root, None):
+            if name is None and metric.scope is _FOLDED_NODE_SCOPE:
+                name = metric.name
+            self._folded_metrics.record_time_metric(metric)
+
+        return name
+
+    def _fold_node(self, node):
+        name = self._record_folded_metrics(node)
+        name = name or getattr(node, "name", None) or type(node).__name__
+
+        aggregate = self._folded_nodes.get(name)
+        if aggregate is None:
+            guid = "%016x" % random.getrandbits(64)
+            aggregate = newrelic.core.aggregate_node.AggregateNode(name=name, guid=guid)
+            self._folded_nodes[name] = aggregate
+
+        aggregate.merge_node(node)
+
+    def _compress_node(self, siblings, node):
+        # Returns True if the node was merged with the immediately prior
+        # sibling, in which case it is not to be retained by its parent.
+        # Only exit nodes without children can be compressed, and not
+        # where the span id for the call was propagated in distributed
+        # trace headers, as other services would then refer to a span
+        # which no longer exists.
+
+        if not siblings or node.children or type(node) not in _COMPRESSIBLE_NODE_TYPES:
+            return False
+
+        if node.guid in self._propagated_guids:
+            return False
+
+        key = _compression_key(node)
+        previous = siblings[-1]
+
+        if type(previous) is newrelic.core.aggregate_node.CompositeNode:
+            if previous.key != key:
+                return False
+            composite = previous
+        else:
+            if (
+                type(previous) is not type(node)
+                or previous.children
+                or previous.guid in self._propagated_guids
+                or _compression_key(previous) != key
+            ):
+                return False
+
+            self._record_folded_metrics(previous)
+            composite = newrelic.core.aggregate_node.CompositeNode(previous, key)
+            siblings[-1] = composite
+
+        self._record_folded_metrics(node)
+        composite.merge_node(node)
+
+        return True
+
+    def _rescope_folded_metrics(self):
+        path = self.path
+        return tuple(
+            ((name, path if scope is _FOLDED_NODE_SCOPE else scope), stats)
+            for (name, scope), stats in self._folded_metrics.metrics()
+        )
+
     def stop_recording(self):
         if not self.enabled:
             return
@@ -1717,6 +1929,17 @@ class Transaction(object):
         self._cpu_user_time_end = os.times()[0]
 
     def add_custom_attribute(self, name, value):
+        overhead = self._agent_overhead
+        if overhead is None:
+            return self._add_custom_attribute(name, value)
+
+        overhead_start = perf_counter_ns()
+        try:
+            return self._add_custom_attribute(name, value)
+        finally:
+            overhead.record("Attributes", overhead_start)
+
+    def _add_custom_attribute(self, name, value):
         if not self._settings:
             return False
 
@@ -2065,7 +2288,8 @@ def record_log_event(message, level=None, timestamp=None, application=None, prio
     """Record a log event.
 
     Args:
-        record (logging.Record):
+        message (str or callable): The log message, or a callable returning
+            the log message which is only called if the event is retained.
         application (newrelic.api.Application): Application instance.
     """
 
@@ -2079,6 +2303,9 @@ def record_log_event(message, level=None, timestamp=None, application=None, prio
             if application and application.enabled:
                 application.record_log_event(message, level, timestamp, priority=priority)
             else:
+                if callable(message):
+                    message = message()
+
                 _logger.debug(
                     "record_log_event has been called but no transaction or application was running. As a result, "
                     "the following event has not been recorded. message: %r level: %r timestamp %r. To correct "
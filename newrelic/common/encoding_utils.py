@@ -25,6 +25,7 @@ import itertools
 import json
 import random
 import re
+import threading
 import types
 import zlib
 from collections import OrderedDict
@@ -33,6 +34,7 @@ from newrelic.packages import six
 
 HEXDIGLC_RE = re.compile('^[0-9a-f]+$')
 DELIMITER_FORMAT_RE = re.compile('[ \t]*,[ \t]*')
+TRACEPARENT_V00_RE = re.compile('00-([0-9a-f]{32})-([0-9a-f]{16})-[0-9a-f]{2}\\Z')
 PARENT_TYPE = {
     '0': 'App',
     '1': 'Browser',
@@ -456,6 +458,19 @@ class W3CTraceParent(dict):
         if len(payload) < 55:
             return None
 
+        # A version 00 traceparent is exactly 55 chars, in which case it
+        # can be validated with a single regular expression match.
+        if len(payload) == 55 and payload.startswith('00-'):
+            match = TRACEPARENT_V00_RE.match(payload)
+            if match is None:
+                return None
+
+            trace_id, parent_id = match.groups()
+            if parent_id == '0' * 16 or trace_id == '0' * 32:
+                return None
+
+            return cls(tr=trace_id, id=parent_id)
+
         fields = payload.split('-', 4)
 
         # Expect that there are at least 4 fields
@@ -499,7 +514,10 @@ class W3CTraceState(OrderedDict):
     @classmethod
     def decode(cls, tracestate):
         entries = DELIMITER_FORMAT_RE.split(tracestate.rstrip())
+        return cls.from_entries(entries)
 
+    @classmethod
+    def from_entries(cls, entries):
         vendors = cls()
         for entry in entries:
             vendor_value = entry.split('=', 2)
@@ -573,6 +591,126 @@ class NrTraceState(dict):
             return data
 
 
+class TraceStateCache(object):
+    """A small LRU cache of the parts of inbound tracestate headers other
+    than the New Relic entry. The entries for other vendors are typically
+    the same across requests, whereas the New Relic entry contains a
+    timestamp and so is always decoded.
+
+    """
+
+    def __init__(self, maximum=64):
+        self.maximum = maximum
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def decode(self, tracestate, trusted_account_key):
+        """Returns a tuple of the New Relic entry for the trusted account,
+        the comma separated names of the other vendors, and the text of
+        the entries for the other vendors to be propagated. This gives
+        the same results as decoding the header with W3CTraceState.
+
+        """
+
+        prefix = trusted_account_key + '@nr='
+
+        payload = ''
+        entries = []
+
+        for entry in DELIMITER_FORMAT_RE.split(tracestate.rstrip()):
+            if entry.startswith(prefix):
+                value = entry[len(prefix):]
+                if '=' not in value and len(value) <= 256 and len(prefix) <= 257:
+                    payload = value
+                continue
+            entries.append(entry)
+
+        key = tuple(entries)
+
+        with self._lock:
+            vendors = self._cache.pop(key, None)
+            if vendors is not None:
+                self._cache[key] = vendors
+
+        if vendors is None:
+            state = W3CTraceState.from_entries(entries)
+            vendors = (','.join(state.keys()), state.text(limit=31))
+
+            with self._lock:
+                self._cache[key] = vendors
+                while len(self._cache) > self.maximum:
+                    self._cache.popitem(last=False)
+
+        return (payload,) + vendors
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+
+
+_trace_state_cache = TraceStateCache()
+
+
+def trace_state_cache():
+    return _trace_state_cache
+
+
+class TraceContextTemplate(object):
+    """Holds the precomputed parts of the outbound traceparent, tracestate
+    and newrelic headers for a transaction. Only the span id and the
+    timestamp differ between the headers created for the same
+    transaction, with the template being recreated should any of the
+    other values change.
+
+    """
+
+    def __init__(self, data, tracestate):
+        self.key = self.template_key(data, tracestate)
+
+        self.traceparent_prefix = '00-%s-' % data['tr'].lower().zfill(32)
+        self.traceparent_suffix = '-%02x' % int(data.get('sa', 0))
+
+        pr = data.get('pr')
+        pr = '' if pr is None else ('%.6f' % pr).rstrip('0').rstrip('.')
+
+        self.tracestate_prefix = '%s@nr=0-0-%s-%s-' % (
+                data.get('tk', data['ac']), data['ac'], data['ap'])
+        self.tracestate_middle = '-%s-%s-%s-' % (data.get('tx', ''),
+                '1' if data.get('sa') else '0', pr)
+        self.tracestate_suffix = tracestate and (',' + tracestate) or ''
+
+        static = dict((k, v) for k, v in data.items() if k not in ('id', 'ti'))
+        self.payload_prefix = '{"v":%s,"d":%s' % (
+                json_encode(DistributedTracePayload.version),
+                json_encode(static)[:-1])
+        if static:
+            self.payload_prefix += ','
+
+    @staticmethod
+    def template_key(data, tracestate):
+        return (data.get('tr'), data.get('sa'), data.get('pr'),
+                data.get('tx'), data.get('tk'), tracestate)
+
+    def traceparent(self, data):
+        if 'id' in data:
+            guid = data['id']
+        else:
+            guid = '{:016x}'.format(random.getrandbits(64))
+
+        return self.traceparent_prefix + guid + self.traceparent_suffix
+
+    def tracestate(self, data):
+        return ''.join((self.tracestate_prefix, data.get('id', ''),
+                self.tracestate_middle, str(data['ti']),
+                self.tracestate_suffix))
+
+    def payload(self, data):
+        text = self.payload_prefix + '"ti":%d' % data['ti']
+        if 'id' in data:
+            text += ',"id":' + json_encode(data['id'])
+        return base64_encode(text + '}}')
+
+
 def capitalize(string):
     """Capitalize the first letter of a string."""
     if not string:
@@ -15,6 +15,7 @@
 import collections
 import logging
 import threading
+import time
 
 try:
     from newrelic.core.infinite_tracing_pb2 import AttributeValue, SpanBatch
@@ -145,6 +146,158 @@ class StreamBufferIterator(object):
         return self
 
 
+class SpanRetentionBuffer(object):
+    """Holds the spans of traces which are not yet known to be of interest
+    for a short period before they are put on the stream buffer. A trace
+    is of interest if any transaction in it has an error, exceeds the
+    duration threshold, matches one of the configured transaction names,
+    or if the trace is chosen by the sample rate. The held spans of other
+    traces are dropped once the hold time elapses, or evicted oldest trace
+    first when more than the maximum number of spans are held.
+
+    """
+
+    def __init__(self, stream_buffer, settings):
+        self.stream_buffer = stream_buffer
+
+        tail_sampling = settings.infinite_tracing.tail_sampling
+        self.hold_time = tail_sampling.hold_time
+        self.max_spans = tail_sampling.max_spans
+        self.duration_threshold = tail_sampling.duration_threshold
+        self.sample_rate = tail_sampling.sample_rate
+
+        self._names = set()
+        self._prefixes = []
+        for name in tail_sampling.transaction_names or ():
+            if name.endswith("*"):
+                self._prefixes.append(name[:-1])
+            else:
+                self._names.add(name)
+        self._prefixes = tuple(self._prefixes)
+
+        self._lock = threading.Lock()
+
+        # Traces held awaiting a decision, and traces recently found to
+        # be of interest, both ordered by when they expire.
+        self._held = collections.OrderedDict()
+        self._retained = collections.OrderedDict()
+        self._held_spans = 0
+
+        self._forwarded = 0
+        self._dropped = 0
+        self._evicted = 0
+
+    def _sampled(self, trace_id):
+        # The decision is derived from the trace id so that it is the
+        # same for every transaction in the trace.
+        if not self.sample_rate:
+            return False
+        try:
+            return int(trace_id[-8:], 16) < self.sample_rate * 0x100000000
+        except (TypeError, ValueError):
+            return False
+
+    def retain(self, transaction):
+        if transaction.errors:
+            return True
+
+        if self.duration_threshold is not None and transaction.duration >= self.duration_threshold:
+            return True
+
+        name = transaction.path
+        if name in self._names or (self._prefixes and name.startswith(self._prefixes)):
+            return True
+
+        return self._sampled(transaction.trace_id)
+
+    def _expire(self, now):
+        held = self._held
+        while held:
+            trace_id = next(iter(held))
+            deadline, spans = held[trace_id]
+            if deadline > now:
+                break
+            del held[trace_id]
+            self._held_spans -= len(spans)
+            self._dropped += len(spans)
+
+        retained = self._retained
+        while retained:
+            trace_id = next(iter(retained))
+            if retained[trace_id] > now:
+                break
+            del retained[trace_id]
+
+    def _evict(self):
+        held = self._held
+        while self._held_spans > self.max_spans and held:
+            _, (_, spans) = held.popitem(last=False)
+            self._held_spans -= len(spans)
+            self._evicted += len(spans)
+
+    def expire(self):
+        with self._lock:
+            self._expire(time.time())
+
+    def put_transaction(self, transaction, settings):
+        now = time.time()
+        retain = self.retain(transaction)
+        trace_id = transaction.trace_id
+
+        # The spans are generated up front so that only they, rather than
+        # the whole transaction, are held.
+
+        spans = list(transaction.span_protos(settings))
+
+        with self._lock:
+            self._expire(now)
+
+            if not retain and trace_id not in self._retained:
+                # A single transaction can't hold more than the maximum
+                # number of spans, with the spans beyond that evicted.
+
+                if len(spans) > self.max_spans:
+                    self._evicted += len(spans) - self.max_spans
+                    del spans[self.max_spans :]
+
+                entry = self._held.get(trace_id)
+                if entry is None:
+                    entry = self._held[trace_id] = (now + self.hold_time, [])
+                entry[1].extend(spans)
+                self._held_spans += len(spans)
+                self._evict()
+                return
+
+            # Later transactions in a trace found to be of interest are
+            # forwarded immediately while the trace remains retained.
+            self._retained.pop(trace_id, None)
+            self._retained[trace_id] = now + self.hold_time
+            while len(self._retained) > self.max_spans:
+                self._retained.popitem(last=False)
+
+            entry = self._held.pop(trace_id, None)
+            if entry is not None:
+                self._held_spans -= len(entry[1])
+                spans = entry[1] + spans
+
+        for span in spans:
+            self.stream_buffer.put(span)
+
+        with self._lock:
+            self._forwarded += len(spans)
+
+    def stats(self):
+        with self._lock:
+            self._expire(time.time())
+            forwarded, dropped, evicted = self._forwarded, self._dropped, self._evicted
+            self._forwarded, self._dropped, self._evicted = 0, 0, 0
+
+        return forwarded, dropped, evicted
+
+    def __len__(self):
+        return self._held_spans
+
+
 class SpanProtoAttrs(dict):
     def __init__(self, *args, **kwargs):
         super(SpanProtoAttrs, self).__init__()
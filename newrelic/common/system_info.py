@@ -17,13 +17,16 @@ system or for the specific process the code is running in.
 
 """
 
+import errno
 import logging
 import multiprocessing
 import os
 import re
 import socket
+import stat
 import subprocess
 import sys
+import tempfile
 import threading
 
 from newrelic.common.utilization import CommonUtilization
@@ -455,3 +458,42 @@ class BootIdUtilization(CommonUtilization):
             cls.record_error(cls.METADATA_URL, stripped)
 
         return stripped[:128] or None
+
+
+def private_directory(name):
+    """Returns the path of a directory within the temporary directory for
+    the use of the current user only, with the name of the directory
+    including the ID of the user.
+
+    """
+
+    if hasattr(os, "getuid"):
+        name = "%s-%d" % (name, os.getuid())
+
+    return os.path.join(tempfile.gettempdir(), name)
+
+
+def make_private_directory(path):
+    """Creates the directory where it does not exist, such that it is only
+    accessible to the current user. An OSError is raised where the directory
+    exists but is not owned by the current user, as the contents of the
+    directory could then be read or replaced by another user.
+
+    """
+
+    try:
+        os.makedirs(path, 0o700)
+    except OSError as exc:
+        if exc.errno != errno.EEXIST:
+            raise
+
+    if not hasattr(os, "getuid"):
+        return
+
+    info = os.lstat(path)
+
+    if not stat.S_ISDIR(info.st_mode) or info.st_uid != os.getuid():
+        raise OSError(errno.EPERM, "Directory is not owned by the current user", path)
+
+    if stat.S_IMODE(info.st_mode) & 0o077:
+        os.chmod(path, 0o700)
@@ -216,6 +216,10 @@ def _map_inc_excl_attributes(s):
     return newrelic.core.config._parse_attributes(s)
 
 
+def _map_sampling_budgets(s):
+    return newrelic.core.config._parse_sampling_budgets(s)
+
+
 def _map_default_host_value(license_key):
     # If the license key is region aware, we should override the default host
     # to be the region aware host
@@ -353,8 +357,16 @@ def _process_configuration(section):
     _process_setting(section, "attributes.exclude", "get", _map_inc_excl_attributes)
     _process_setting(section, "attributes.include", "get", _map_inc_excl_attributes)
     _process_setting(section, "transaction_name.naming_scheme", "get", None)
+    _process_setting(section, "agent_overhead.enabled", "getboolean", None)
+    _process_setting(section, "explain_plan_cache.enabled", "getboolean", None)
+    _process_setting(section, "explain_plan_cache.ttl", "getfloat", None)
+    _process_setting(section, "explain_plan_cache.max_entries", "getint", None)
+    _process_setting(section, "explain_plan_cache.background_worker", "getboolean", None)
+    _process_setting(section, "kafka_batch_mode.enabled", "getboolean", None)
     _process_setting(section, "gc_runtime_metrics.enabled", "getboolean", None)
     _process_setting(section, "gc_runtime_metrics.top_object_count_limit", "getint", None)
+    _process_setting(section, "cgroup_runtime_metrics.enabled", "getboolean", None)
+    _process_setting(section, "thread_runtime_metrics.enabled", "getboolean", None)
     _process_setting(section, "thread_profiler.enabled", "getboolean", None)
     _process_setting(section, "transaction_tracer.enabled", "getboolean", None)
     _process_setting(
@@ -446,8 +458,21 @@ def _process_configuration(section):
     _process_setting(section, "ml_insights_events.enabled", "getboolean", None)
     _process_setting(section, "distributed_tracing.enabled", "getboolean", None)
     _process_setting(section, "distributed_tracing.exclude_newrelic_header", "getboolean", None)
+    _process_setting(section, "sampling_budgets.enabled", "getboolean", None)
+    _process_setting(section, "sampling_budgets.targets", "get", _map_sampling_budgets)
     _process_setting(section, "span_events.enabled", "getboolean", None)
     _process_setting(section, "span_events.max_samples_stored", "getint", None)
+    _process_setting(section, "span_compression.enabled", "getboolean", None)
+    _process_setting(section, "fork_handling.enabled", "getboolean", None)
+    _process_setting(section, "local_aggregator.enabled", "getboolean", None)
+    _process_setting(section, "local_aggregator.socket_path", "get", None)
+    _process_setting(section, "local_aggregator.timeout", "getfloat", None)
+    _process_setting(section, "harvest_spool.enabled", "getboolean", None)
+    _process_setting(section, "harvest_spool.directory", "get", None)
+    _process_setting(section, "harvest_spool.max_bytes", "getint", None)
+    _process_setting(section, "harvest_spool.segment_bytes", "getint", None)
+    _process_setting(section, "harvest_scheduler.enabled", "getboolean", None)
+    _process_setting(section, "harvest_scheduler.jitter", "getfloat", None)
     _process_setting(section, "span_events.attributes.enabled", "getboolean", None)
     _process_setting(section, "span_events.attributes.exclude", "get", _map_inc_excl_attributes)
     _process_setting(section, "span_events.attributes.include", "get", _map_inc_excl_attributes)
@@ -467,6 +492,11 @@ def _process_configuration(section):
     _process_setting(section, "local_daemon.socket_path", "get", None)
     _process_setting(section, "local_daemon.synchronous_startup", "getboolean", None)
     _process_setting(section, "agent_limits.transaction_traces_nodes", "getint", None)
+    _process_setting(section, "agent_limits.transaction_node_budget", "getint", None)
+    _process_setting(section, "agent_limits.external_url_cache_maximum", "getint", None)
+    _process_setting(section, "agent_limits.intern_pool_maximum", "getint", None)
+    _process_setting(section, "agent_limits.metric_names_maximum", "getint", None)
+    _process_setting(section, "agent_limits.metric_tag_sets_maximum", "getint", None)
     _process_setting(section, "agent_limits.sql_query_length_maximum", "getint", None)
     _process_setting(section, "agent_limits.slow_sql_stack_trace", "getint", None)
     _process_setting(section, "agent_limits.max_sql_connections", "getint", None)
@@ -477,6 +507,7 @@ def _process_configuration(section):
     _process_setting(section, "agent_limits.errors_per_transaction", "getint", None)
     _process_setting(section, "agent_limits.errors_per_harvest", "getint", None)
     _process_setting(section, "agent_limits.slow_transaction_dry_harvests", "getint", None)
+    _process_setting(section, "agent_limits.slow_transaction_names", "getint", None)
     _process_setting(section, "agent_limits.thread_profiler_nodes", "getint", None)
     _process_setting(section, "agent_limits.synthetics_events", "getint", None)
     _process_setting(section, "agent_limits.synthetics_transactions", "getint", None)
@@ -525,6 +556,7 @@ def _process_configuration(section):
     )
     _process_setting(section, "datastore_tracer.instance_reporting.enabled", "getboolean", None)
     _process_setting(section, "datastore_tracer.database_name_reporting.enabled", "getboolean", None)
+    _process_setting(section, "datastore_tracer.pipeline_mode.enabled", "getboolean", None)
     _process_setting(section, "heroku.use_dyno_names", "getboolean", None)
     _process_setting(section, "heroku.dyno_name_prefixes_to_shorten", "get", _map_split_strings)
     _process_setting(section, "serverless_mode.enabled", "getboolean", None)
@@ -547,6 +579,12 @@ def _process_configuration(section):
     _process_setting(section, "infinite_tracing.compression", "getboolean", None)
     _process_setting(section, "infinite_tracing.batching", "getboolean", None)
     _process_setting(section, "infinite_tracing.span_queue_size", "getint", None)
+    _process_setting(section, "infinite_tracing.tail_sampling.enabled", "getboolean", None)
+    _process_setting(section, "infinite_tracing.tail_sampling.hold_time", "getfloat", None)
+    _process_setting(section, "infinite_tracing.tail_sampling.max_spans", "getint", None)
+    _process_setting(section, "infinite_tracing.tail_sampling.duration_threshold", "getfloat", None)
+    _process_setting(section, "infinite_tracing.tail_sampling.transaction_names", "get", _map_split_strings)
+    _process_setting(section, "infinite_tracing.tail_sampling.sample_rate", "getfloat", None)
     _process_setting(section, "code_level_metrics.enabled", "getboolean", None)
 
     _process_setting(section, "application_logging.enabled", "getboolean", None)
@@ -2954,6 +2992,8 @@ def _process_module_builtin_defaults():
     )
     _process_module_definition("redis.client", "newrelic.hooks.datastore_redis", "instrument_redis_client")
 
+    _process_module_definition("redis.cluster", "newrelic.hooks.datastore_redis", "instrument_redis_cluster")
+
     _process_module_definition(
         "redis.commands.cluster", "newrelic.hooks.datastore_redis", "instrument_redis_commands_cluster"
     )
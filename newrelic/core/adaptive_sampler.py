@@ -79,3 +79,181 @@ class AdaptiveSampler(object):
                                        self.sampling_target)
         self.computed_count = 0
         self.sampled_count = 0
+
+
+class _SamplerCounts(object):
+    __slots__ = ("epoch", "computed", "sampled", "registered")
+
+    def __init__(self, epoch):
+        self.epoch = epoch
+        self.computed = 0
+        self.sampled = 0
+        self.registered = False
+
+
+class ThreadLocalSampler(object):
+    """A sampler which does not take a lock when deciding whether to
+    sample. Each thread counts the transactions it computes and samples
+    in the current period, with the counts of all threads being
+    reconciled at the end of each period to derive the sampling
+    probability for the next period. The sampled counts of the other
+    threads are only consulted when a transaction would be sampled, in
+    order to cap the number sampled in a period.
+
+    """
+
+    def __init__(self, sampling_target, sampling_period):
+        self.sampling_target = sampling_target
+        self.period = sampling_period
+        self.last_reset = time.time()
+        self.epoch = 0
+
+        # For the first harvest, collect up to sampling_target number of
+        # "sampled" transactions.
+        self.probability = 1.0
+        self.max_sampled = sampling_target
+
+        self._local = threading.local()
+        self._counts = []
+        self._counts_lock = threading.Lock()
+        self._reconcile_lock = threading.Lock()
+
+    def _thread_counts(self):
+        epoch = self.epoch
+        counts = getattr(self._local, "counts", None)
+
+        if counts is None:
+            counts = self._local.counts = _SamplerCounts(epoch)
+        elif counts.epoch != epoch:
+            counts.epoch = epoch
+            counts.computed = 0
+            counts.sampled = 0
+
+        # Registration happens once for each thread, unless the counts
+        # are dropped for being idle, and must not race with the list of
+        # counts being replaced by reconcile().
+
+        if not counts.registered:
+            with self._counts_lock:
+                counts.registered = True
+                self._counts.append(counts)
+
+        return counts
+
+    def sampled_count(self):
+        epoch = self.epoch
+        return sum(counts.sampled for counts in list(self._counts) if counts.epoch == epoch)
+
+    def computed_count(self):
+        epoch = self.epoch
+        return sum(counts.computed for counts in list(self._counts) if counts.epoch == epoch)
+
+    def reconcile(self):
+        # Only one thread need reconcile the counts at the end of a period.
+        # Any other thread arriving at the same time continues to sample
+        # using the probability for the period just ended.
+
+        if not self._reconcile_lock.acquire(False):
+            return
+
+        try:
+            now = time.time()
+            cycles = (now - self.last_reset) // self.period
+            if not cycles:
+                return
+
+            epoch = self.epoch
+
+            with self._counts_lock:
+                active = [counts for counts in self._counts if counts.epoch == epoch]
+
+                for counts in self._counts:
+                    if counts.epoch != epoch:
+                        counts.registered = False
+
+                self._counts = active
+
+            # If more than one cycle has passed nothing was computed in
+            # the period immediately prior to this one.
+            computed = sum(counts.computed for counts in active) if cycles == 1 else 0
+
+            # For subsequent harvests, collect a max of twice the
+            # sampling_target value.
+            self.probability = float(self.sampling_target) / max(computed, self.sampling_target, 1)
+            self.max_sampled = 2 * self.sampling_target
+            self.last_reset = now
+            self.epoch = epoch + 1
+        finally:
+            self._reconcile_lock.release()
+
+    def compute_sampled(self):
+        if time.time() - self.last_reset >= self.period:
+            self.reconcile()
+
+        counts = self._thread_counts()
+        counts.computed += 1
+
+        if random.random() >= self.probability:
+            return False
+
+        if self.sampled_count() >= self.max_sampled:
+            return False
+
+        counts.sampled += 1
+        return True
+
+
+class SamplingBudgets(object):
+    """Applies separate sampling targets to transactions by name, so that
+    high volume transactions cannot use up the samples available for
+    the remainder. A budget applies to the transaction name it is given
+    for, or where the name ends in "*" to all transaction names starting
+    with the remainder. The longest matching name is used. Transactions
+    which do not match any budget are sampled by the default sampler.
+
+    """
+
+    maximum_names = 1000
+
+    def __init__(self, targets, default_sampler, sampling_period):
+        self.default_sampler = default_sampler
+
+        self._exact = {}
+        self._prefixes = []
+
+        for name, target in targets.items():
+            sampler = ThreadLocalSampler(target, sampling_period)
+            if name.endswith("*"):
+                self._prefixes.append((name[:-1], sampler))
+            else:
+                self._exact[name] = sampler
+
+        self._prefixes.sort(key=lambda item: len(item[0]), reverse=True)
+        self._samplers = {}
+
+    def sampler(self, name):
+        try:
+            return self._samplers[name]
+        except KeyError:
+            pass
+
+        sampler = self._exact.get(name)
+
+        if sampler is None:
+            for prefix, candidate in self._prefixes:
+                if name.startswith(prefix):
+                    sampler = candidate
+                    break
+            else:
+                sampler = self.default_sampler
+
+        if len(self._samplers) < self.maximum_names:
+            self._samplers[name] = sampler
+
+        return sampler
+
+    def compute_sampled(self, name=None):
+        if name is None:
+            return self.default_sampler.compute_sampled()
+
+        return self.sampler(name).compute_sampled()
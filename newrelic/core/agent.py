@@ -34,10 +34,14 @@ import newrelic.core.application
 import newrelic.core.config
 import newrelic.packages.six as six
 from newrelic.common.log_file import initialize_logging
+from newrelic.core.harvest_scheduler import HarvestScheduler
+from newrelic.core.trace_cache import trace_cache
 from newrelic.core.thread_utilization import thread_utilization_data_source
+from newrelic.samplers.cgroup_usage import cgroup_usage_data_source
 from newrelic.samplers.cpu_usage import cpu_usage_data_source
 from newrelic.samplers.gc_data import garbage_collector_data_source
 from newrelic.samplers.memory_usage import memory_usage_data_source
+from newrelic.samplers.thread_cpu_usage import thread_cpu_usage_data_source
 
 _logger = logging.getLogger(__name__)
 
@@ -187,6 +191,8 @@ class Agent(object):
                 instance.register_data_source(memory_usage_data_source)
                 instance.register_data_source(thread_utilization_data_source)
                 instance.register_data_source(garbage_collector_data_source)
+                instance.register_data_source(cgroup_usage_data_source)
+                instance.register_data_source(thread_cpu_usage_data_source)
 
                 Agent._instance = instance
 
@@ -248,6 +254,14 @@ class Agent(object):
 
                 uwsgi.atexit = uwsgi_atexit_callback
 
+            # Register a handler to reset the agent in a child process
+            # created by forking a process in which the agent was already
+            # running, as occurs with pre-fork web servers. This is only
+            # possible on Python 3.7 and later.
+
+            if hasattr(os, "register_at_fork"):
+                os.register_at_fork(after_in_child=self._after_fork_in_child)
+
         self._data_sources = {}
 
     def dump(self, file):
@@ -572,6 +586,13 @@ class Agent(object):
 
         application.record_log_event(message, level, timestamp, priority=priority)
 
+    def should_sample_log_event(self, app_name, priority):
+        application = self._applications.get(app_name, None)
+        if application is None:
+            return True
+
+        return application.should_sample_log_event(priority)
+
     def record_transaction(self, app_name, data):
         """Processes the raw transaction data, generating and recording
         appropriate metrics against the named application. If there has
@@ -597,9 +618,9 @@ class Agent(object):
 
         return application.normalize_name(name, rule_type)
 
-    def compute_sampled(self, app_name):
+    def compute_sampled(self, app_name, transaction_name=None):
         application = self._applications.get(app_name, None)
-        return application.compute_sampled()
+        return application.compute_sampled(transaction_name)
 
     def _harvest_shutdown_is_set(self):
         try:
@@ -660,17 +681,75 @@ class Agent(object):
             return float("inf")
         return time.time()
 
+    def _harvest_application(self, application, flexible, lag, skipped):
+        call_metric = "flexible" if flexible else "default"
+
+        _logger.debug("Commencing harvest[%s] of data for %s.", call_metric, application.name)
+
+        start = time.time()
+
+        if flexible:
+            self._flexible_harvest_count += 1
+            self._last_flexible_harvest = start
+        else:
+            self._default_harvest_count += 1
+            self._last_default_harvest = start
+
+        application.record_custom_metric("Supportability/Python/Harvest/Lag/%s" % call_metric, lag)
+
+        if skipped:
+            application.record_custom_metric(
+                "Supportability/Python/Harvest/Skipped/%s" % call_metric, {"count": skipped}
+            )
+
+        try:
+            application.harvest(shutdown=False, flexible=flexible)
+        except Exception:
+            _logger.exception("Failed to harvest data for %s." % application.name)
+
+        duration = time.time() - start
+
+        if flexible:
+            self._flexible_harvest_duration = duration
+        else:
+            self._default_harvest_duration = duration
+
+        _logger.debug("Completed harvest[%s] of data for %s in %.2f seconds.", call_metric, application.name, duration)
+
+    def _run_harvest_scheduler(self):
+        def flexible_period():
+            return self.global_settings().event_harvest_config.report_period_ms / 1000.0
+
+        scheduler = HarvestScheduler(
+            lambda: list(six.itervalues(self._applications)),
+            self._harvest_shutdown,
+            flexible_period,
+            self._config.harvest_scheduler.jitter,
+        )
+
+        scheduler.run(self._harvest_application)
+
+        # The final harvests when the agent is shutdown are run for all
+        # applications at once.
+
+        self._harvest_flexible(shutdown=True)
+        self._harvest_default(shutdown=True)
+
     def _harvest_loop(self):
         _logger.debug("Entering harvest loop.")
 
         settings = newrelic.core.config.global_settings()
         event_harvest_config = settings.event_harvest_config
 
-        self._scheduler.enter(event_harvest_config.report_period_ms / 1000.0, 1, self._harvest_flexible, ())
-        self._scheduler.enter(60.0, 2, self._harvest_default, ())
+        if not self._config.harvest_scheduler.enabled:
+            self._scheduler.enter(event_harvest_config.report_period_ms / 1000.0, 1, self._harvest_flexible, ())
+            self._scheduler.enter(60.0, 2, self._harvest_default, ())
 
         try:
-            self._scheduler.run()
+            if self._config.harvest_scheduler.enabled:
+                self._run_harvest_scheduler()
+            else:
+                self._scheduler.run()
         except Exception:
             # An unexpected error, possibly some sort of internal agent
             # implementation issue or more likely due to modules being
@@ -726,6 +805,42 @@ class Agent(object):
 
             self._process_id = os.getpid()
 
+    def _after_fork_in_child(self):
+        """Resets the state of the agent in a child process after a fork.
+        Any locks held by other threads at the time of the fork would
+        never be released, and the harvest thread does not exist in the
+        child process, so these are replaced. Applications with an active
+        session in the parent process then start reconnecting, reusing
+        the details gathered for the parent process.
+
+        """
+
+        if not self._config.fork_handling.enabled:
+            return
+
+        Agent._instance_lock = threading.Lock()
+
+        self._process_id = os.getpid()
+        self._lock = threading.Lock()
+
+        self._harvest_thread = threading.Thread(target=self._harvest_loop, name="NR-Harvest-Thread")
+        self._harvest_thread.daemon = True
+        self._harvest_shutdown = threading.Event()
+
+        self._default_harvest_count = 0
+        self._flexible_harvest_count = 0
+        self._last_default_harvest = 0.0
+        self._last_flexible_harvest = 0.0
+        self._default_harvest_duration = 0.0
+        self._flexible_harvest_duration = 0.0
+        self._scheduler = sched.scheduler(self._harvest_timer, self._harvest_shutdown.wait)
+
+        trace_cache().reset_after_fork()
+
+        for application in list(self._applications.values()):
+            if application.reset_after_fork():
+                application.activate_session(self.activate_agent, timeout=0.0)
+
     def _atexit_shutdown(self):
         """Triggers agent shutdown but flags first that this is being
         done because process is being shutdown.
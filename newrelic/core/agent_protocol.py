@@ -12,6 +12,7 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import copy
 import logging
 import os
 
@@ -37,8 +38,10 @@ from newrelic.core.config import (
     finalize_application_settings,
     global_settings_dump,
 )
+from newrelic.core.harvest_spool import harvest_spool
 from newrelic.core.internal_metrics import internal_count_metric
 from newrelic.core.otlp_utils import OTLP_CONTENT_TYPE, otlp_encode
+from newrelic.core.stats_engine import metric_data_json
 from newrelic.network.exceptions import (
     DiscardDataForRequest,
     ForceAgentDisconnect,
@@ -49,6 +52,115 @@ from newrelic.network.exceptions import (
 
 _logger = logging.getLogger(__name__)
 
+# The maximum number of spooled payloads sent on each harvest.
+
+SPOOL_DRAIN_LIMIT = 20
+
+
+# The host details gathered for the connect payload. These are kept when
+# fork handling is enabled, so that worker processes forked from a parent
+# process which has already connected do not need to gather them again,
+# which can include requests to cloud provider metadata endpoints.
+
+_host_utilization_cache = {}
+
+_HOST_UTILIZATION_SETTINGS = (
+    "heroku.use_dyno_names",
+    "heroku.dyno_name_prefixes_to_shorten",
+    "utilization.logical_processors",
+    "utilization.total_ram_mib",
+    "utilization.billing_hostname",
+    "utilization.detect_aws",
+    "utilization.detect_pcf",
+    "utilization.detect_gcp",
+    "utilization.detect_azure",
+    "utilization.detect_docker",
+    "utilization.detect_kubernetes",
+)
+
+
+def _host_utilization(settings):
+    """Returns the hostname and utilization details for the connect
+    payload, where settings is the flattened settings dictionary.
+
+    """
+
+    if settings["fork_handling.enabled"]:
+        key = tuple(repr(settings[name]) for name in _HOST_UTILIZATION_SETTINGS)
+        result = _host_utilization_cache.get(key)
+        if result is None:
+            result = _host_utilization_cache[key] = _gather_host_utilization(settings)
+        return result[0], copy.deepcopy(result[1])
+
+    return _gather_host_utilization(settings)
+
+
+def _gather_host_utilization(settings):
+    hostname = system_info.gethostname(
+        settings["heroku.use_dyno_names"],
+        settings["heroku.dyno_name_prefixes_to_shorten"],
+    )
+
+    ip_address = system_info.getips()
+
+    utilization_settings = {}
+    # metadata_version corresponds to the utilization spec being used.
+    utilization_settings["metadata_version"] = 5
+    utilization_settings["logical_processors"] = system_info.logical_processor_count()
+    utilization_settings["total_ram_mib"] = system_info.total_physical_memory()
+    utilization_settings["hostname"] = hostname
+    if ip_address:
+        utilization_settings["ip_address"] = ip_address
+
+    boot_id = system_info.BootIdUtilization.detect()
+    if boot_id:
+        utilization_settings["boot_id"] = boot_id
+
+    utilization_conf = {}
+    logical_processor_conf = settings["utilization.logical_processors"]
+    total_ram_conf = settings["utilization.total_ram_mib"]
+    hostname_conf = settings["utilization.billing_hostname"]
+    if logical_processor_conf:
+        utilization_conf["logical_processors"] = logical_processor_conf
+    if total_ram_conf:
+        utilization_conf["total_ram_mib"] = total_ram_conf
+    if hostname_conf:
+        utilization_conf["hostname"] = hostname_conf
+    if utilization_conf:
+        utilization_settings["config"] = utilization_conf
+
+    vendors = []
+    if settings["utilization.detect_aws"]:
+        vendors.append(AWSUtilization)
+    if settings["utilization.detect_pcf"]:
+        vendors.append(PCFUtilization)
+    if settings["utilization.detect_gcp"]:
+        vendors.append(GCPUtilization)
+    if settings["utilization.detect_azure"]:
+        vendors.append(AzureUtilization)
+
+    utilization_vendor_settings = {}
+    for vendor in vendors:
+        metadata = vendor.detect()
+        if metadata:
+            utilization_vendor_settings[vendor.VENDOR_NAME] = metadata
+            break
+
+    if settings["utilization.detect_docker"]:
+        docker = DockerUtilization.detect()
+        if docker:
+            utilization_vendor_settings["docker"] = docker
+
+    if settings["utilization.detect_kubernetes"]:
+        kubernetes = KubernetesUtilization.detect()
+        if kubernetes:
+            utilization_vendor_settings["kubernetes"] = kubernetes
+
+    if utilization_vendor_settings:
+        utilization_settings["vendors"] = utilization_vendor_settings
+
+    return hostname, utilization_settings
+
 
 class AgentProtocol(object):
     VERSION = 17
@@ -149,6 +261,23 @@ class AgentProtocol(object):
         "machine_learning.inference_events_value.enabled",
     )
 
+    # The endpoints for which payloads are written to the harvest spool,
+    # if enabled, where they can't be sent due to a recoverable error.
+
+    SPOOL_METHODS = frozenset(
+        (
+            "analytic_event_data",
+            "custom_event_data",
+            "error_data",
+            "error_event_data",
+            "log_event_data",
+            "metric_data",
+            "span_event_data",
+            "sql_trace_data",
+            "transaction_sample_data",
+        )
+    )
+
     LOGGER_FUNC_MAPPING = {
         "ERROR": _logger.error,
         "WARN": _logger.warning,
@@ -205,6 +334,8 @@ class AgentProtocol(object):
         self._proxy_port = settings.proxy_port
         self._proxy_user = settings.proxy_user
 
+        self._spool = harvest_spool(settings)
+
         # Do not access configuration anywhere inside the class
         self.configuration = settings
 
@@ -226,6 +357,34 @@ class AgentProtocol(object):
     ):
         params, headers, payload = self._to_http(method, payload)
 
+        spool = self._spool if method in self.SPOOL_METHODS else None
+
+        # While the data collector can't be reached, payloads are written
+        # directly to the spool rather than attempting to send them.
+
+        if spool is not None and spool.in_backoff():
+            self._spool_payload(spool, method, payload)
+            return
+
+        try:
+            result = self._send_request(method, params, headers, payload, path)
+
+        except RetryDataForRequest:
+            if spool is None or not self._spool_payload(spool, method, payload):
+                raise
+
+            spool.failed()
+
+        else:
+            # The data collector can be reached again, so the backoff
+            # starts over from its initial period on the next failure.
+
+            if spool is not None:
+                spool.succeeded()
+
+            return result
+
+    def _send_request(self, method, params, headers, payload, path="/agent_listener/invoke_raw_method"):
         try:
             response = self.client.send_request(path=path, params=params, headers=headers, payload=payload)
         except NetworkInterfaceException:
@@ -261,6 +420,43 @@ class AgentProtocol(object):
         if status == 200:
             return self.decode_response(data)
 
+    def _spool_payload(self, spool, method, payload):
+        spooled = spool.append(method, self._run_token, payload)
+
+        if spooled:
+            internal_count_metric("Supportability/Python/HarvestSpool/Spooled/%s" % method, 1)
+        else:
+            internal_count_metric("Supportability/Python/HarvestSpool/Dropped/%s" % method, 1)
+
+        return spooled
+
+    def _send_spooled(self, method, run_id, payload):
+        # The run ID of the session the payload was created for must be
+        # replaced with that of the current session.
+
+        if run_id != self._run_token:
+            prefix = json_encode([run_id, 0])[:-2].encode("utf-8")
+
+            if payload.startswith(prefix):
+                payload = json_encode([self._run_token, 0])[:-2].encode("utf-8") + payload[len(prefix) :]
+
+        params, headers, _ = self._to_http(method)
+
+        self._send_request(method, params, headers, payload)
+
+        internal_count_metric("Supportability/Python/HarvestSpool/Sent/%s" % method, 1)
+
+    def drain_spool(self, limit=SPOOL_DRAIN_LIMIT):
+        """Sends payloads written to the harvest spool when they could not
+        be sent previously. Returns the number of payloads sent.
+
+        """
+
+        if self._spool is None:
+            return 0
+
+        return self._spool.drain(self._send_spooled, limit)
+
     def decode_response(self, response):
         return json_decode(response.decode("utf-8"))["return_value"]
 
@@ -269,19 +465,21 @@ class AgentProtocol(object):
         params["method"] = method
         if self._run_token:
             params["run_id"] = self._run_token
-        return params, self._headers, json_encode(payload).encode("utf-8")
+
+        if method == "metric_data" and len(payload) == 4:
+            agent_run_id, start_time, end_time, metric_data = payload
+            data = "[%s,%s]" % (json_encode([agent_run_id, start_time, end_time])[1:-1], metric_data_json(metric_data))
+        else:
+            data = json_encode(payload)
+
+        return params, self._headers, data.encode("utf-8")
 
     @staticmethod
     def _connect_payload(app_name, linked_applications, environment, settings):
         settings = global_settings_dump(settings)
         app_names = [app_name] + linked_applications
 
-        hostname = system_info.gethostname(
-            settings["heroku.use_dyno_names"],
-            settings["heroku.dyno_name_prefixes_to_shorten"],
-        )
-
-        ip_address = system_info.getips()
+        hostname, utilization_settings = _host_utilization(settings)
 
         connect_settings = {}
         connect_settings["browser_monitoring.loader"] = settings["browser_monitoring.loader"]
@@ -292,62 +490,6 @@ class AgentProtocol(object):
         security_settings["transaction_tracer"] = {}
         security_settings["transaction_tracer"]["record_sql"] = settings["transaction_tracer.record_sql"]
 
-        utilization_settings = {}
-        # metadata_version corresponds to the utilization spec being used.
-        utilization_settings["metadata_version"] = 5
-        utilization_settings["logical_processors"] = system_info.logical_processor_count()
-        utilization_settings["total_ram_mib"] = system_info.total_physical_memory()
-        utilization_settings["hostname"] = hostname
-        if ip_address:
-            utilization_settings["ip_address"] = ip_address
-
-        boot_id = system_info.BootIdUtilization.detect()
-        if boot_id:
-            utilization_settings["boot_id"] = boot_id
-
-        utilization_conf = {}
-        logical_processor_conf = settings["utilization.logical_processors"]
-        total_ram_conf = settings["utilization.total_ram_mib"]
-        hostname_conf = settings["utilization.billing_hostname"]
-        if logical_processor_conf:
-            utilization_conf["logical_processors"] = logical_processor_conf
-        if total_ram_conf:
-            utilization_conf["total_ram_mib"] = total_ram_conf
-        if hostname_conf:
-            utilization_conf["hostname"] = hostname_conf
-        if utilization_conf:
-            utilization_settings["config"] = utilization_conf
-
-        vendors = []
-        if settings["utilization.detect_aws"]:
-            vendors.append(AWSUtilization)
-        if settings["utilization.detect_pcf"]:
-            vendors.append(PCFUtilization)
-        if settings["utilization.detect_gcp"]:
-            vendors.append(GCPUtilization)
-        if settings["utilization.detect_azure"]:
-            vendors.append(AzureUtilization)
-
-        utilization_vendor_settings = {}
-        for vendor in vendors:
-            metadata = vendor.detect()
-            if metadata:
-                utilization_vendor_settings[vendor.VENDOR_NAME] = metadata
-                break
-
-        if settings["utilization.detect_docker"]:
-            docker = DockerUtilization.detect()
-            if docker:
-                utilization_vendor_settings["docker"] = docker
-
-        if settings["utilization.detect_kubernetes"]:
-            kubernetes = KubernetesUtilization.detect()
-            if kubernetes:
-                utilization_vendor_settings["kubernetes"] = kubernetes
-
-        if utilization_vendor_settings:
-            utilization_settings["vendors"] = utilization_vendor_settings
-
         display_host = settings["process_host.display_name"]
         if display_host is None:
             display_host = hostname
@@ -483,6 +625,8 @@ class AgentProtocol(object):
 
 
 class ServerlessModeProtocol(AgentProtocol):
+    SPOOL_METHODS = frozenset()
+
     def __init__(self, settings, host=None, client_cls=ServerlessModeClient):
         super(ServerlessModeProtocol, self).__init__(settings, host=host, client_cls=client_cls)
         self._metadata = {
@@ -528,6 +672,8 @@ class ServerlessModeProtocol(AgentProtocol):
 
 
 class OtlpProtocol(AgentProtocol):
+    SPOOL_METHODS = frozenset()
+
     def __init__(self, settings, host=None, client_cls=ApplicationModeClient):
         if settings.audit_log_file:
             audit_log_fp = open(settings.audit_log_file, "a")
@@ -571,6 +717,7 @@ class OtlpProtocol(AgentProtocol):
         # Content-Type should be protobuf, but falls back to JSON if protobuf is not installed.
         self._headers["Content-Type"] = OTLP_CONTENT_TYPE
         self._run_token = settings.agent_run_id
+        self._spool = None
 
         # Logging
         self._proxy_host = settings.proxy_host
@@ -0,0 +1,167 @@
+# Copyright 2010 New Relic, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import newrelic.core.trace_node
+
+from newrelic.core.node_mixin import GenericNodeMixin
+
+
+class AggregateNode(GenericNodeMixin):
+
+    """Stands in for all the nodes of the same name which were folded
+    together once a transaction exceeded its node budget. Only summary
+    statistics are kept for the folded nodes, and the metrics for them
+    have already been recorded against the transaction at the time they
+    were folded.
+
+    """
+
+    children = ()
+
+    def __init__(self, name, guid):
+        self.name = name
+        self.guid = guid
+        self.count = 0
+        self.duration = 0.0
+        self.exclusive = 0.0
+        self.min_duration = 0.0
+        self.max_duration = 0.0
+        self.start_time = 0.0
+        self.end_time = 0.0
+        self.agent_attributes = {}
+        self.user_attributes = {}
+
+    def merge_node(self, node):
+        if self.count:
+            self.min_duration = min(self.min_duration, node.duration)
+            self.max_duration = max(self.max_duration, node.duration)
+            self.start_time = min(self.start_time, node.start_time)
+            self.end_time = max(self.end_time, node.end_time)
+        else:
+            self.min_duration = node.duration
+            self.max_duration = node.duration
+            self.start_time = node.start_time
+            self.end_time = node.end_time
+
+        self.count += 1
+        self.duration += node.duration
+        self.exclusive += node.exclusive
+
+    def time_metrics(self, stats, root, parent):
+        return iter(())
+
+    def trace_node(self, stats, root, connections):
+
+        name = root.string_table.cache(self.name)
+
+        start_time = newrelic.core.trace_node.node_start_time(root, self)
+        end_time = newrelic.core.trace_node.node_end_time(root, self)
+
+        root.trace_node_count += 1
+
+        params = self.get_trace_segment_params(
+                root.settings, params={
+                    'call_count': self.count,
+                    'total_duration_millis': 1000.0 * self.duration,
+                    'min_duration_millis': 1000.0 * self.min_duration,
+                    'max_duration_millis': 1000.0 * self.max_duration,
+                })
+
+        return newrelic.core.trace_node.TraceNode(start_time=start_time,
+                end_time=end_time, name=name, params=params, children=[],
+                label=None)
+
+    def span_event(self, *args, **kwargs):
+        attrs = super(AggregateNode, self).span_event(*args, **kwargs)
+        i_attrs = attrs[0]
+
+        i_attrs['nr.aggregate.count'] = self.count
+        i_attrs['nr.aggregate.minDuration'] = self.min_duration
+        i_attrs['nr.aggregate.maxDuration'] = self.max_duration
+
+        return attrs
+
+
+class CompositeNode(object):
+
+    """Stands in for consecutive sibling exit nodes with the same name and
+    destination which were compressed into a single node. The first of
+    the nodes is kept to report the span and trace segment for them all,
+    with the duration being the sum of the durations of the nodes. The
+    metrics for the nodes have already been recorded against the
+    transaction at the time they were compressed.
+
+    """
+
+    children = ()
+
+    def __init__(self, node, key):
+        self.node = node
+        self.key = key
+        self.count = 1
+        self.duration = node.duration
+        self.exclusive = node.exclusive
+        self.min_duration = node.duration
+        self.max_duration = node.duration
+        self.end_time = node.end_time
+
+    @property
+    def name(self):
+        return self.node.name
+
+    @property
+    def guid(self):
+        return self.node.guid
+
+    @property
+    def start_time(self):
+        return self.node.start_time
+
+    def merge_node(self, node):
+        self.count += 1
+        self.duration += node.duration
+        self.exclusive += node.exclusive
+        self.min_duration = min(self.min_duration, node.duration)
+        self.max_duration = max(self.max_duration, node.duration)
+        self.end_time = max(self.end_time, node.end_time)
+
+    def time_metrics(self, stats, root, parent):
+        return iter(())
+
+    def trace_node(self, stats, root, connections):
+        trace_node = self.node.trace_node(stats, root, connections)
+
+        trace_node.params['call_count'] = self.count
+        trace_node.params['total_duration_millis'] = 1000.0 * self.duration
+        trace_node.params['min_duration_millis'] = 1000.0 * self.min_duration
+        trace_node.params['max_duration_millis'] = 1000.0 * self.max_duration
+
+        return trace_node._replace(
+                end_time=newrelic.core.trace_node.node_end_time(root, self))
+
+    def span_event(self, *args, **kwargs):
+        attrs = self.node.span_event(*args, **kwargs)
+        i_attrs = attrs[0]
+
+        i_attrs['duration'] = self.duration
+        i_attrs['nr.aggregate.count'] = self.count
+        i_attrs['nr.aggregate.minDuration'] = self.min_duration
+        i_attrs['nr.aggregate.maxDuration'] = self.max_duration
+
+        return attrs
+
+    def span_events(self, settings, base_attrs=None, parent_guid=None,
+            attr_class=dict):
+        yield self.span_event(settings, base_attrs=base_attrs,
+                parent_guid=parent_guid, attr_class=attr_class)
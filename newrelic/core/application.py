@@ -20,15 +20,20 @@ from __future__ import print_function
 
 import logging
 import os
+import random
 import sys
 import threading
 import time
 import traceback
 import warnings
-from functools import partial
 
 from newrelic.common.object_names import callable_name
-from newrelic.core.adaptive_sampler import AdaptiveSampler
+from newrelic.core import local_aggregator
+from newrelic.core.adaptive_sampler import (
+    AdaptiveSampler,
+    SamplingBudgets,
+    ThreadLocalSampler,
+)
 from newrelic.core.config import global_settings
 from newrelic.core.custom_event import create_custom_event
 from newrelic.core.data_collector import create_session
@@ -43,6 +48,7 @@ from newrelic.core.internal_metrics import (
 from newrelic.core.profile_sessions import profile_session_manager
 from newrelic.core.rules_engine import RulesEngine, SegmentCollapseEngine
 from newrelic.core.stats_engine import CustomMetrics, StatsEngine
+from newrelic.core.string_table import intern_pool
 from newrelic.network.exceptions import (
     DiscardDataForRequest,
     ForceAgentDisconnect,
@@ -55,6 +61,8 @@ from newrelic.samplers.data_sampler import DataSampler
 
 _logger = logging.getLogger(__name__)
 
+METRIC_NAMES_MAXIMUM = 100000
+
 
 class Application(object):
 
@@ -75,15 +83,27 @@ class Application(object):
 
         self._process_id = None
 
+        # The environment reported when the application last connected,
+        # which is reused when reconnecting in a forked child process.
+
+        self._environment = None
+        self._inherited_environment = None
+
         self._period_start = 0.0
 
         self._active_session = None
         self._harvest_enabled = False
 
+        # Whether activation of a session has been requested, which may
+        # still be in progress if there is no active session yet.
+
+        self._activation_requested = False
+
         self._transaction_count = 0
         self._last_transaction = 0.0
 
         self.adaptive_sampler = None
+        self.sampling_budgets = None
 
         self._global_events_account = 0
 
@@ -115,6 +135,11 @@ class Application(object):
         # avoid a race condition in setting it later. Otherwise we have
         # to use unnecessary locking to protect access.
 
+        # The metric names after applying the metric rename rules, along
+        # with the rules engine they were obtained from.
+
+        self._metric_names = (None, {})
+
         self._rules_engine = {
             "url": RulesEngine([]),
             "transaction": RulesEngine([]),
@@ -150,10 +175,13 @@ class Application(object):
     def active(self):
         return self.configuration is not None
 
-    def compute_sampled(self):
+    def compute_sampled(self, transaction_name=None):
         if self.adaptive_sampler is None:
             return False
 
+        if self.sampling_budgets is not None:
+            return self.sampling_budgets.compute_sampled(transaction_name)
+
         return self.adaptive_sampler.compute_sampled()
 
     def dump(self, file):
@@ -203,6 +231,7 @@ class Application(object):
             return
 
         self._process_id = os.getpid()
+        self._activation_requested = True
 
         self._connected_event.clear()
         self._deadlock_event.clear()
@@ -362,9 +391,15 @@ class Application(object):
 
             with InternalTraceContext(internal_metrics):
                 try:
-                    active_session = create_session(
-                        None, self._app_name, self.linked_applications, environment_settings()
-                    )
+                    environment = self._inherited_environment
+                    if environment is None:
+                        environment = environment_settings()
+
+                    active_session = create_session(None, self._app_name, self.linked_applications, environment)
+
+                    if active_session:
+                        self._environment = environment
+                        self._inherited_environment = None
                 except ForceAgentDisconnect:
                     # Any disconnect exception means we should stop trying to connect
                     _logger.error(
@@ -505,6 +540,17 @@ class Application(object):
                 sampling_target_period = configuration.sampling_target_period_in_seconds
             self.adaptive_sampler = AdaptiveSampler(configuration.sampling_target, sampling_target_period)
 
+            intern_pool().maximum = configuration.agent_limits.intern_pool_maximum
+
+            if configuration.sampling_budgets.enabled:
+                self.sampling_budgets = SamplingBudgets(
+                    configuration.sampling_budgets.targets,
+                    ThreadLocalSampler(configuration.sampling_target, sampling_target_period),
+                    sampling_target_period,
+                )
+            else:
+                self.sampling_budgets = None
+
         active_session.connect_span_stream(self._stats_engine.span_stream, self.record_custom_metric)
 
         with self._stats_custom_lock:
@@ -615,6 +661,49 @@ class Application(object):
         except:
             pass
 
+    def reset_after_fork(self):
+        """Resets the state of the application in a child process after a
+        fork. The session of the parent process is discarded without
+        being shutdown, as the parent process continues to use it, as is
+        any data recorded in the parent process but not yet reported.
+        Returns whether the application had an active session, or was
+        still connecting, in the parent process, in which case the
+        caller should activate a new session.
+
+        """
+
+        active = self._active_session is not None or self._activation_requested
+
+        self._active_session = None
+        self._harvest_enabled = False
+        self._process_id = None
+
+        # Reuse the environment of the parent process when reconnecting,
+        # as gathering it is one of the more costly parts of connecting.
+
+        self._inherited_environment = self._environment if active else None
+
+        self._transaction_count = 0
+        self._last_transaction = 0.0
+        self._global_events_account = 0
+        self._harvest_count = 0
+        self._discard_count = 0
+
+        self._connected_event = threading.Event()
+        self._deadlock_event = threading.Event()
+
+        self._stats_lock = threading.RLock()
+        self._stats_engine = StatsEngine()
+
+        self._stats_custom_lock = threading.RLock()
+        self._stats_custom_engine = StatsEngine()
+
+        self._agent_commands_lock = threading.Lock()
+        self._data_samplers_lock = threading.Lock()
+        self._data_samplers_started = False
+
+        return active
+
     def validate_process(self):
         """Logs a warning message if called in a process different to
         where the application was registered. Only logs a message the
@@ -657,6 +746,34 @@ class Application(object):
 
             self._process_id = 0
 
+    def _metric_normalizer(self):
+        """Returns a function for applying the metric rename rules to a
+        metric name, or None if there are no rules. The result for each
+        name is cached until the rules change, as the same metric names
+        are reported from one harvest to the next.
+
+        """
+
+        rules_engine = self._rules_engine["metric"]
+
+        if not rules_engine.rules:
+            return None
+
+        if self._metric_names[0] is not rules_engine:
+            self._metric_names = (rules_engine, {})
+
+        names = self._metric_names[1]
+
+        def normalizer(name):
+            result = names.get(name)
+            if result is None:
+                if len(names) >= METRIC_NAMES_MAXIMUM:
+                    names.clear()
+                result = names[name] = self.normalize_name(name, "metric")
+            return result
+
+        return normalizer
+
     def normalize_name(self, name, rule_type):
         """Applies the agent normalization rules of the the specified
         rule type to the supplied name.
@@ -939,15 +1056,49 @@ class Application(object):
                 self._global_events_account += 1
                 self._stats_engine.record_ml_event(event)
 
+    def should_sample_log_event(self, priority):
+        """Returns whether a log event of the given priority could be
+        retained in the harvest reservoir. This is checked without the
+        lock, so it is only used to avoid formatting the messages of log
+        events which would be discarded.
+
+        """
+
+        if not self._active_session:
+            return True
+
+        try:
+            return self._stats_engine.log_events.should_sample(priority)
+        except Exception:
+            return True
+
     def record_log_event(self, message, level=None, timestamp=None, priority=None):
         if not self._active_session:
             return
 
-        if message:
-            with self._stats_custom_lock:
-                event = self._stats_engine.record_log_event(message, level, timestamp, priority=priority)
-                if event:
-                    self._global_events_account += 1
+        if not message:
+            return
+
+        # A message passed as a callable is only formatted if the event
+        # could be retained, and is formatted before the lock is taken as
+        # doing so calls into user code.
+
+        if callable(message):
+            if priority is None:
+                # Base priority for log events outside transactions is below those inside transactions
+                priority = random.random() - 1  # nosec
+
+            if not self.should_sample_log_event(priority):
+                with self._stats_custom_lock:
+                    self._stats_engine.discard_log_event()
+                return
+
+            message = message()
+
+        with self._stats_custom_lock:
+            event = self._stats_engine.record_log_event(message, level, timestamp, priority=priority)
+            if event:
+                self._global_events_account += 1
 
     def record_transaction(self, data):
         """Record a single transaction against this application."""
@@ -993,6 +1144,7 @@ class Application(object):
 
                     stats = self._stats_engine.create_workarea()
                     stats.record_transaction(data)
+                    stats.encode_slow_transaction(self._stats_engine)
 
                 except Exception:
                     _logger.exception(
@@ -1138,6 +1290,163 @@ class Application(object):
 
         return {command_id: {}}
 
+    def merge_local_harvest_data(self, data):
+        """Merges the harvest data received by a local aggregator from
+        another process reporting to this application. Returns whether
+        the data was merged, which will not be the case where there is no
+        active session.
+
+        """
+
+        if not self._active_session:
+            return False
+
+        with self._stats_lock:
+            self._stats_engine.merge_local_harvest_data(data)
+
+        return True
+
+    def _merge_data_sampler_metrics(self, stats):
+        for data_sampler in self._data_samplers:
+            try:
+                for sample in data_sampler.metrics():
+                    try:
+                        name, value = sample
+                        stats.record_custom_metric(name, value)
+                    except Exception:
+                        _logger.exception(
+                            "The merging of custom "
+                            "metric sample %r from data "
+                            "source %r has failed. Validate "
+                            "the format of the sample. If "
+                            "this issue persists then please "
+                            "report this problem to the data "
+                            "source provider or New Relic "
+                            "support for further "
+                            "investigation.",
+                            sample,
+                            data_sampler.name,
+                        )
+                        break
+
+            except Exception:
+                _logger.exception(
+                    "The merging of custom metric "
+                    "samples from data source %r has failed. "
+                    "Validate that the data source is "
+                    "producing samples correctly. If this "
+                    "issue persists then please report this "
+                    "problem to the data source provider or "
+                    "New Relic support for further "
+                    "investigation.",
+                    data_sampler.name,
+                )
+
+    def _local_aggregator_harvest(self, shutdown=False, flexible=False):
+        """Performs a harvest where the aggregated data for the current
+        reporting period is passed to the local aggregator process, which
+        reports it to the data collector along with that of the other
+        processes for the application. Slow SQL and transaction traces
+        depend on database connections and state local to this process
+        and are still sent directly to the data collector.
+
+        """
+
+        internal_metrics = CustomMetrics()
+
+        call_metric = "flexible" if flexible else "default"
+
+        with InternalTraceContext(internal_metrics):
+            with InternalTrace("Supportability/Python/Harvest/Calls/" + call_metric):
+                self._harvest_count += 1
+
+                configuration = self._active_session.configuration
+
+                with self._stats_lock:
+                    self._transaction_count = 0
+
+                    self._last_transaction = 0.0
+
+                    stats = self._stats_engine.harvest_snapshot(flexible)
+
+                if not flexible:
+                    with self._stats_custom_lock:
+                        self._global_events_account = 0
+
+                        stats_custom = self._stats_custom_engine.harvest_snapshot()
+
+                    stats.merge_metric_stats(stats_custom)
+
+                    self._merge_data_sampler_metrics(stats)
+
+                    stats.record_custom_metric("Instance/Reporting", 0)
+
+                _logger.debug("Sending data for harvest[%s] of %r to local aggregator.", call_metric, self._app_name)
+
+                try:
+                    accepted = local_aggregator.send_payload(
+                        local_aggregator.socket_path(configuration),
+                        local_aggregator.harvest_payload(self._app_name, self._linked_applications, stats),
+                        configuration.local_aggregator.timeout,
+                    )
+
+                except Exception:
+                    _logger.debug(
+                        "Unable to send data for harvest of %r to local aggregator at %r.",
+                        self._app_name,
+                        local_aggregator.socket_path(configuration),
+                        exc_info=True,
+                    )
+
+                    accepted = False
+
+                if accepted:
+                    internal_count_metric("Supportability/Python/LocalAggregator/Sent", 1)
+
+                else:
+                    # The data is retained for the next harvest the same
+                    # as when the data collector asks for it to be resent.
+
+                    internal_count_metric("Supportability/Python/LocalAggregator/Rejected", 1)
+
+                    self._stats_engine.rollback(stats)
+
+                try:
+                    if not flexible and configuration.collect_traces:
+                        connections = SQLConnections(configuration.agent_limits.max_sql_connections)
+
+                        with connections:
+                            if configuration.slow_sql.enabled:
+                                slow_sql_data = stats.slow_sql_data(connections)
+
+                                if slow_sql_data:
+                                    self._active_session.send_sql_traces(slow_sql_data)
+
+                            slow_transaction_data = stats.transaction_trace_data(connections)
+
+                            if slow_transaction_data:
+                                self._active_session.send_transaction_traces(slow_transaction_data)
+
+                    if shutdown:
+                        self.internal_agent_shutdown(restart=False)
+
+                except ForceAgentRestart:
+                    self.internal_agent_shutdown(restart=True)
+
+                except ForceAgentDisconnect:
+                    self.internal_agent_shutdown(restart=False)
+
+                except Exception:
+                    exc_type = sys.exc_info()[0]
+
+                    internal_metric("Supportability/Python/Harvest/Exception/%s" % callable_name(exc_type), 1)
+
+                if self._active_session:
+                    self._active_session.close_connection()
+
+        with self._stats_lock:
+            self._stats_engine.merge_custom_metrics(internal_metrics.metrics())
+
     def harvest(self, shutdown=False, flexible=False):
         """Performs a harvest, reporting aggregated data for the current
         reporting period to the data collector.
@@ -1155,6 +1464,9 @@ class Application(object):
 
             return
 
+        if self._active_session.configuration.local_aggregator.enabled:
+            return self._local_aggregator_harvest(shutdown, flexible)
+
         internal_metrics = CustomMetrics()
 
         call_metric = "flexible" if flexible else "default"
@@ -1210,46 +1522,24 @@ class Application(object):
 
                     _logger.debug("Fetching metrics from data sources for harvest of %r.", self._app_name)
 
-                    for data_sampler in self._data_samplers:
-                        try:
-                            for sample in data_sampler.metrics():
-                                try:
-                                    name, value = sample
-                                    stats.record_custom_metric(name, value)
-                                except Exception:
-                                    _logger.exception(
-                                        "The merging of custom "
-                                        "metric sample %r from data "
-                                        "source %r has failed. Validate "
-                                        "the format of the sample. If "
-                                        "this issue persists then please "
-                                        "report this problem to the data "
-                                        "source provider or New Relic "
-                                        "support for further "
-                                        "investigation.",
-                                        sample,
-                                        data_sampler.name,
-                                    )
-                                    break
-
-                        except Exception:
-                            _logger.exception(
-                                "The merging of custom metric "
-                                "samples from data source %r has failed. "
-                                "Validate that the data source is "
-                                "producing samples correctly. If this "
-                                "issue persists then please report this "
-                                "problem to the data source provider or "
-                                "New Relic support for further "
-                                "investigation.",
-                                data_sampler.name,
-                            )
+                    self._merge_data_sampler_metrics(stats)
 
                     # Add a metric we can use to track how many harvest
                     # periods have occurred.
 
                     stats.record_custom_metric("Instance/Reporting", 0)
 
+                    # Report on the effectiveness and size of the string
+                    # intern pool shared by all transactions.
+
+                    if intern_pool().maximum:
+                        hits, misses, resets, entries, size = intern_pool().stats()
+                        internal_count_metric("Supportability/Python/InternPool/Hits", hits)
+                        internal_count_metric("Supportability/Python/InternPool/Misses", misses)
+                        internal_count_metric("Supportability/Python/InternPool/Resets", resets)
+                        internal_metric("Supportability/Python/InternPool/Entries", entries)
+                        internal_metric("Supportability/Python/InternPool/Bytes", size)
+
                     # If an import order issue was detected, send a metric for
                     # each uninstrumented module
 
@@ -1334,6 +1624,20 @@ class Application(object):
 
                                 internal_count_metric("Supportability/InfiniteTracing/Span/Seen", spans_seen)
                                 internal_count_metric("Supportability/InfiniteTracing/Span/Sent", spans_sent)
+
+                            span_retention = stats.span_retention
+                            if span_retention is not None and not flexible:
+                                spans_forwarded, spans_expired, spans_evicted = span_retention.stats()
+
+                                internal_count_metric(
+                                    "Supportability/InfiniteTracing/Span/TailSampling/Forwarded", spans_forwarded
+                                )
+                                internal_count_metric(
+                                    "Supportability/InfiniteTracing/Span/TailSampling/Dropped", spans_expired
+                                )
+                                internal_count_metric(
+                                    "Supportability/InfiniteTracing/Span/TailSampling/Evicted", spans_evicted
+                                )
                         else:
                             spans = stats.span_events
                             if spans:
@@ -1482,10 +1786,7 @@ class Application(object):
                         # to None and the stats engine will skip steps as
                         # appropriate.
 
-                        if self._rules_engine["metric"].rules:
-                            metric_normalizer = partial(self.normalize_name, rule_type="metric")
-                        else:
-                            metric_normalizer = None
+                        metric_normalizer = self._metric_normalizer()
 
                         # Merge all ready internal metrics
                         stats.merge_custom_metrics(internal_metrics.metrics())
@@ -1508,6 +1809,12 @@ class Application(object):
                         if dimensional_metric_data:
                             self._active_session.send_dimensional_metric_data(self._period_start, period_end, dimensional_metric_data)
 
+                        # Send any payloads which were written to the
+                        # harvest spool when they could not be sent in
+                        # prior harvests.
+
+                        self._active_session.drain_spool()
+
                         _logger.debug("Done sending data for harvest of %r.", self._app_name)
 
                         stats.reset_metric_stats()
@@ -23,6 +23,7 @@ from newrelic.core.attribute_filter import (
     DST_TRANSACTION_SEGMENTS,
     DST_TRANSACTION_TRACER,
 )
+from newrelic.core.string_table import intern_string
 from newrelic.packages import six
 
 _logger = logging.getLogger(__name__)
@@ -42,6 +43,7 @@ _DESTINATIONS_WITH_EVENTS = _DESTINATIONS | DST_TRANSACTION_EVENTS | DST_SPAN_EV
 
 _TRANSACTION_EVENT_DEFAULT_ATTRIBUTES = set(
     (
+        "agent.overhead",
         "aws.lambda.arn",
         "aws.lambda.coldStart",
         "aws.lambda.eventSource.arn",
@@ -74,6 +76,7 @@ _TRANSACTION_EVENT_DEFAULT_ATTRIBUTES = set(
         "message.routingKey",
         "peer.address",
         "peer.hostname",
+        "redis.pipeline.operations",
         "request.headers.accept",
         "request.headers.contentLength",
         "request.headers.contentType",
@@ -275,7 +278,7 @@ def process_user_attribute(name, value, max_length=MAX_ATTRIBUTE_LENGTH, ending=
 
             value = trunc_value
 
-        return (name, value)
+        return (intern_string(name), value)
 
 
 def sanitize(value):
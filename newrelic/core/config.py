@@ -131,10 +131,30 @@ class AttributesSettings(Settings):
     pass
 
 
+class AgentOverheadSettings(Settings):
+    pass
+
+
+class ExplainPlanCacheSettings(Settings):
+    pass
+
+
+class KafkaBatchModeSettings(Settings):
+    pass
+
+
 class GCRuntimeMetricsSettings(Settings):
     enabled = False
 
 
+class CgroupRuntimeMetricsSettings(Settings):
+    enabled = False
+
+
+class ThreadRuntimeMetricsSettings(Settings):
+    enabled = False
+
+
 class MachineLearningSettings(Settings):
     pass
 
@@ -201,6 +221,30 @@ class AgentLimitsSettings(Settings):
     pass
 
 
+class SamplingBudgetsSettings(Settings):
+    pass
+
+
+class SpanCompressionSettings(Settings):
+    pass
+
+
+class ForkHandlingSettings(Settings):
+    pass
+
+
+class LocalAggregatorSettings(Settings):
+    pass
+
+
+class HarvestSpoolSettings(Settings):
+    pass
+
+
+class HarvestSchedulerSettings(Settings):
+    pass
+
+
 class ConsoleSettings(Settings):
     pass
 
@@ -261,6 +305,10 @@ class DatastoreTracerDatabaseNameReportingSettings(Settings):
     pass
 
 
+class DatastoreTracerPipelineModeSettings(Settings):
+    pass
+
+
 class HerokuSettings(Settings):
     pass
 
@@ -366,6 +414,10 @@ class InfiniteTracingSettings(Settings):
         return True
 
 
+class InfiniteTracingTailSamplingSettings(Settings):
+    pass
+
+
 class InstrumentationSettings(Settings):
     pass
 
@@ -396,6 +448,15 @@ class EventHarvestConfigHarvestLimitSettings(Settings):
 
 _settings = TopLevelSettings()
 _settings.agent_limits = AgentLimitsSettings()
+_settings.sampling_budgets = SamplingBudgetsSettings()
+_settings.span_compression = SpanCompressionSettings()
+_settings.fork_handling = ForkHandlingSettings()
+_settings.local_aggregator = LocalAggregatorSettings()
+_settings.harvest_spool = HarvestSpoolSettings()
+_settings.harvest_scheduler = HarvestSchedulerSettings()
+_settings.agent_overhead = AgentOverheadSettings()
+_settings.explain_plan_cache = ExplainPlanCacheSettings()
+_settings.kafka_batch_mode = KafkaBatchModeSettings()
 _settings.application_logging = ApplicationLoggingSettings()
 _settings.application_logging.forwarding = ApplicationLoggingForwardingSettings()
 _settings.application_logging.local_decorating = ApplicationLoggingLocalDecoratingSettings()
@@ -414,6 +475,7 @@ _settings.ml_insights_events = MlInsightsEventsSettings()
 _settings.datastore_tracer = DatastoreTracerSettings()
 _settings.datastore_tracer.database_name_reporting = DatastoreTracerDatabaseNameReportingSettings()
 _settings.datastore_tracer.instance_reporting = DatastoreTracerInstanceReportingSettings()
+_settings.datastore_tracer.pipeline_mode = DatastoreTracerPipelineModeSettings()
 _settings.debug = DebugSettings()
 _settings.distributed_tracing = DistributedTracingSettings()
 _settings.error_collector = ErrorCollectorSettings()
@@ -422,8 +484,11 @@ _settings.event_harvest_config = EventHarvestConfigSettings()
 _settings.event_harvest_config.harvest_limits = EventHarvestConfigHarvestLimitSettings()
 _settings.event_loop_visibility = EventLoopVisibilitySettings()
 _settings.gc_runtime_metrics = GCRuntimeMetricsSettings()
+_settings.cgroup_runtime_metrics = CgroupRuntimeMetricsSettings()
+_settings.thread_runtime_metrics = ThreadRuntimeMetricsSettings()
 _settings.heroku = HerokuSettings()
 _settings.infinite_tracing = InfiniteTracingSettings()
+_settings.infinite_tracing.tail_sampling = InfiniteTracingTailSamplingSettings()
 _settings.instrumentation = InstrumentationSettings()
 _settings.instrumentation.graphql = InstrumentationGraphQLSettings()
 _settings.message_tracer = MessageTracerSettings()
@@ -563,6 +628,17 @@ def _parse_attributes(s):
     return valid
 
 
+def _parse_sampling_budgets(s):
+    targets = {}
+    for item in s.split():
+        try:
+            name, target = item.rsplit("=", 1)
+            targets[name] = int(target)
+        except ValueError:
+            _logger.warning("Improperly formatted sampling budget: %r", item)
+    return targets
+
+
 def default_host(license_key):
     if not license_key:
         return "collector.newrelic.com"
@@ -703,6 +779,25 @@ _settings.encoding_key = None
 _settings.sampling_target = 10
 _settings.sampling_target_period_in_seconds = 60
 
+_settings.sampling_budgets.enabled = False
+_settings.sampling_budgets.targets = {}
+
+_settings.span_compression.enabled = False
+
+_settings.fork_handling.enabled = False
+
+_settings.local_aggregator.enabled = False
+_settings.local_aggregator.socket_path = None
+_settings.local_aggregator.timeout = 5.0
+
+_settings.harvest_spool.enabled = False
+_settings.harvest_spool.directory = None
+_settings.harvest_spool.max_bytes = 64 * 1024 * 1024
+_settings.harvest_spool.segment_bytes = 1024 * 1024
+
+_settings.harvest_scheduler.enabled = False
+_settings.harvest_scheduler.jitter = 5.0
+
 _settings.compressed_content_encoding = "gzip"
 _settings.max_payload_size_in_bytes = 1000000
 
@@ -713,9 +808,22 @@ _settings.attributes.include = []
 _settings.thread_profiler.enabled = True
 _settings.cross_application_tracer.enabled = False
 
+_settings.agent_overhead.enabled = False
+
+_settings.explain_plan_cache.enabled = False
+_settings.explain_plan_cache.ttl = 600.0
+_settings.explain_plan_cache.max_entries = 1000
+_settings.explain_plan_cache.background_worker = False
+
+_settings.kafka_batch_mode.enabled = False
+
 _settings.gc_runtime_metrics.enabled = False
 _settings.gc_runtime_metrics.top_object_count_limit = 5
 
+_settings.cgroup_runtime_metrics.enabled = False
+
+_settings.thread_runtime_metrics.enabled = False
+
 _settings.transaction_events.enabled = True
 _settings.transaction_events.attributes.enabled = True
 _settings.transaction_events.attributes.exclude = []
@@ -780,6 +888,11 @@ _settings.synthetics.enabled = True
 
 _settings.agent_limits.data_collector_timeout = 30.0
 _settings.agent_limits.transaction_traces_nodes = 2000
+_settings.agent_limits.transaction_node_budget = None
+_settings.agent_limits.external_url_cache_maximum = 1000
+_settings.agent_limits.intern_pool_maximum = 10000
+_settings.agent_limits.metric_names_maximum = 10000
+_settings.agent_limits.metric_tag_sets_maximum = 1000
 _settings.agent_limits.sql_query_length_maximum = 16384
 _settings.agent_limits.slow_sql_stack_trace = 30
 _settings.agent_limits.max_sql_connections = 4
@@ -790,6 +903,7 @@ _settings.agent_limits.merge_stats_maximum = None
 _settings.agent_limits.errors_per_transaction = 5
 _settings.agent_limits.errors_per_harvest = 20
 _settings.agent_limits.slow_transaction_dry_harvests = 5
+_settings.agent_limits.slow_transaction_names = 0
 _settings.agent_limits.thread_profiler_nodes = 20000
 _settings.agent_limits.synthetics_events = 200
 _settings.agent_limits.synthetics_transactions = 20
@@ -802,6 +916,12 @@ _settings.infinite_tracing.compression = _environ_as_bool("NEW_RELIC_INFINITE_TR
 _settings.infinite_tracing.batching = _environ_as_bool("NEW_RELIC_INFINITE_TRACING_BATCHING", default=True)
 _settings.infinite_tracing.ssl = True
 _settings.infinite_tracing.span_queue_size = _environ_as_int("NEW_RELIC_INFINITE_TRACING_SPAN_QUEUE_SIZE", 10000)
+_settings.infinite_tracing.tail_sampling.enabled = False
+_settings.infinite_tracing.tail_sampling.hold_time = 10.0
+_settings.infinite_tracing.tail_sampling.max_spans = 10000
+_settings.infinite_tracing.tail_sampling.duration_threshold = None
+_settings.infinite_tracing.tail_sampling.transaction_names = []
+_settings.infinite_tracing.tail_sampling.sample_rate = 0.0
 
 _settings.instrumentation.graphql.capture_introspection_queries = os.environ.get(
     "NEW_RELIC_INSTRUMENTATION_GRAPHQL_CAPTURE_INTROSPECTION_QUERIES", False
@@ -876,6 +996,7 @@ _settings.strip_exception_messages.allowlist = []
 
 _settings.datastore_tracer.instance_reporting.enabled = True
 _settings.datastore_tracer.database_name_reporting.enabled = True
+_settings.datastore_tracer.pipeline_mode.enabled = False
 
 _settings.heroku.use_dyno_names = _environ_as_bool("NEW_RELIC_HEROKU_USE_DYNO_NAMES", default=True)
 _settings.heroku.dyno_name_prefixes_to_shorten = list(
@@ -1262,6 +1383,45 @@ def should_ignore_error(
     )
 
 
+# Whether an exception class matches the class name rules, keyed by the
+# exception class. The results are held separately for each set of rules
+# and discarded when the rules are replaced, such as on a new agent run.
+
+_error_class_rule_matches = {}
+
+_ERROR_CLASS_RULE_MATCHES_MAXIMUM = 1000
+
+
+def _error_class_matches_rules(rules_prefix, classes_rules, exc_info):
+    cache = _error_class_rule_matches.get(rules_prefix)
+
+    if cache is None or cache[0] is not classes_rules:
+        cache = _error_class_rule_matches[rules_prefix] = (classes_rules, {})
+
+    matches = cache[1]
+    exc_class = exc_info[1].__class__
+
+    try:
+        return matches[exc_class]
+    except KeyError:
+        pass
+
+    _, _, fullnames, _ = parse_exc_info(exc_info)
+
+    matched = False
+    for fullname in fullnames:
+        if fullname in classes_rules:
+            matched = True
+            break
+
+    if len(matches) >= _ERROR_CLASS_RULE_MATCHES_MAXIMUM:
+        matches.clear()
+
+    matches[exc_class] = matched
+
+    return matched
+
+
 def error_matches_rules(
     rules_prefix,
     exc_info,
@@ -1301,13 +1461,9 @@ def error_matches_rules(
     classes_rules = getattr(settings.error_collector, "%s_classes" % rules_prefix, set())
     status_codes_rules = getattr(settings.error_collector, "%s_status_codes" % rules_prefix, set())
 
-    _, _, fullnames, _ = parse_exc_info(exc_info)
-    fullname = fullnames[0]
-
     # Check class names
-    for fullname in fullnames:
-        if fullname in classes_rules:
-            return True
+    if _error_class_matches_rules(rules_prefix, classes_rules, exc_info):
+        return True
 
     # Check status_code
     # For callables, call on exc_info to retrieve status_code.
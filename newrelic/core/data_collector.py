@@ -162,6 +162,14 @@ class Session(object):
         payload = ({"logs": tuple(log._asdict() for log in log_event_data)},)
         return self._protocol.send("log_event_data", payload)
 
+    def drain_spool(self):
+        """Called to send payloads from the harvest spool which could not
+        be sent in prior harvests.
+
+        """
+
+        return self._protocol.drain_spool()
+
     def get_agent_commands(self):
         """Receive agent commands from the data collector."""
 
@@ -18,13 +18,19 @@ explain plans for SQL etc.
 """
 
 import logging
+import os
 import re
+import threading
+import time
 import weakref
 
+from collections import OrderedDict
+
 import newrelic.packages.six as six
 
-from newrelic.core.internal_metrics import internal_metric
+from newrelic.core.internal_metrics import internal_count_metric, internal_metric
 from newrelic.core.config import global_settings
+from newrelic.core.string_table import intern_string
 
 _logger = logging.getLogger(__name__)
 
@@ -739,32 +745,323 @@ def _explain_plan(connections, sql, database, connect_params, cursor_params,
     return None
 
 
-def explain_plan(connections, sql_statement, connect_params, cursor_params,
-        sql_parameters, execute_params, sql_format):
+def _run_explain_plan(connections, sql_statement, connect_params,
+        cursor_params, sql_parameters, execute_params, sql_format):
+
+    database = sql_statement.database
+
+    details = _explain_plan(connections, sql_statement.sql, database,
+            connect_params, cursor_params, sql_parameters, execute_params)
 
+    if details is not None and sql_format != 'raw':
+        return _obfuscate_explain_plan(database, *details)
+
+    return details
+
+
+def _can_explain(sql_statement, connect_params):
     # If no parameters supplied for creating database connection
     # then mustn't have been a candidate for explain plans in the
     # first place, so skip it.
 
     if connect_params is None:
-        return
+        return False
 
     # Determine if we even know how to perform explain plans for
     # this particular database.
 
-    database = sql_statement.database
+    return sql_statement.operation in sql_statement.database.explain_stmts
 
-    if sql_statement.operation not in database.explain_stmts:
+
+def _explain_plan_cache_key(sql_statement, connect_params, sql_format):
+    # The same SQL run against different databases can have different
+    # plans, so the parameters used to create the connection are part of
+    # the key. These are converted to a hashable form, falling back to
+    # their repr() if any of the values cannot be hashed.
+
+    try:
+        args, kwargs = connect_params
+        connect_key = (args, frozenset(kwargs.items()))
+        hash(connect_key)
+    except (TypeError, ValueError, AttributeError):
+        connect_key = repr(connect_params)
+
+    return (sql_statement.identifier, sql_format, connect_key)
+
+
+def explain_plan(connections, sql_statement, connect_params, cursor_params,
+        sql_parameters, execute_params, sql_format):
+
+    if not _can_explain(sql_statement, connect_params):
         return
 
-    details = _explain_plan(connections, sql_statement.sql, database,
-            connect_params, cursor_params, sql_parameters, execute_params)
+    settings = global_settings()
 
-    if details is not None and sql_format != 'raw':
-        return _obfuscate_explain_plan(database, *details)
+    if not settings.explain_plan_cache.enabled:
+        return _run_explain_plan(connections, sql_statement, connect_params,
+                cursor_params, sql_parameters, execute_params, sql_format)
+
+    cache = explain_plan_cache()
+    key = _explain_plan_cache_key(sql_statement, connect_params, sql_format)
+
+    found, details = cache.get(key)
+
+    if found:
+        internal_count_metric('Supportability/Python/ExplainPlanCache/Hit', 1)
+        return details
+
+    internal_count_metric('Supportability/Python/ExplainPlanCache/Miss', 1)
+
+    # When the background worker is being used, the explain plan is
+    # only ever run by the worker so that a slow database cannot hold
+    # up the harvest. Any plan it obtains will be attached to the slow
+    # SQL data for a subsequent harvest.
+
+    if settings.explain_plan_cache.background_worker:
+        explain_plan_worker().submit(key, sql_statement, connect_params,
+                cursor_params, sql_parameters, execute_params)
+        return
+
+    details = _run_explain_plan(connections, sql_statement, connect_params,
+            cursor_params, sql_parameters, execute_params, sql_format)
+
+    cache.put(key, details)
 
     return details
 
+
+def prefetch_explain_plan(sql_statement, connect_params, cursor_params,
+        sql_parameters, execute_params, sql_format):
+    """Queues up the explain plan for the SQL statement to be run by the
+    background worker ahead of the next harvest, if the background worker
+    is enabled and a plan for the statement is not already cached.
+
+    """
+
+    settings = global_settings()
+
+    if not settings.explain_plan_cache.enabled:
+        return
+
+    if not settings.explain_plan_cache.background_worker:
+        return
+
+    if not _can_explain(sql_statement, connect_params):
+        return
+
+    key = _explain_plan_cache_key(sql_statement, connect_params, sql_format)
+
+    if key in explain_plan_cache():
+        return
+
+    explain_plan_worker().submit(key, sql_statement, connect_params,
+            cursor_params, sql_parameters, execute_params)
+
+
+class ExplainPlanCache(object):
+
+    """Cache of explain plans keyed by the identifier of the normalized
+    SQL statement and the SQL format. Failed explain plans are cached as
+    None so they are not retried until they expire. The least recently
+    used entry is dropped once the maximum number of entries is reached.
+
+    """
+
+    def __init__(self, ttl, maximum):
+        self.ttl = ttl
+        self.maximum = maximum
+        self._plans = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __contains__(self, key):
+        return self.get(key)[0]
+
+    def __len__(self):
+        return len(self._plans)
+
+    def get(self, key):
+        with self._lock:
+            item = self._plans.get(key)
+
+            if item is None:
+                return False, None
+
+            expires, details = item
+
+            if expires < time.time():
+                del self._plans[key]
+                return False, None
+
+            # Move to back so we know which is the most recently used.
+
+            del self._plans[key]
+            self._plans[key] = item
+
+            return True, details
+
+    def put(self, key, details):
+        with self._lock:
+            self._plans.pop(key, None)
+
+            while len(self._plans) >= self.maximum > 0:
+                self._plans.popitem(last=False)
+
+            self._plans[key] = (time.time() + self.ttl, details)
+
+    def clear(self):
+        with self._lock:
+            self._plans.clear()
+
+    def _after_fork_in_child(self):
+        self._lock = threading.Lock()
+
+
+class ExplainPlanWorker(object):
+
+    """Runs explain plans in a background thread between harvests and
+    stores the results in the explain plan cache. Connections to the
+    databases are only held open while there are explain plans pending.
+
+    """
+
+    def __init__(self, cache, maximum_connections, maximum_pending):
+        self.cache = cache
+        self.maximum_connections = maximum_connections
+        self.maximum_pending = maximum_pending
+
+        self._pending = OrderedDict()
+        self._condition = threading.Condition()
+        self._thread = None
+
+    def submit(self, key, sql_statement, connect_params, cursor_params,
+            sql_parameters, execute_params):
+
+        with self._condition:
+            if key in self._pending:
+                return
+
+            if len(self._pending) >= self.maximum_pending:
+                internal_count_metric('Supportability/Python/'
+                        'ExplainPlanCache/Worker/Dropped', 1)
+                return
+
+            self._pending[key] = (sql_statement, connect_params,
+                    cursor_params, sql_parameters, execute_params)
+
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._worker_loop,
+                        name='NR-Explain-Plan-Thread')
+                self._thread.daemon = True
+                self._thread.start()
+
+            self._condition.notify()
+
+    def _next_request(self, block):
+        with self._condition:
+            while not self._pending:
+                if not block:
+                    return None
+                self._condition.wait()
+
+            return self._pending.popitem(last=False)
+
+    def _worker_loop(self):
+        while True:
+            key, request = self._next_request(block=True)
+
+            connections = SQLConnections(self.maximum_connections)
+
+            with connections:
+                while request is not None:
+                    self._process(connections, key, request)
+
+                    item = self._next_request(block=False)
+                    if item is None:
+                        break
+
+                    key, request = item
+
+    def _process(self, connections, key, request):
+        (sql_statement, connect_params, cursor_params, sql_parameters,
+                execute_params) = request
+
+        try:
+            details = _run_explain_plan(connections, sql_statement,
+                    connect_params, cursor_params, sql_parameters,
+                    execute_params, key[1])
+        except Exception:
+            _logger.exception('Unexpected error running explain plan in '
+                    'background worker. Report this issue to New Relic '
+                    'support.')
+            details = None
+
+        self.cache.put(key, details)
+
+    def _after_fork_in_child(self):
+        # The worker thread does not exist in a child process, so must be
+        # started again for any explain plans submitted in the child.
+
+        self._condition = threading.Condition()
+        self._thread = None
+
+
+_explain_plan_cache = None
+_explain_plan_worker = None
+_explain_plan_lock = threading.Lock()
+
+
+def explain_plan_cache():
+    global _explain_plan_cache
+
+    if _explain_plan_cache is None:
+        with _explain_plan_lock:
+            if _explain_plan_cache is None:
+                settings = global_settings()
+                _explain_plan_cache = ExplainPlanCache(
+                        settings.explain_plan_cache.ttl,
+                        settings.explain_plan_cache.max_entries)
+
+    return _explain_plan_cache
+
+
+def explain_plan_worker():
+    global _explain_plan_worker
+
+    if _explain_plan_worker is None:
+        cache = explain_plan_cache()
+        with _explain_plan_lock:
+            if _explain_plan_worker is None:
+                settings = global_settings()
+                _explain_plan_worker = ExplainPlanWorker(cache,
+                        settings.agent_limits.max_sql_connections,
+                        settings.agent_limits.sql_explain_plans_per_harvest)
+
+    return _explain_plan_worker
+
+
+def _after_fork_in_child():
+    # Locks held by other threads at the time of a fork would never be
+    # released in the child process, so are replaced. As with the agent,
+    # this is only done where fork handling has been enabled.
+
+    global _explain_plan_lock
+
+    if not global_settings().fork_handling.enabled:
+        return
+
+    _explain_plan_lock = threading.Lock()
+
+    if _explain_plan_cache is not None:
+        _explain_plan_cache._after_fork_in_child()
+
+    if _explain_plan_worker is not None:
+        _explain_plan_worker._after_fork_in_child()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_after_fork_in_child)
+
+
 # Wrapper for information about a specific database.
 
 
@@ -843,13 +1140,13 @@ class SQLStatement(object):
     @property
     def operation(self):
         if self._operation is None:
-            self._operation = _parse_operation(self.uncommented)
+            self._operation = intern_string(_parse_operation(self.uncommented))
         return self._operation
 
     @property
     def target(self):
         if self._target is None:
-            self._target = _parse_target(self.uncommented, self.operation)
+            self._target = intern_string(_parse_target(self.uncommented, self.operation))
         return self._target
 
     @property
@@ -861,8 +1158,8 @@ class SQLStatement(object):
     @property
     def obfuscated(self):
         if self._obfuscated is None:
-            self._obfuscated = _uncomment_sql(_obfuscate_sql(self.sql,
-                self.database))
+            self._obfuscated = intern_string(_uncomment_sql(
+                _obfuscate_sql(self.sql, self.database)))
         return self._obfuscated
 
     @property
@@ -17,11 +17,14 @@ try:
 except ImportError:
     import urllib.parse as urlparse
 
+import threading
+
 from collections import namedtuple
 
 import newrelic.core.attribute as attribute
 import newrelic.core.trace_node
 
+from newrelic.core.config import global_settings
 from newrelic.core.node_mixin import GenericNodeMixin
 from newrelic.core.metric import TimeMetric
 
@@ -30,11 +33,107 @@ _ExternalNode = namedtuple('_ExternalNode',
         'duration', 'exclusive', 'params', 'guid',
         'agent_attributes', 'user_attributes'])
 
+_ExternalUrl = namedtuple('_ExternalUrl',
+        ['hostname', 'netloc', 'url_with_path', 'http_url',
+        'all_metric_name', 'metric_names'])
+
+_external_url_cache = {}
+_external_url_cache_lock = threading.Lock()
+
+
+def _decompose_url(url):
+    try:
+        details = urlparse.urlparse(url)
+    except Exception:
+        details = urlparse.urlparse('http://unknown.url')
+
+    hostname = details.hostname
+
+    try:
+        scheme = details.scheme.lower()
+        port = details.port
+    except Exception:
+        scheme = None
+        port = None
+
+    if (scheme, port) in (('http', 80), ('https', 443)):
+        port = None
+
+    netloc = hostname or 'unknown'
+    netloc = port and ('%s:%s' % (netloc, port)) or netloc
+
+    url_with_path = urlparse.urlunsplit((details.scheme, details.netloc,
+            details.path, '', ''))
+
+    _, http_url = attribute.process_user_attribute('http.url', url_with_path)
+
+    return _ExternalUrl(hostname=hostname, netloc=netloc,
+            url_with_path=url_with_path, http_url=http_url,
+            all_metric_name='External/%s/all' % netloc, metric_names={})
+
+
+def external_url(url):
+    """Returns the decomposition of the URL into the parts used for
+    naming external metrics and reporting the URL on traces and spans.
+    The query string and fragment play no part in these, so decompositions
+    are cached by the URL with them removed. The cache is shared across
+    the process and is cleared when it reaches the size given by
+    agent_limits.external_url_cache_maximum.
+
+    """
+
+    url = url or ''
+
+    try:
+        key = url.split('?', 1)[0].split('#', 1)[0]
+        return _external_url_cache[key]
+    except KeyError:
+        pass
+    except Exception:
+        return _decompose_url(url)
+
+    value = _decompose_url(key)
+
+    maximum = global_settings().agent_limits.external_url_cache_maximum
+
+    if maximum:
+        with _external_url_cache_lock:
+            if len(_external_url_cache) >= maximum:
+                _external_url_cache.clear()
+            _external_url_cache[key] = value
+
+    return value
+
+
+def external_metric_name(url, library, method):
+    """Returns the External/<host>/<library>/<method> metric name for the
+    URL, caching it against the decomposition of the URL.
+
+    """
+
+    names = url.metric_names
+    key = (library, method)
+
+    try:
+        return names[key]
+    except KeyError:
+        name = 'External/%s/%s/%s' % (url.netloc, library, method or '')
+        names[key] = name
+        return name
+
 
 class ExternalNode(_ExternalNode, GenericNodeMixin):
     cross_process_id = None
     external_txn_name = None
 
+    @property
+    def external_url(self):
+        if hasattr(self, '_external_url'):
+            return self._external_url
+
+        self._external_url = external_url(self.url)
+        return self._external_url
+
     @property
     def details(self):
         if hasattr(self, '_details'):
@@ -49,43 +148,20 @@ class ExternalNode(_ExternalNode, GenericNodeMixin):
 
     @property
     def name(self):
-        return 'External/%s/%s/%s' % (
-                self.netloc, self.library, self.method or '')
+        return external_metric_name(self.external_url, self.library,
+                self.method)
 
     @property
     def url_with_path(self):
-        details = self.details
-        url = urlparse.urlunsplit((details.scheme, details.netloc,
-                details.path, '', ''))
-        return url
+        return self.external_url.url_with_path
 
     @property
     def http_url(self):
-        if hasattr(self, '_http_url'):
-            return self._http_url
-
-        _, url_attr = attribute.process_user_attribute(
-                'http.url', self.url_with_path)
-
-        self._http_url = url_attr
-        return url_attr
+        return self.external_url.http_url
 
     @property
     def netloc(self):
-        hostname = self.details.hostname or 'unknown'
-
-        try:
-            scheme = self.details.scheme.lower()
-            port = self.details.port
-        except Exception:
-            scheme = None
-            port = None
-
-        if (scheme, port) in (('http', 80), ('https', 443)):
-            port = None
-
-        netloc = port and ('%s:%s' % (hostname, port)) or hostname
-        return netloc
+        return self.external_url.netloc
 
     def time_metrics(self, stats, root, parent):
         """Return a generator yielding the timed metrics for this
@@ -103,7 +179,8 @@ class ExternalNode(_ExternalNode, GenericNodeMixin):
             yield TimeMetric(name='External/allOther', scope='',
                     duration=self.duration, exclusive=self.exclusive)
 
-        netloc = self.netloc
+        url = self.external_url
+        netloc = url.netloc
 
         try:
 
@@ -116,15 +193,11 @@ class ExternalNode(_ExternalNode, GenericNodeMixin):
             self.cross_process_id = None
             self.external_txn_name = None
 
-        name = 'External/%s/all' % netloc
-
-        yield TimeMetric(name=name, scope='', duration=self.duration,
-                  exclusive=self.exclusive)
+        yield TimeMetric(name=url.all_metric_name, scope='',
+                duration=self.duration, exclusive=self.exclusive)
 
         if self.cross_process_id is None:
-            method = self.method or ''
-
-            name = 'External/%s/%s/%s' % (netloc, self.library, method)
+            name = external_metric_name(url, self.library, self.method)
 
             yield TimeMetric(name=name, scope='', duration=self.duration,
                     exclusive=self.exclusive)
@@ -149,14 +222,12 @@ class ExternalNode(_ExternalNode, GenericNodeMixin):
 
     def trace_node(self, stats, root, connections):
 
-        netloc = self.netloc
-
-        method = self.method or ''
+        url = self.external_url
 
         if self.cross_process_id is None:
-            name = 'External/%s/%s/%s' % (netloc, self.library, method)
+            name = external_metric_name(url, self.library, self.method)
         else:
-            name = 'ExternalTransaction/%s/%s/%s' % (netloc,
+            name = 'ExternalTransaction/%s/%s/%s' % (url.netloc,
                                                      self.cross_process_id,
                                                      self.external_txn_name)
 
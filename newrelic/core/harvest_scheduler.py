@@ -0,0 +1,110 @@
+# Copyright 2010 New Relic, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""This module implements the scheduling of the harvests performed by the
+harvest thread, where each application has its own deadlines for the
+flexible and default harvests. The first deadline for each is offset by a
+random amount, so that processes started at the same time do not all
+harvest at the same instant. A harvest which is overdue by more than its
+period, such as when the harvest of another application was slow, is run
+once with the missed cycles skipped rather than being run repeatedly to
+catch up, as the data for the missed cycles is included in the harvest.
+
+"""
+
+import random
+import time
+
+DEFAULT_HARVEST_PERIOD = 60.0
+
+# The longest time to wait before checking for applications which have
+# been activated since the deadlines were last updated.
+
+_MAXIMUM_WAIT = 1.0
+
+
+class HarvestScheduler(object):
+    def __init__(self, applications, shutdown, flexible_period, jitter=0.0):
+        self._applications = applications
+        self._shutdown = shutdown
+        self._flexible_period = flexible_period
+        self._jitter = jitter
+        self._deadlines = {}
+
+    def period(self, flexible):
+        if flexible:
+            return self._flexible_period()
+        return DEFAULT_HARVEST_PERIOD
+
+    def _next_harvest(self, now):
+        """Returns the next harvest due as a tuple of the deadline, whether
+        it is a flexible harvest and the application. Flexible harvests
+        take priority over default harvests with the same deadline.
+
+        """
+
+        deadlines = {}
+
+        for application in self._applications():
+            for flexible in (True, False):
+                key = (application, flexible)
+                deadline = self._deadlines.get(key)
+
+                if deadline is None:
+                    period = self.period(flexible)
+                    deadline = now + period + random.uniform(0.0, min(self._jitter, period))  # nosec
+
+                deadlines[key] = deadline
+
+        # Applications which no longer exist are dropped.
+
+        self._deadlines = deadlines
+
+        if not deadlines:
+            return None
+
+        (application, flexible), deadline = min(deadlines.items(), key=lambda item: (item[1], not item[0][1]))
+
+        return deadline, flexible, application
+
+    def run(self, harvest):
+        """Runs harvests until the shutdown event is set, calling harvest()
+        with the application, whether it is a flexible harvest, how late
+        the harvest is in seconds and the number of cycles skipped.
+
+        """
+
+        while not self._shutdown.is_set():
+            now = time.time()
+
+            entry = self._next_harvest(now)
+
+            if entry is None:
+                self._shutdown.wait(_MAXIMUM_WAIT)
+                continue
+
+            deadline, flexible, application = entry
+
+            if deadline > now:
+                self._shutdown.wait(min(deadline - now, _MAXIMUM_WAIT))
+                continue
+
+            lag = now - deadline
+            period = self.period(flexible)
+
+            skipped = int(lag // period)
+
+            self._deadlines[(application, flexible)] = deadline + (skipped + 1) * period
+
+            harvest(application, flexible, lag, skipped)
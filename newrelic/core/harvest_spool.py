@@ -0,0 +1,450 @@
+# Copyright 2010 New Relic, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""This module implements a bounded on disk spool for the payloads sent
+to the data collector. Where a payload can't be sent due to a recoverable
+error, the serialized payload is compressed and appended to a segment file
+for the endpoint, rather than the data being merged back into the stats
+engine. The spooled payloads are then sent by a subsequent harvest once
+the data collector can be reached, including by another process for the
+same application where the process which spooled them has since exited.
+
+Segment files are named for the endpoint, the process writing them and
+when they were created. A segment is only ever appended to by the process
+which created it, with it being sealed once it reaches the segment size
+or the payloads are about to be sent. A process sending the payloads in a
+sealed segment first claims it by renaming it, so no two processes will
+send the same payloads.
+
+"""
+
+import errno
+import hashlib
+import itertools
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+
+from newrelic.common.system_info import make_private_directory, private_directory
+from newrelic.network.exceptions import DiscardDataForRequest, RetryDataForRequest
+
+_logger = logging.getLogger(__name__)
+
+_RECORD_HEADER = struct.Struct("!HI")
+
+_BACKOFF_INITIAL = 15.0
+_BACKOFF_MAXIMUM = 300.0
+
+_OPEN = "open"
+_SEALED = "seg"
+_DRAINING = "drain"
+
+
+def _process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except OSError as exc:
+        return exc.errno == errno.EPERM
+    return True
+
+
+def _read_records(path):
+    """Returns the records in the segment file as a list of tuples of the
+    run ID and the compressed payload. A truncated record at the end of
+    the file, where the process writing it exited before it completed, is
+    ignored.
+
+    """
+
+    records = []
+
+    with open(path, "rb") as fp:
+        size = os.fstat(fp.fileno()).st_size
+
+        if not size:
+            return records
+
+        data = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+
+        try:
+            offset = 0
+
+            while offset + _RECORD_HEADER.size <= size:
+                run_id_size, payload_size = _RECORD_HEADER.unpack_from(data, offset)
+
+                start = offset + _RECORD_HEADER.size
+                end = start + run_id_size + payload_size
+
+                if end > size:
+                    break
+
+                run_id = data[start : start + run_id_size].decode("utf-8")
+                records.append((run_id, data[start + run_id_size : end]))
+
+                offset = end
+
+        finally:
+            data.close()
+
+    return records
+
+
+def _open_private(path, flags):
+    # Spooled payloads can include SQL, error messages and log messages, so
+    # the segment files are only readable by the current user.
+
+    return os.fdopen(os.open(path, flags | os.O_WRONLY | os.O_CREAT, 0o600), "ab" if flags & os.O_APPEND else "wb")
+
+
+def _encode_record(run_id, payload):
+    run_id = (run_id or "").encode("utf-8")
+    return _RECORD_HEADER.pack(len(run_id), len(payload)) + run_id + payload
+
+
+class HarvestSpool(object):
+    def __init__(self, directory, max_bytes, segment_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.segment_bytes = segment_bytes
+
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        self._writers = {}
+        self._counter = itertools.count()
+
+        self._backoff = 0.0
+        self._next_attempt = 0.0
+
+        self._refused = False
+
+    def _private_directory(self):
+        """Creates the spool directory where required, returning whether
+        it can be used. The spool directory must be owned by the current
+        user, as otherwise another user could read the spooled payloads, or
+        add payloads which would be sent on behalf of the application. The
+        directory containing it is only made private where it is the default
+        directory, as a configured directory may be shared with other uses.
+
+        """
+
+        try:
+            parent = os.path.dirname(self.directory)
+
+            if parent == default_spool_directory():
+                make_private_directory(parent)
+
+            make_private_directory(self.directory)
+
+        except OSError:
+            if not self._refused:
+                _logger.warning(
+                    "Unable to use harvest spool directory %r as it is not a directory owned by the current user.",
+                    self.directory,
+                    exc_info=True,
+                )
+                self._refused = True
+
+            return False
+
+        return True
+
+    def in_backoff(self):
+        return time.time() < self._next_attempt
+
+    def failed(self):
+        self._backoff = min(max(2.0 * self._backoff, _BACKOFF_INITIAL), _BACKOFF_MAXIMUM)
+        self._next_attempt = time.time() + self._backoff
+
+    def succeeded(self):
+        self._backoff = 0.0
+        self._next_attempt = 0.0
+
+    def _segment_name(self, method):
+        return "%s.%d.%d%04d" % (method, self._pid, int(time.time() * 1000), next(self._counter) % 10000)
+
+    def _segments(self):
+        """Returns the segment files in the spool as a list of tuples of
+        the path, the file name components and the size, ordered from the
+        oldest to the newest.
+
+        """
+
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return []
+
+        segments = []
+
+        for name in names:
+            parts = name.split(".")
+
+            if len(parts) < 4 or parts[-1] not in (_OPEN, _SEALED, _DRAINING):
+                continue
+
+            path = os.path.join(self.directory, name)
+
+            try:
+                size = os.path.getsize(path)
+            except OSError:
+                continue
+
+            segments.append((path, parts, size))
+
+        segments.sort(key=lambda segment: int(segment[1][2]))
+
+        return segments
+
+    def _abandoned(self, path, parts):
+        # Segments which are being written or sent by a process that has
+        # since exited are treated as being sealed. Where the process ID
+        # has been reused by this process, the segment can only have been
+        # left by a prior process if this process is not writing it.
+
+        kind = parts[-1]
+
+        if kind == _SEALED:
+            return True
+
+        owner = int(parts[1] if kind == _OPEN else parts[3])
+
+        if owner == self._pid:
+            return kind == _DRAINING or path not in [writer[0] for writer in self._writers.values()]
+
+        return not _process_alive(owner)
+
+    def _make_room(self, size):
+        segments = self._segments()
+        total = sum(segment[2] for segment in segments)
+
+        for path, parts, segment_size in segments:
+            if total + size <= self.max_bytes:
+                break
+
+            if parts[-1] != _SEALED:
+                continue
+
+            try:
+                os.unlink(path)
+            except OSError:
+                continue
+
+            _logger.debug("Discarded oldest harvest spool segment %r as spool is full.", path)
+
+            total -= segment_size
+
+        return total + size <= self.max_bytes
+
+    def _check_process(self):
+        # The open segments of a parent process can't be appended to by a
+        # forked child process.
+
+        pid = os.getpid()
+
+        if pid != self._pid:
+            self._pid = pid
+            self._writers = {}
+
+    def _seal(self, method):
+        path, fp = self._writers.pop(method)
+
+        fp.close()
+
+        os.rename(path, path[: -len(_OPEN)] + _SEALED)
+
+    def append(self, method, run_id, payload):
+        """Appends the serialized payload for the endpoint to the spool,
+        returning whether it was added. The payload is not added where it
+        doesn't fit in the spool even after discarding the oldest sealed
+        segments.
+
+        """
+
+        record = _encode_record(run_id, zlib.compress(payload))
+
+        if len(record) > self.max_bytes:
+            return False
+
+        with self._lock:
+            self._check_process()
+
+            if not self._private_directory():
+                return False
+
+            if not self._make_room(len(record)):
+                return False
+
+            if method not in self._writers:
+                path = os.path.join(self.directory, "%s.%s" % (self._segment_name(method), _OPEN))
+                self._writers[method] = (path, _open_private(path, os.O_APPEND))
+
+            fp = self._writers[method][1]
+
+            fp.write(record)
+            fp.flush()
+
+            if fp.tell() >= self.segment_bytes:
+                self._seal(method)
+
+        return True
+
+    def _claim(self):
+        claimed = []
+
+        with self._lock:
+            self._check_process()
+
+            for method in list(self._writers):
+                self._seal(method)
+
+            if not self._private_directory():
+                return claimed
+
+            for path, parts, _ in self._segments():
+                if not self._abandoned(path, parts):
+                    continue
+
+                base = ".".join(parts[:3])
+                target = os.path.join(self.directory, "%s.%d.%s" % (base, self._pid, _DRAINING))
+
+                try:
+                    os.rename(path, target)
+                except OSError:
+                    # Claimed by another process.
+                    continue
+
+                claimed.append((target, parts[0]))
+
+        return claimed
+
+    def _requeue(self, path, method, records):
+        # The payloads which remain to be sent are written to a new sealed
+        # segment, keeping the time the original segment was created.
+
+        parts = os.path.basename(path).split(".")
+
+        target = os.path.join(self.directory, "%s.%d.%s.%s" % (method, self._pid, parts[2], _SEALED))
+
+        with _open_private(target, os.O_TRUNC) as fp:
+            for run_id, payload in records:
+                fp.write(_encode_record(run_id, payload))
+
+        os.unlink(path)
+
+    def drain(self, send, limit):
+        """Sends up to limit of the spooled payloads by calling send() with
+        the endpoint, the run ID the payload was created for and the
+        payload. Sending stops where the data collector can't be reached,
+        with no further attempt made until the backoff period has expired.
+        Returns the number of payloads sent.
+
+        """
+
+        if self.in_backoff():
+            return 0
+
+        claimed = self._claim()
+
+        sent = 0
+
+        for index, (path, method) in enumerate(claimed):
+            try:
+                records = _read_records(path)
+            except (IOError, OSError, ValueError):
+                _logger.debug("Unable to read harvest spool segment %r.", path, exc_info=True)
+                records = []
+
+            for position, (run_id, payload) in enumerate(records):
+                if sent >= limit:
+                    self._requeue(path, method, records[position:])
+                    break
+
+                try:
+                    send(method, run_id, zlib.decompress(payload))
+
+                except DiscardDataForRequest:
+                    _logger.debug("Discarded spooled payload for %r which was rejected.", method)
+
+                except RetryDataForRequest:
+                    self.failed()
+                    self._requeue(path, method, records[position:])
+                    break
+
+                except Exception:
+                    self._requeue(path, method, records[position:])
+                    self._release(claimed[index + 1 :])
+                    raise
+
+                else:
+                    sent += 1
+
+            else:
+                os.unlink(path)
+                continue
+
+            self._release(claimed[index + 1 :])
+            break
+
+        if sent and not self.in_backoff():
+            self.succeeded()
+
+        return sent
+
+    def _release(self, claimed):
+        for path, _ in claimed:
+            parts = os.path.basename(path).split(".")
+            try:
+                os.rename(path, os.path.join(self.directory, "%s.%s" % (".".join(parts[:3]), _SEALED)))
+            except OSError:
+                pass
+
+
+_spools = {}
+_spools_lock = threading.Lock()
+
+
+def default_spool_directory():
+    return private_directory("newrelic-spool")
+
+
+def harvest_spool(settings):
+    """Returns the spool for the application the settings are for, or
+    None if the spool is not enabled. The payloads for each application
+    are kept in a separate directory within the spool directory.
+
+    """
+
+    if not settings.harvest_spool.enabled:
+        return None
+
+    name = hashlib.sha256((settings.app_name or "").encode("utf-8")).hexdigest()[:16]
+    directory = os.path.join(settings.harvest_spool.directory or default_spool_directory(), name)
+
+    with _spools_lock:
+        spool = _spools.get(directory)
+
+        if spool is None:
+            spool = _spools[directory] = HarvestSpool(
+                directory, settings.harvest_spool.max_bytes, settings.harvest_spool.segment_bytes
+            )
+
+        else:
+            spool.max_bytes = settings.harvest_spool.max_bytes
+            spool.segment_bytes = settings.harvest_spool.segment_bytes
+
+    return spool
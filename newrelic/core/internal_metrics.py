@@ -18,8 +18,16 @@ import types
 import time
 import threading
 
+from newrelic.common.stopwatch import default_timer
+
 _context = threading.local()
 
+try:
+    perf_counter_ns = time.perf_counter_ns
+except AttributeError:
+    def perf_counter_ns():
+        return int(default_timer() * 1e9)
+
 class InternalTrace(object):
 
     def __init__(self, name, metrics=None):
@@ -67,6 +75,34 @@ class InternalTraceWrapper(object):
         with InternalTrace(self.__name, metrics):
             return self.__wrapped(*args, **kwargs)
 
+class AgentOverhead(object):
+
+    """Accumulates the time spent within the agent on the request path
+    of a single transaction. Callers take a start time with
+    perf_counter_ns() and pass it to record() when done, so that no
+    objects need to be created when accounting for each call.
+
+    """
+
+    def __init__(self):
+        self.total = 0
+        self.categories = {}
+
+    def record(self, category, start):
+        elapsed = perf_counter_ns() - start
+        self.total += elapsed
+        self.categories[category] = self.categories.get(category, 0) + elapsed
+
+    @property
+    def duration(self):
+        return self.total / 1e9
+
+    def metrics(self):
+        yield ('Supportability/Python/AgentOverhead/all', self.duration)
+        for category, elapsed in self.categories.items():
+            yield ('Supportability/Python/AgentOverhead/%s' % category,
+                    elapsed / 1e9)
+
 class InternalTraceContext(object):
 
     def __init__(self, metrics):
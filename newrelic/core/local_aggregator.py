@@ -0,0 +1,251 @@
+# Copyright 2010 New Relic, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""This module implements a local aggregator for the harvest data of
+multiple processes, such as the workers of a prefork web server. Rather
+than each process reporting to the data collector, the processes pass the
+data for each harvest over a UNIX socket to the aggregator process, which
+merges it into the data for the application and reports it in a single
+harvest. Each message is the pickled harvest data preceded by its length,
+with the aggregator replying with a single byte indicating whether the
+data was accepted.
+
+"""
+
+import logging
+import os
+import socket
+import struct
+import threading
+
+from newrelic.common.system_info import make_private_directory, private_directory
+from newrelic.packages.six.moves import cPickle as pickle
+
+_logger = logging.getLogger(__name__)
+
+_HEADER = struct.Struct("!I")
+
+_ACCEPTED = b"\x01"
+_REJECTED = b"\x00"
+
+# The protocol is fixed so the processes and the aggregator do not need to
+# be running the same version of Python.
+
+_PICKLE_PROTOCOL = 2
+
+_PEER_CREDENTIALS = struct.Struct("3i")
+
+
+def default_socket_path():
+    return os.path.join(private_directory("newrelic-aggregator"), "aggregator.sock")
+
+
+def _peer_uid(sock):
+    """Returns the user ID of the process at the other end of the UNIX
+    socket, or None where this can't be determined on the platform.
+
+    """
+
+    if not hasattr(socket, "SO_PEERCRED"):
+        return None
+
+    credentials = sock.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, _PEER_CREDENTIALS.size)
+    return _PEER_CREDENTIALS.unpack(credentials)[1]
+
+
+def _same_user(sock):
+    # Where the user of the peer can't be determined, access is only
+    # restricted by the permissions of the socket and its directory.
+
+    if not hasattr(os, "getuid"):
+        return True
+
+    uid = _peer_uid(sock)
+
+    return uid is None or uid == os.getuid()
+
+
+def socket_path(settings):
+    return settings.local_aggregator.socket_path or default_socket_path()
+
+
+def _recv_exactly(sock, size):
+    chunks = []
+
+    while size:
+        chunk = sock.recv(min(size, 65536))
+        if not chunk:
+            raise EOFError("Connection closed by peer.")
+        chunks.append(chunk)
+        size -= len(chunk)
+
+    return b"".join(chunks)
+
+
+def harvest_payload(app_name, linked_applications, stats):
+    return {
+        "app_name": app_name,
+        "linked_applications": linked_applications,
+        "pid": os.getpid(),
+        "data": stats.local_harvest_data(),
+    }
+
+
+def send_payload(path, payload, timeout=None):
+    """Sends the harvest data to the local aggregator listening on the
+    UNIX socket at path, returning whether it was accepted. An exception
+    is raised if the aggregator could not be reached.
+
+    """
+
+    data = pickle.dumps(payload, _PICKLE_PROTOCOL)
+
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+
+    try:
+        sock.settimeout(timeout)
+        sock.connect(path)
+
+        # The harvest data is only sent to an aggregator run by the same
+        # user.
+
+        if not _same_user(sock):
+            raise socket.error("Local aggregator at %r is run by another user." % path)
+
+        sock.sendall(_HEADER.pack(len(data)) + data)
+
+        return _recv_exactly(sock, 1) == _ACCEPTED
+
+    finally:
+        sock.close()
+
+
+class LocalAggregator(object):
+
+    """Listens on a UNIX socket for the harvest data of other processes,
+    merging it into the application of the same name in the agent. The
+    first time data is received for an application it is activated and
+    the data rejected, with the process then retaining the data for its
+    next harvest.
+
+    """
+
+    def __init__(self, path, agent, timeout=None):
+        self.path = path
+        self.timeout = timeout
+
+        self._agent = agent
+        self._listener = None
+        self._thread = None
+
+    def start(self):
+        # The default socket is kept in a directory which is only
+        # accessible to the current user, so that the socket can't be
+        # created or replaced by another user.
+
+        if self.path == default_socket_path():
+            make_private_directory(os.path.dirname(self.path))
+
+        try:
+            os.unlink(self.path)
+        except Exception:
+            pass
+
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        listener.bind(self.path)
+
+        os.chmod(self.path, 0o600)
+
+        listener.listen(64)
+
+        self._listener = listener
+
+        self._thread = threading.Thread(target=self._run, name="NR-Local-Aggregator")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        listener, self._listener = self._listener, None
+
+        if listener is None:
+            return
+
+        # Shutting down the socket is required to wake up the thread
+        # where it is blocked in accept() on some platforms.
+
+        try:
+            listener.shutdown(socket.SHUT_RDWR)
+        except Exception:
+            pass
+
+        listener.close()
+
+        self._thread.join(self.timeout)
+
+        try:
+            os.unlink(self.path)
+        except Exception:
+            pass
+
+    def _run(self):
+        while self._listener is not None:
+            try:
+                client, _ = self._listener.accept()
+            except Exception:
+                if self._listener is None:
+                    break
+                _logger.exception("Local aggregator failed to accept connection.")
+                continue
+
+            try:
+                client.settimeout(self.timeout)
+                self._handle(client)
+
+            except Exception:
+                _logger.exception("Local aggregator failed to process harvest data from process.")
+
+            finally:
+                client.close()
+
+    def _handle(self, client):
+        # The harvest data is only unpickled where it is sent by a process
+        # of the same user.
+
+        if not _same_user(client):
+            _logger.warning("Local aggregator rejected connection from process of another user.")
+            return
+
+        (size,) = _HEADER.unpack(_recv_exactly(client, _HEADER.size))
+
+        payload = pickle.loads(_recv_exactly(client, size))  # nosec
+
+        client.sendall(_ACCEPTED if self.merge(payload) else _REJECTED)
+
+    def merge(self, payload):
+        app_name = payload["app_name"]
+
+        application = self._agent.application(app_name)
+
+        if application is None or not application.active:
+            _logger.debug(
+                "Local aggregator received harvest data from process %r for inactive application %r.",
+                payload.get("pid"),
+                app_name,
+            )
+
+            self._agent.activate_application(app_name, payload.get("linked_applications"))
+
+            return False
+
+        return application.merge_local_harvest_data(payload["data"])
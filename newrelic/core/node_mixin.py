@@ -16,6 +16,7 @@ import newrelic.core.attribute as attribute
 
 from newrelic.core.attribute_filter import (DST_SPAN_EVENTS,
         DST_TRANSACTION_SEGMENTS)
+from newrelic.core.string_table import intern_string
 
 
 class GenericNodeMixin(object):
@@ -56,7 +57,7 @@ class GenericNodeMixin(object):
                 attr_class=dict):
         i_attrs = base_attrs and base_attrs.copy() or attr_class()
         i_attrs['type'] = 'Span'
-        i_attrs['name'] = self.name
+        i_attrs['name'] = intern_string(self.name)
         i_attrs['guid'] = self.guid
         i_attrs['timestamp'] = int(self.start_time * 1000)
         i_attrs['duration'] = self.duration
@@ -19,7 +19,6 @@ etc.
 """
 
 import sys
-import itertools
 
 from newrelic.core.config import global_settings
 
@@ -108,9 +107,63 @@ def _extract_tb(tb, limit):
 
     return l
 
-def exception_stack(tb, limit=None):
+def _capture_stack(f, limit):
+    # Same as _extract_stack() but only records the code object and line
+    # number for each frame, leaving the details to be looked up when
+    # the stack trace is formatted.
+
+    n = 0
+    l = []
+
+    while f is not None and n < limit:
+        l.append((f.f_code, f.f_lineno))
+
+        f = f.f_back
+        n += 1
+
+    l.reverse()
+
+    return l
+
+def _capture_tb(tb, limit):
+    # Same as _extract_tb() but only records the code object and line
+    # number for each traceback object.
+
+    l = []
+
+    while tb is not None:
+        l.append((tb.tb_frame.f_code, tb.tb_lineno))
+        tb = tb.tb_next
+
+    return l[-limit:] if limit > 0 else []
+
+class ExceptionStack(object):
+
+    """The frames for an exception captured by capture_exception_stack().
+    Only the code object and line number of each frame are held, so the
+    frames themselves, and their local variables, are not kept alive.
+
+    """
+
+    __slots__ = ('frames',)
+
+    def __init__(self, frames):
+        self.frames = frames
+
+    def format(self):
+        return _format_stack_trace(dict(source=code.co_filename,
+                line=line, name=code.co_name) for code, line in self.frames)
+
+def capture_exception_stack(tb, limit=None):
+    """Captures the stack for an exception without formatting it. This
+    is cheaper than exception_stack() where the stack trace may end up
+    not being reported, with format_exception_stack() being used to
+    format it when it is.
+
+    """
+
     if tb is None:
-        return []
+        return ExceptionStack([])
 
     if limit is None:
         limit = _global_settings.max_stack_trace_lines
@@ -122,12 +175,23 @@ def exception_stack(tb, limit=None):
     # try/except, which is derived from the frame one above that
     # associated with the top most traceback object.
 
-    _tb_stack = _extract_tb(tb, limit)
+    _tb_stack = _capture_tb(tb, limit)
 
     if len(_tb_stack) < limit:
-        _current_stack = _extract_stack(tb.tb_frame.f_back, skip=0,
+        _current_stack = _capture_stack(tb.tb_frame.f_back,
                 limit=limit-len(_tb_stack))
-    else:
-        _current_stack = []
+        _current_stack.extend(_tb_stack)
+        return ExceptionStack(_current_stack)
+
+    return ExceptionStack(_tb_stack)
+
+def format_exception_stack(stack):
+    if isinstance(stack, ExceptionStack):
+        return stack.format()
+    return stack
+
+def exception_stack(tb, limit=None):
+    if tb is None:
+        return []
 
-    return _format_stack_trace(itertools.chain(_current_stack, _tb_stack))
+    return capture_exception_stack(tb, limit).format()
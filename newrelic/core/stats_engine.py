@@ -21,6 +21,7 @@ data whereby it is sent to the core application.
 
 import base64
 import copy
+import itertools
 import logging
 import operator
 import random
@@ -29,7 +30,8 @@ import time
 import traceback
 import warnings
 import zlib
-from heapq import heapify, heapreplace
+from heapq import heapify, heappop, heappush, heapreplace
+from math import isinf, isnan
 
 import newrelic.packages.six as six
 from newrelic.api.settings import STRIP_EXCEPTION_MESSAGE
@@ -37,7 +39,7 @@ from newrelic.api.time_trace import get_linking_metadata
 from newrelic.common.encoding_utils import json_encode
 from newrelic.common.metric_utils import create_metric_identity
 from newrelic.common.object_names import parse_exc_info
-from newrelic.common.streaming_utils import StreamBuffer
+from newrelic.common.streaming_utils import SpanRetentionBuffer, StreamBuffer
 from newrelic.core.attribute import (
     MAX_LOG_MESSAGE_LENGTH,
     create_agent_attributes,
@@ -48,7 +50,7 @@ from newrelic.core.attribute import (
 from newrelic.core.attribute_filter import DST_ERROR_COLLECTOR
 from newrelic.core.code_level_metrics import extract_code_from_traceback
 from newrelic.core.config import is_expected_error, should_ignore_error
-from newrelic.core.database_utils import explain_plan
+from newrelic.core.database_utils import explain_plan, prefetch_explain_plan
 from newrelic.core.error_collector import TracedError
 from newrelic.core.log_event_node import LogEventNode
 from newrelic.core.metric import TimeMetric
@@ -195,6 +197,101 @@ class CountStats(TimeStats):
         pass
 
 
+# The last segment of the name of the metric which the data for a metric
+# name prefix is folded into once the limit on the number of unique metric
+# names for the prefix has been reached, along with the tags which the data
+# for a dimensional metric is recorded with once the limit on the number of
+# unique tag sets for the metric has been reached.
+
+METRIC_OVERFLOW_SEGMENT = "overflow"
+METRIC_OVERFLOW_TAGS = frozenset([(METRIC_OVERFLOW_SEGMENT, True)])
+
+# Metrics generated by the agent itself are bounded, so they are never
+# folded. Once the number of distinct metric name prefixes has reached the
+# maximum, the prefix for any further names is that for other metrics.
+
+METRIC_PREFIXES_EXEMPT = frozenset(["Supportability"])
+METRIC_PREFIXES_MAXIMUM = 100
+METRIC_PREFIX_OTHER = "Other"
+
+
+class MetricCardinalityLimiter(object):
+
+    """Limits the number of unique metric names recorded in a stats table
+    for each metric name prefix, being the first segment of the name, and
+    the number of unique tag sets recorded for each dimensional metric.
+    Where a limit has been reached, the data for any further metric names
+    or tag sets is folded into an overflow metric, with the number of times
+    this occurs recorded as a supportability metric in the stats table.
+
+    Scoped and unscoped metric names are counted separately. The data for
+    scoped metrics which exceed the limit is not folded, as it is already
+    included in the corresponding unscoped metric.
+
+    """
+
+    def __init__(self, names_maximum, tag_sets_maximum, stats_table):
+        self.names_maximum = names_maximum
+        self.tag_sets_maximum = tag_sets_maximum
+        self._stats_table = stats_table
+        self._names = {}
+
+    def _record_overflow(self, name):
+        key = ("Supportability/Python/MetricCardinality/" + name, "")
+        stats = self._stats_table.get(key)
+        if stats is None:
+            self._stats_table[key] = CountStats(call_count=1)
+        else:
+            stats[0] += 1
+
+    def metric_name(self, name, scoped=False):
+        """Returns the name to record a metric which is not yet in the
+        stats table under, being either the name itself or the name of the
+        overflow metric for the prefix. None is returned where a scoped
+        metric exceeds the limit.
+
+        """
+
+        if not self.names_maximum:
+            return name
+
+        prefix, _, remainder = name.partition("/")
+
+        if prefix in METRIC_PREFIXES_EXEMPT or remainder == METRIC_OVERFLOW_SEGMENT:
+            return name
+
+        key = (prefix, scoped)
+        count = self._names.get(key, 0)
+
+        if not count and len(self._names) >= METRIC_PREFIXES_MAXIMUM:
+            prefix = METRIC_PREFIX_OTHER
+
+        elif count < self.names_maximum:
+            self._names[key] = count + 1
+            return name
+
+        self._record_overflow("Overflow/" + prefix)
+
+        if scoped:
+            return None
+
+        return "%s/%s" % (prefix, METRIC_OVERFLOW_SEGMENT)
+
+    def tag_set(self, tags, count):
+        """Returns the tags to record a dimensional metric with where the
+        tags are not yet recorded for the metric, and the metric already
+        has the given number of tag sets.
+
+        """
+
+        if not self.tag_sets_maximum or count < self.tag_sets_maximum:
+            return tags
+
+        self._record_overflow("TagSets/Overflow")
+
+        return METRIC_OVERFLOW_TAGS
+
+
 class CustomMetrics(object):
 
     """Table for collection a set of value metrics."""
@@ -241,12 +338,57 @@ class CustomMetrics(object):
         self.__stats_table = {}
 
 
+class ScopedMetrics(object):
+
+    """Table for collecting a set of time metrics for a single transaction
+    ahead of them being merged into the stats engine."""
+
+    def __init__(self):
+        self.__stats_table = {}
+
+    def __contains__(self, key):
+        return key in self.__stats_table
+
+    def __len__(self):
+        return len(self.__stats_table)
+
+    def record_time_metric(self, metric):
+        """Record a single time metric, merging the data with any data
+        from prior time metrics with the same name and scope.
+
+        """
+
+        key = (metric.name, metric.scope or "")
+        stats = self.__stats_table.get(key)
+        if stats is None:
+            self.__stats_table[key] = TimeStats(
+                call_count=1,
+                total_call_time=metric.duration,
+                total_exclusive_call_time=metric.exclusive,
+                min_call_time=metric.duration,
+                max_call_time=metric.duration,
+                sum_of_squares=metric.duration**2,
+            )
+        else:
+            stats.merge_time_metric(metric)
+
+    def metrics(self):
+        """Returns an iterator over the set of time metrics. The items
+        returned are a tuple consisting of the metric name and scope, and
+        the accumulated stats for the metric.
+
+        """
+
+        return six.iteritems(self.__stats_table)
+
+
 class DimensionalMetrics(object):
 
     """Nested dictionary table for collecting a set of metrics broken down by tags."""
 
-    def __init__(self):
+    def __init__(self, limiter=None):
         self.__stats_table = {}
+        self.limiter = limiter
 
     def __contains__(self, key):
         if isinstance(key, tuple):
@@ -277,13 +419,24 @@ class DimensionalMetrics(object):
         else:
             new_stats = TimeStats(1, value, value, value, value, value**2)
 
+        limiter = self.limiter
+
         stats_container = self.__stats_table.get(name)
+        if stats_container is None and limiter is not None:
+            # The data for a new metric name may need to be folded into
+            # the overflow metric for the prefix of the name.
+            name = limiter.metric_name(name)
+            stats_container = self.__stats_table.get(name)
+
         if stats_container is None:
             # No existing metrics with this name. Set up new stats container.
             self.__stats_table[name] = {tags: new_stats}
         else:
             # Existing metric container found.
             stats = stats_container.get(tags)
+            if stats is None and limiter is not None:
+                tags = limiter.tag_set(tags, len(stats_container))
+                stats = stats_container.get(tags)
             if stats is None:
                 # No data points for this set of tags. Add new data.
                 stats_container[tags] = new_stats
@@ -377,6 +530,179 @@ class SlowSqlStats(list):
         self[0] += 1
 
 
+class SlowTransactionTable(object):
+
+    """Table of the slowest transaction trace for each transaction name,
+    retaining only those for the slowest transaction names where the
+    maximum number of names is reached. Traces are held in the encoded
+    form sent to the data collector, so the transaction node tree does
+    not need to be kept until the harvest.
+
+    """
+
+    def __init__(self):
+        self.__traces = {}
+
+    def __len__(self):
+        return len(self.__traces)
+
+    def __contains__(self, name):
+        return name in self.__traces
+
+    def durations(self):
+        return dict((name, entry[0]) for name, entry in six.iteritems(self.__traces))
+
+    def should_retain(self, name, duration, maximum):
+        """Returns whether a trace with the given name and duration would
+        be retained, so that encoding the trace can be skipped if not.
+
+        """
+
+        entry = self.__traces.get(name)
+
+        if entry is not None:
+            return duration > entry[0]
+
+        if len(self.__traces) < maximum:
+            return True
+
+        return duration > min(entry[0] for entry in six.itervalues(self.__traces))
+
+    def add(self, name, duration, guid, data, maximum):
+        traces = self.__traces
+
+        if name not in traces and len(traces) >= maximum:
+            fastest = min(traces, key=lambda key: traces[key][0])
+            del traces[fastest]
+
+        traces[name] = (duration, guid, data)
+
+    def merge(self, other, maximum):
+        for name, entry in six.iteritems(other.__traces):
+            if self.should_retain(name, entry[0], maximum):
+                self.add(name, entry[0], entry[1], entry[2], maximum)
+
+    def trace_data(self, exclude_guids=()):
+        return [data for _, guid, data in six.itervalues(self.__traces) if guid not in exclude_guids]
+
+
+class SlowSqlTable(object):
+
+    """Table of slow SQL stats keyed by SQL identifier which retains only
+    those entries with the greatest maximum call time. A min-heap on the
+    maximum call time is kept alongside the table so the entry to evict
+    can be found in O(log N). Heap items are not updated in place when
+    the maximum call time of an entry increases, instead a new item is
+    pushed and the stale item is skipped when it reaches the top.
+
+    """
+
+    def __init__(self):
+        self.__stats_table = {}
+        self.__heap = []
+        self.__counter = itertools.count()
+
+    def __len__(self):
+        return len(self.__stats_table)
+
+    def __contains__(self, key):
+        return key in self.__stats_table
+
+    def get(self, key, default=None):
+        return self.__stats_table.get(key, default)
+
+    def items(self):
+        return six.iteritems(self.__stats_table)
+
+    def values(self):
+        return six.itervalues(self.__stats_table)
+
+    def _push(self, key, stats):
+        heap = self.__heap
+        heappush(heap, (stats.max_call_time, next(self.__counter), key))
+
+        # Compact the heap if it has grown with too many stale items.
+
+        if len(heap) > 2 * len(self.__stats_table) + 16:
+            self.__heap = [
+                (stats.max_call_time, next(self.__counter), key) for key, stats in six.iteritems(self.__stats_table)
+            ]
+            heapify(self.__heap)
+
+    def _admit(self, max_call_time, maximum):
+        # Returns whether a new entry with the given maximum call time
+        # should be added, evicting the entry with the smallest maximum
+        # call time if the table is already full.
+
+        if len(self.__stats_table) < maximum:
+            return True
+
+        heap = self.__heap
+        table = self.__stats_table
+
+        while heap:
+            smallest, _, key = heap[0]
+            stats = table.get(key)
+            if stats is not None and stats.max_call_time == smallest:
+                break
+            heappop(heap)
+        else:
+            return False
+
+        if max_call_time <= smallest:
+            return False
+
+        heappop(heap)
+        del table[key]
+
+        return True
+
+    def merge_slow_sql_node(self, key, node, maximum):
+        """Merge data from a slow sql node object, returning the stats for
+        the entry or None if the node was not slow enough to be retained.
+
+        """
+
+        stats = self.__stats_table.get(key)
+
+        if stats is None:
+            if not self._admit(node.duration, maximum):
+                return None
+            stats = self.__stats_table[key] = SlowSqlStats()
+            previous = None
+        else:
+            previous = stats.max_call_time
+
+        stats.merge_slow_sql_node(node)
+
+        if stats.max_call_time != previous:
+            self._push(key, stats)
+
+        return stats
+
+    def merge_stats(self, key, other, maximum):
+        """Merge data from another instance of slow sql stats, returning
+        the stats for the entry or None if not slow enough to be retained.
+
+        """
+
+        stats = self.__stats_table.get(key)
+
+        if stats is None:
+            if not self._admit(other.max_call_time, maximum):
+                return None
+            stats = self.__stats_table[key] = copy.copy(other)
+            previous = None
+        else:
+            previous = stats.max_call_time
+            stats.merge_stats(other)
+
+        if stats.max_call_time != previous:
+            self._push(key, stats)
+
+        return stats
+
+
 class SampledDataSet(object):
     def __init__(self, capacity=100):
         self.pq = []
@@ -412,6 +738,9 @@ class SampledDataSet(object):
         self.num_seen = 0
 
     def should_sample(self, priority):
+        if self.capacity <= 0:
+            return False
+
         if self.heap:
             # self.pq[0] is always the minimal
             # priority sample in the queue
@@ -422,6 +751,14 @@ class SampledDataSet(object):
         # Always sample if under capacity
         return True
 
+    def discard(self):
+        """Counts a sample which was not admitted to the data set, where
+        the caller checked with should_sample() before creating it.
+
+        """
+
+        self.num_seen += 1
+
     def add(self, sample, priority=None):  # pylint: disable=E0202
         self.num_seen += 1
 
@@ -501,6 +838,90 @@ class LimitedDataSet(list):
         self.num_seen += other_data_set.num_seen - other_data_set.num_samples
 
 
+# The event data sets of a stats engine which are passed to a local
+# aggregator as part of the harvest data of a process.
+
+LOCAL_HARVEST_EVENT_TYPES = (
+    "_transaction_events",
+    "_synthetics_events",
+    "_error_events",
+    "_custom_events",
+    "_ml_events",
+    "_span_events",
+    "_log_events",
+)
+
+
+def _data_set_state(data_set):
+    if isinstance(data_set, SampledDataSet):
+        return (data_set.capacity, data_set.num_seen, list(data_set.pq))
+    return (data_set.capacity, data_set.num_seen, list(data_set))
+
+
+def _data_set_from_state(data_set_type, state):
+    capacity, num_seen, samples = state
+    data_set = data_set_type(capacity)
+    if data_set_type is SampledDataSet:
+        data_set.pq = samples
+    else:
+        data_set.extend(samples)
+    data_set.num_seen = num_seen
+    return data_set
+
+
+# The JSON for the name and scope of each metric reported, which is kept
+# across harvests as the set of metrics reported is largely the same from
+# one harvest to the next.
+
+_metric_key_json = {}
+
+METRIC_KEY_JSON_MAXIMUM = 100000
+
+_METRIC_VALUE_TYPES = (int, float)
+
+
+def metric_data_json(metric_data):
+    """Returns the JSON for the metric data returned by metric_data() of
+    the stats engine. Only the values of the metrics need to be formatted
+    where the JSON for the name and scope of the metric is cached.
+
+    """
+
+    cache = _metric_key_json
+
+    if len(cache) > METRIC_KEY_JSON_MAXIMUM:
+        cache.clear()
+
+    items = []
+
+    for key, stats in metric_data:
+        identity = (key["name"], key["scope"])
+
+        prefix = cache.get(identity)
+        if prefix is None:
+            prefix = cache[identity] = "[%s," % json_encode(key)
+
+        # The repr() of finite integers and floats is the same as their
+        # JSON. Any other values, including subclasses of integers such
+        # as booleans, are left to the JSON encoder.
+
+        values = None
+
+        if len(stats) == 6:
+            for value in stats:
+                if type(value) not in _METRIC_VALUE_TYPES or isinf(value) or isnan(value):
+                    break
+            else:
+                values = "[%r,%r,%r,%r,%r,%r]" % (stats[0], stats[1], stats[2], stats[3], stats[4], stats[5])
+
+        if values is None:
+            values = json_encode(list(stats))
+
+        items.append(prefix + values + "]")
+
+    return "[%s]" % ",".join(items)
+
+
 class StatsEngine(object):
 
     """The stats engine object holds the accumulated transactions metrics,
@@ -532,6 +953,7 @@ class StatsEngine(object):
     def __init__(self):
         self.__settings = None
         self.__stats_table = {}
+        self.__metric_limiter = None
         self.__dimensional_stats_table = DimensionalMetrics()
         self._transaction_events = SampledDataSet()
         self._error_events = SampledDataSet()
@@ -540,11 +962,14 @@ class StatsEngine(object):
         self._span_events = SampledDataSet()
         self._log_events = SampledDataSet()
         self._span_stream = None
-        self.__sql_stats_table = {}
+        self._span_retention = None
+        self.__sql_stats_table = SlowSqlTable()
         self.__slow_transaction = None
         self.__slow_transaction_map = {}
         self.__slow_transaction_old_duration = None
         self.__slow_transaction_dry_harvests = 0
+        self.__slow_transactions_by_name = SlowTransactionTable()
+        self.__slow_transaction_data = None
         self.__transaction_errors = []
         self._synthetics_events = LimitedDataSet()
         self.__synthetics_transactions = []
@@ -585,6 +1010,10 @@ class StatsEngine(object):
     def span_stream(self):
         return self._span_stream
 
+    @property
+    def span_retention(self):
+        return self._span_retention
+
     @property
     def synthetics_events(self):
         return self._synthetics_events
@@ -605,6 +1034,33 @@ class StatsEngine(object):
 
         return len(self.__stats_table) + self.__dimensional_stats_table.metrics_count()
 
+    def _record_new_metric(self, key, stats):
+        """Adds the stats for a metric which is not yet in the stats table,
+        returning the key the stats were recorded under. The stats are
+        folded into the overflow metric for the prefix of the metric name
+        where the limit on the number of unique metric names for the prefix
+        has been reached, or discarded for a scoped metric in which case
+        None is returned.
+
+        """
+
+        if self.__metric_limiter is not None:
+            name = self.__metric_limiter.metric_name(key[0], bool(key[1]))
+
+            if name is None:
+                return None
+
+            if name != key[0]:
+                key = (name, "")
+                other = self.__stats_table.get(key)
+                if other is not None:
+                    other.merge_stats(stats)
+                    return key
+
+        self.__stats_table[key] = stats
+
+        return key
+
     def record_apdex_metric(self, metric):
         """Record a single apdex metric, merging the data with any data
         from prior apdex metrics with the same name.
@@ -624,7 +1080,8 @@ class StatsEngine(object):
         stats = self.__stats_table.get(key)
         if stats is None:
             stats = ApdexStats(apdex_t=metric.apdex_t)
-            self.__stats_table[key] = stats
+            stats.merge_apdex_metric(metric)
+            return self._record_new_metric(key, stats)
         stats.merge_apdex_metric(metric)
 
         return key
@@ -665,7 +1122,7 @@ class StatsEngine(object):
                 max_call_time=metric.duration,
                 sum_of_squares=metric.duration**2,
             )
-            self.__stats_table[key] = stats
+            return self._record_new_metric(key, stats)
         else:
             stats.merge_time_metric(metric)
 
@@ -873,7 +1330,14 @@ class StatsEngine(object):
 
         attributes = {}
 
-        attributes["stack_trace"] = exception_stack(tb)
+        # The stack trace is only required where the error is retained
+        # as an error trace, so is skipped once the limit is reached.
+
+        collect_trace = settings.collect_errors and (
+            len(self.__transaction_errors) < settings.agent_limits.errors_per_harvest
+        )
+
+        attributes["stack_trace"] = exception_stack(tb) if collect_trace else []
 
         # filter custom error specific attributes using attribute filter (user)
         attributes["userAttributes"] = {}
@@ -902,7 +1366,7 @@ class StatsEngine(object):
             event = self._error_event(error_details)
             self._error_events.add(event)
 
-        if settings.collect_errors and (len(self.__transaction_errors) < settings.agent_limits.errors_per_harvest):
+        if collect_trace:
             self.__transaction_errors.append(error_details)
 
         # Regardless of whether we record the trace or the event we still
@@ -972,7 +1436,7 @@ class StatsEngine(object):
 
         stats = self.__stats_table.get(key)
         if stats is None:
-            self.__stats_table[key] = new_stats
+            return self._record_new_metric(key, new_stats)
         else:
             stats.merge_stats(new_stats)
 
@@ -1022,20 +1486,24 @@ class StatsEngine(object):
         if not self.__settings:
             return
 
-        key = node.identifier
-        stats = self.__sql_stats_table.get(key)
-        if stats is None:
-            # Only record slow SQL if not already over the limit on
-            # how many can be collected in the harvest period.
+        # Only the slowest SQL up to the limit on how many can be
+        # collected in the harvest period is retained, with the entry
+        # with the smallest maximum call time being evicted if needed.
 
-            settings = self.__settings
-            maximum = settings.agent_limits.slow_sql_data
-            if len(self.__sql_stats_table) < maximum:
-                stats = SlowSqlStats()
-                self.__sql_stats_table[key] = stats
+        key = node.identifier
+        maximum = self.__settings.agent_limits.slow_sql_data
+        stats = self.__sql_stats_table.merge_slow_sql_node(key, node, maximum)
 
         if stats:
-            stats.merge_slow_sql_node(node)
+            if stats.slow_sql_node is node:
+                prefetch_explain_plan(
+                    node.statement,
+                    node.connect_params,
+                    node.cursor_params,
+                    node.sql_parameters,
+                    node.execute_params,
+                    node.sql_format,
+                )
 
         return key
 
@@ -1127,6 +1595,9 @@ class StatsEngine(object):
 
         self.record_time_metrics(transaction.time_metrics(self))
 
+        if transaction.folded_metrics:
+            self.merge_time_metrics(transaction.folded_metrics)
+
         # Capture any errors if error collection is enabled.
         # Only retain maximum number allowed per harvest.
 
@@ -1137,7 +1608,11 @@ class StatsEngine(object):
             and settings.collect_errors
             and len(self.__transaction_errors) < settings.agent_limits.errors_per_harvest
         ):
-            self.__transaction_errors.extend(transaction.error_details())
+            # The stack traces for the errors are only formatted for
+            # those which will be retained.
+
+            remaining = settings.agent_limits.errors_per_harvest - len(self.__transaction_errors)
+            self.__transaction_errors.extend(itertools.islice(transaction.error_details(), remaining))
 
             self.__transaction_errors = self.__transaction_errors[: settings.agent_limits.errors_per_harvest]
 
@@ -1201,8 +1676,11 @@ class StatsEngine(object):
 
         if settings.distributed_tracing.enabled and settings.span_events.enabled and settings.collect_span_events:
             if settings.infinite_tracing.enabled:
-                for event in transaction.span_protos(settings):
-                    self._span_stream.put(event)
+                if self._span_retention is not None:
+                    self._span_retention.put_transaction(transaction, settings)
+                else:
+                    for event in transaction.span_protos(settings):
+                        self._span_stream.put(event)
             elif transaction.sampled:
                 for event in transaction.span_events(self.__settings):
                     self._span_events.add(event, priority=transaction.priority)
@@ -1218,15 +1696,35 @@ class StatsEngine(object):
         ):
             self._log_events.merge(transaction.log_events, priority=transaction.priority)
 
-    def record_log_event(self, message, level=None, timestamp=None, priority=None):
+    def _log_forwarding_enabled(self):
         settings = self.__settings
-        if not (
+        return (
             settings
             and settings.application_logging
             and settings.application_logging.enabled
             and settings.application_logging.forwarding
             and settings.application_logging.forwarding.enabled
-        ):
+        )
+
+    def discard_log_event(self):
+        """Counts a log event which was not recorded because it would not
+        have been retained.
+
+        """
+
+        if self._log_forwarding_enabled():
+            self._log_events.discard()
+
+    def record_log_event(self, message, level=None, timestamp=None, priority=None):
+        if not self._log_forwarding_enabled():
+            return
+
+        if priority is None:
+            # Base priority for log events outside transactions is below those inside transactions
+            priority = random.random() - 1  # nosec
+
+        if not self._log_events.should_sample(priority):
+            self._log_events.discard()
             return
 
         timestamp = timestamp if timestamp is not None else time.time()
@@ -1245,10 +1743,6 @@ class StatsEngine(object):
             attributes=get_linking_metadata(),
         )
 
-        if priority is None:
-            # Base priority for log events outside transactions is below those inside transactions
-            priority = random.random() - 1  # nosec
-
         self._log_events.add(event, priority=priority)
 
         return event
@@ -1283,6 +1777,11 @@ class StatsEngine(object):
             )
 
         if normalizer is not None:
+            # The stats are only copied where metrics are merged, as the
+            # originals must be left unchanged in case of a rollback.
+
+            merged = set()
+
             for key, value in six.iteritems(self.__stats_table):
                 normalized_name, ignored = normalizer(key[0])
                 if ignored:
@@ -1291,8 +1790,11 @@ class StatsEngine(object):
                 key = (normalized_name, key[1])
                 stats = normalized_stats.get(key)
                 if stats is None:
-                    normalized_stats[key] = copy.copy(value)
+                    normalized_stats[key] = value
                 else:
+                    if key not in merged:
+                        stats = normalized_stats[key] = copy.copy(stats)
+                        merged.add(key)
                     stats.merge_stats(value)
         else:
             normalized_stats = self.__stats_table
@@ -1403,7 +1905,7 @@ class StatsEngine(object):
 
         maximum = self.__settings.agent_limits.slow_sql_data
 
-        slow_sql_nodes = sorted(six.itervalues(self.__sql_stats_table), key=lambda x: x.max_call_time)[-maximum:]
+        slow_sql_nodes = sorted(self.__sql_stats_table.values(), key=lambda x: x.max_call_time)[-maximum:]
 
         result = []
 
@@ -1494,7 +1996,7 @@ class StatsEngine(object):
 
         # Return an empty list if no transactions were captured.
 
-        if not traces:
+        if not traces and not self.__slow_transactions_by_name:
             return []
 
         # We want to limit the number of explain plans we do across
@@ -1543,53 +2045,65 @@ class StatsEngine(object):
         # Now generate the transaction traces. We need to cap the
         # number of nodes capture to the specified limit.
 
-        trace_data = []
+        trace_data = [self._encode_transaction_trace(trace, connections) for trace in traces]
 
-        for trace in traces:
-            transaction_trace = trace.transaction_trace(self, maximum_nodes, connections)
+        # Add the slowest traces for other transaction names, which were
+        # encoded at the time they were retained.
 
-            data = [transaction_trace, list(trace.string_table.values())]
+        trace_data.extend(
+            self.__slow_transactions_by_name.trace_data(exclude_guids=set(trace.guid for trace in traces))
+        )
 
-            if self.__settings.debug.log_transaction_trace_payload:
-                _logger.debug("Encoding slow transaction data where payload=%r.", data)
+        return trace_data
 
-            json_data = json_encode(data)
+    def _encode_transaction_trace(self, trace, connections):
+        """Returns the data for a transaction trace in the form sent to
+        the data collector, with the trace itself compressed.
 
-            level = self.__settings.agent_limits.data_compression_level
-            level = level or zlib.Z_DEFAULT_COMPRESSION
+        """
 
-            zlib_data = zlib.compress(six.b(json_data), level)
+        maximum_nodes = self.__settings.agent_limits.transaction_traces_nodes
 
-            pack_data = base64.standard_b64encode(zlib_data)
+        transaction_trace = trace.transaction_trace(self, maximum_nodes, connections)
 
-            if six.PY3:
-                pack_data = pack_data.decode("Latin-1")
+        data = [transaction_trace, list(trace.string_table.values())]
 
-            root = transaction_trace.root
+        if self.__settings.debug.log_transaction_trace_payload:
+            _logger.debug("Encoding slow transaction data where payload=%r.", data)
 
-            force_persist = bool(trace.record_tt)  # Check if exists
+        json_data = json_encode(data)
 
-            if trace.include_transaction_trace_request_uri:
-                request_uri = trace.request_uri
-            else:
-                request_uri = None
-
-            trace_data.append(
-                [
-                    transaction_trace.start_time,
-                    root.end_time - root.start_time,
-                    trace.path,
-                    request_uri,
-                    pack_data,
-                    trace.guid,
-                    None,
-                    force_persist,
-                    None,
-                    trace.synthetics_resource_id,
-                ]
-            )
+        level = self.__settings.agent_limits.data_compression_level
+        level = level or zlib.Z_DEFAULT_COMPRESSION
 
-        return trace_data
+        zlib_data = zlib.compress(six.b(json_data), level)
+
+        pack_data = base64.standard_b64encode(zlib_data)
+
+        if six.PY3:
+            pack_data = pack_data.decode("Latin-1")
+
+        root = transaction_trace.root
+
+        force_persist = bool(trace.record_tt)  # Check if exists
+
+        if trace.include_transaction_trace_request_uri:
+            request_uri = trace.request_uri
+        else:
+            request_uri = None
+
+        return [
+            transaction_trace.start_time,
+            root.end_time - root.start_time,
+            trace.path,
+            request_uri,
+            pack_data,
+            trace.guid,
+            None,
+            force_persist,
+            None,
+            trace.synthetics_resource_id,
+        ]
 
     def slow_transaction_data(self):
         """Returns a list containing any slow transaction data collected
@@ -1655,8 +2169,10 @@ class StatsEngine(object):
         """
 
         self.__settings = settings
-        self.__sql_stats_table = {}
+        self.__sql_stats_table = SlowSqlTable()
         self.__slow_transaction = None
+        self.__slow_transactions_by_name = SlowTransactionTable()
+        self.__slow_transaction_data = None
         self.__slow_transaction_map = {}
         self.__slow_transaction_old_duration = None
         self.__transaction_errors = []
@@ -1675,6 +2191,10 @@ class StatsEngine(object):
             self._span_stream = StreamBuffer(
                 settings.infinite_tracing.span_queue_size, batching=settings.infinite_tracing.batching
             )
+            if settings.infinite_tracing.tail_sampling.enabled:
+                self._span_retention = SpanRetentionBuffer(self._span_stream, settings)
+            else:
+                self._span_retention = None
 
     def reset_metric_stats(self):
         """Resets the accumulated statistics back to initial state for
@@ -1682,8 +2202,28 @@ class StatsEngine(object):
 
         """
 
+        self._reset_metric_tables()
+
+    def _reset_metric_tables(self):
+        # The dimensional metrics table is replaced rather than cleared as
+        # the same table would otherwise be shared with a copy of the stats
+        # engine made by create_workarea().
+
         self.__stats_table = {}
-        self.__dimensional_stats_table.reset_metric_stats()
+
+        if self.__settings is not None:
+            agent_limits = self.__settings.agent_limits
+            names_maximum = agent_limits.metric_names_maximum
+            tag_sets_maximum = agent_limits.metric_tag_sets_maximum
+
+            self.__metric_limiter = MetricCardinalityLimiter(names_maximum, tag_sets_maximum, self.__stats_table)
+            self.__dimensional_stats_table = DimensionalMetrics(
+                MetricCardinalityLimiter(names_maximum, tag_sets_maximum, self.__stats_table)
+            )
+
+        else:
+            self.__metric_limiter = None
+            self.__dimensional_stats_table = DimensionalMetrics()
 
     def reset_transaction_events(self):
         """Resets the accumulated statistics back to initial state for
@@ -1772,11 +2312,14 @@ class StatsEngine(object):
                 self.__slow_transaction_old_duration = None
 
         self.__slow_transaction = None
+        self.__slow_transactions_by_name = SlowTransactionTable()
+        self.__slow_transaction_data = None
         self.__synthetics_transactions = []
-        self.__sql_stats_table = {}
-        self.__stats_table = {}
+        self.__sql_stats_table = SlowSqlTable()
         self.__transaction_errors = []
 
+        self._reset_metric_tables()
+
     def harvest_snapshot(self, flexible=False):
         """Creates a snapshot of the accumulated statistics, error
         details and slow transaction and returns it. This is a shallow
@@ -1835,6 +2378,33 @@ class StatsEngine(object):
 
         return stats
 
+    def encode_slow_transaction(self, stats_engine):
+        """Encodes the slowest transaction recorded in this work area if it
+        could be retained as the slowest for its name by the stats engine
+        it will be merged into. This is called before the lock on that
+        stats engine is taken, so that the encoding does not hold up other
+        transactions being merged. As the check is made without the lock
+        it is repeated when merging.
+
+        """
+
+        maximum = self.__settings.agent_limits.slow_transaction_names
+        transaction = self.__slow_transaction
+
+        if not maximum or not transaction:
+            return
+
+        try:
+            retain = stats_engine.__slow_transactions_by_name.should_retain(
+                transaction.path, transaction.duration, maximum
+            )
+        except RuntimeError:
+            # The table was changed by another thread while being read.
+            retain = True
+
+        if retain:
+            self.__slow_transaction_data = self._encode_transaction_trace(transaction, None)
+
     def merge(self, snapshot):
         """Merges data from a single transaction. Snapshot is an instance of
         StatsEngine that contains stats for the single transaction.
@@ -1892,10 +2462,12 @@ class StatsEngine(object):
         for key, other in six.iteritems(snapshot.__stats_table):
             stats = self.__stats_table.get(key)
             if not stats:
-                self.__stats_table[key] = other
+                self._record_new_metric(key, other)
             else:
                 stats.merge_stats(other)
 
+        self.merge_dimensional_metrics(snapshot.__dimensional_stats_table.metrics())
+
     def _merge_transaction_events(self, snapshot, rollback=False):
         # Merge in transaction events. In the normal case snapshot is a
         # StatsEngine from a single transaction, and should only have one
@@ -1974,17 +2546,14 @@ class StatsEngine(object):
 
     def _merge_sql(self, snapshot):
         # Add sql traces to the set of existing entries. If over
-        # the limit of how many to collect, only merge in if already
-        # seen the specific SQL.
+        # the limit of how many to collect, new SQL is only merged
+        # in if slower than the fastest SQL already seen, which is
+        # then dropped.
 
-        for key, slow_sql_stats in six.iteritems(snapshot.__sql_stats_table):
-            stats = self.__sql_stats_table.get(key)
-            if not stats:
-                maximum = self.__settings.agent_limits.slow_sql_data
-                if len(self.__sql_stats_table) < maximum:
-                    self.__sql_stats_table[key] = copy.copy(slow_sql_stats)
-            else:
-                stats.merge_stats(slow_sql_stats)
+        maximum = self.__settings.agent_limits.slow_sql_data
+
+        for key, slow_sql_stats in snapshot.__sql_stats_table.items():
+            self.__sql_stats_table.merge_stats(key, slow_sql_stats, maximum)
 
     def _merge_traces(self, snapshot):
         # Limit number of Synthetics transactions
@@ -2002,6 +2571,32 @@ class StatsEngine(object):
 
             self._update_slow_transaction(transaction)
 
+        maximum = self.__settings.agent_limits.slow_transaction_names
+
+        if maximum:
+            self.__slow_transactions_by_name.merge(snapshot.__slow_transactions_by_name, maximum)
+
+            # The slowest transaction from a single transaction work area
+            # was encoded by encode_slow_transaction() before the lock was
+            # taken, if it could be retained at that point. Where it was
+            # not, the table has since changed, such as at a harvest, and
+            # the trace is dropped rather than encoded here.
+
+            data = snapshot.__slow_transaction_data
+
+            if (
+                transaction
+                and data is not None
+                and self.__slow_transactions_by_name.should_retain(transaction.path, transaction.duration, maximum)
+            ):
+                self.__slow_transactions_by_name.add(
+                    transaction.path,
+                    transaction.duration,
+                    transaction.guid,
+                    data,
+                    maximum,
+                )
+
     def merge_custom_metrics(self, metrics):
         """Merges in a set of custom metrics. The metrics should be
         provide as an iterable where each item is a tuple of the metric
@@ -2016,7 +2611,24 @@ class StatsEngine(object):
             key = (name, "")
             stats = self.__stats_table.get(key)
             if not stats:
-                self.__stats_table[key] = other
+                self._record_new_metric(key, other)
+            else:
+                stats.merge_stats(other)
+
+    def merge_time_metrics(self, metrics):
+        """Merges in a set of accumulated time metrics. The metrics should
+        be provided as an iterable where each item is a tuple of the metric
+        name and scope, and the accumulated stats for the metric.
+
+        """
+
+        if not self.__settings:
+            return
+
+        for key, other in metrics:
+            stats = self.__stats_table.get(key)
+            if not stats:
+                self._record_new_metric(key, other)
             else:
                 stats.merge_stats(other)
 
@@ -2031,17 +2643,66 @@ class StatsEngine(object):
         if not self.__settings:
             return
 
+        limiter = self.__dimensional_stats_table.limiter
+
         for key, other in metrics:
             stats_container = self.__dimensional_stats_table.get(key)
+            if not stats_container and limiter is not None:
+                key = limiter.metric_name(key)
+                stats_container = self.__dimensional_stats_table.get(key)
+
             if not stats_container:
-                self.__dimensional_stats_table[key] = other
-            else:
-                for tags, other_value in other.items():
+                if limiter is None or not limiter.tag_sets_maximum or len(other) <= limiter.tag_sets_maximum:
+                    self.__dimensional_stats_table[key] = other
+                    continue
+                stats_container = self.__dimensional_stats_table[key] = {}
+
+            for tags, other_value in other.items():
+                stats = stats_container.get(tags)
+                if not stats and limiter is not None:
+                    tags = limiter.tag_set(tags, len(stats_container))
                     stats = stats_container.get(tags)
-                    if not stats:
-                        stats_container[tags] = other_value
-                    else:
-                        stats.merge_stats(other_value)
+                if not stats:
+                    stats_container[tags] = other_value
+                else:
+                    stats.merge_stats(other_value)
+
+    def local_harvest_data(self):
+        """Returns the metric data, event data sets and error details of a
+        harvest snapshot as plain data which can be pickled, for passing
+        to a local aggregator process. Slow SQL and transaction traces are
+        not included as they are dependent on state local to the process.
+
+        """
+
+        return {
+            "metrics": list(six.iteritems(self.__stats_table)),
+            "dimensional_metrics": list(self.__dimensional_stats_table.metrics()),
+            "errors": list(self.__transaction_errors),
+            "events": dict((name, _data_set_state(getattr(self, name))) for name in LOCAL_HARVEST_EVENT_TYPES),
+        }
+
+    def merge_local_harvest_data(self, data):
+        """Merges the harvest data of another process as returned by
+        local_harvest_data(). Unlike merge(), the event data sets will
+        generally hold many samples, which are merged the same as when
+        performing a rollback.
+
+        """
+
+        if not self.__settings:
+            return
+
+        self.merge_time_metrics(data["metrics"])
+        self.merge_dimensional_metrics(data["dimensional_metrics"])
+
+        for name, state in six.iteritems(data["events"]):
+            data_set = getattr(self, name)
+            data_set.merge(_data_set_from_state(type(data_set), state))
+
+        maximum = self.__settings.agent_limits.errors_per_harvest
+        self.__transaction_errors.extend(data["errors"])
+        self.__transaction_errors = self.__transaction_errors[:maximum]
 
     def _snapshot(self):
         copy = object.__new__(StatsEngineSnapshot)
@@ -12,6 +12,24 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import os
+import threading
+
+from newrelic.core.config import global_settings
+from newrelic.packages import six
+
+_INTERNABLE_TYPES = (six.text_type, six.binary_type)
+
+
+def _encoded_size(value):
+    # The size of the string when encoded as UTF-8, which is how it is
+    # sent to the data collector.
+
+    if isinstance(value, six.binary_type):
+        return len(value)
+    return len(value.encode("utf-8", "replace"))
+
+
 class StringTable(object):
 
     def __init__(self):
@@ -27,3 +45,107 @@ class StringTable(object):
 
     def values(self):
         return self.__values
+
+
+class InternPool(object):
+
+    """A process wide pool of strings, so that equal strings recorded by
+    different transactions, such as names and attribute keys held in
+    the event reservoirs, share a single object. The pool is cleared
+    when it reaches its maximum number of entries, rather than tracking
+    which entries are least used. A maximum of 0 disables the pool.
+
+    """
+
+    def __init__(self, maximum=10000):
+        self.maximum = maximum
+        self._pool = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+        # These counts are updated without holding the lock so may be
+        # slightly under counted when strings are interned concurrently.
+
+        self._hits = 0
+        self._misses = 0
+        self._resets = 0
+
+    def intern(self, value):
+        try:
+            result = self._pool[value]
+        except KeyError:
+            pass
+        except TypeError:
+            return value
+        else:
+            self._hits += 1
+            return result
+
+        if not self.maximum or type(value) not in _INTERNABLE_TYPES:
+            return value
+
+        size = _encoded_size(value)
+
+        with self._lock:
+            if len(self._pool) >= self.maximum:
+                self._pool = {}
+                self._bytes = 0
+                self._resets += 1
+
+            result = self._pool.setdefault(value, value)
+            if result is value:
+                self._bytes += size
+
+        self._misses += 1
+        return result
+
+    def __len__(self):
+        return len(self._pool)
+
+    def stats(self):
+        """Returns the number of hits, misses and resets since the last
+        call, along with the current number of entries and the total
+        size in bytes of the strings in the pool when encoded as UTF-8.
+
+        """
+
+        with self._lock:
+            hits, misses, resets = self._hits, self._misses, self._resets
+            self._hits, self._misses, self._resets = 0, 0, 0
+            entries, size = len(self._pool), self._bytes
+
+        return hits, misses, resets, entries, size
+
+    def clear(self):
+        with self._lock:
+            self._pool = {}
+            self._bytes = 0
+
+    def _after_fork_in_child(self):
+        # The lock may have been held by another thread at the time of the
+        # fork, in which case it would never be released in the child.
+
+        self._lock = threading.Lock()
+
+
+_intern_pool = InternPool()
+
+
+def _after_fork_in_child():
+    # As with the agent, the state of the pool is only reset in a child
+    # process where fork handling has been enabled.
+
+    if global_settings().fork_handling.enabled:
+        _intern_pool._after_fork_in_child()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_after_fork_in_child)
+
+
+def intern_pool():
+    return _intern_pool
+
+
+def intern_string(value):
+    return _intern_pool.intern(value)
@@ -391,9 +391,22 @@ class TraceCache(MutableMapping):
                 guid=guid,
             )
             transaction = root.transaction
-            transaction._process_node(node)
-            root.increment_child_count()
-            root.add_child(node)
+            if transaction._process_node(node):
+                root.increment_child_count()
+                root.add_child(node)
+
+    def reset_after_fork(self):
+        """Discards the traces for all threads other than the current
+        thread, for use in a child process after a fork where only the
+        thread which called fork() will exist.
+
+        """
+
+        current = thread.get_ident()
+
+        for key in list(self._cache.keys()):
+            if key != current:
+                self._cache.pop(key, None)
 
     # MutableMapping methods
 
@@ -31,7 +31,8 @@ from newrelic.core.attribute_filter import (
     DST_TRANSACTION_TRACER,
 )
 from newrelic.core.metric import ApdexMetric, TimeMetric
-from newrelic.core.string_table import StringTable
+from newrelic.core.stack_trace import format_exception_stack
+from newrelic.core.string_table import StringTable, intern_string
 
 try:
     from newrelic.core.infinite_tracing_pb2 import Span
@@ -117,6 +118,7 @@ class TransactionNode(_TransactionNode):
     def __new__(cls, *args, **kwargs):
         node = _TransactionNode.__new__(cls, *args, **kwargs)
         node.include_transaction_trace_request_uri = False
+        node.folded_metrics = ()
         return node
 
     def __hash__(self):
@@ -331,7 +333,7 @@ class TransactionNode(_TransactionNode):
 
         for error in self.errors:
             params = {}
-            params["stack_trace"] = error.stack_trace
+            params["stack_trace"] = format_exception_stack(error.stack_trace)
 
             intrinsics = {"spanId": error.span_id, "error.expected": error.expected}
             intrinsics.update(self.trace_intrinsics)
@@ -470,7 +472,7 @@ class TransactionNode(_TransactionNode):
         intrinsics = self._event_intrinsics(stats_table)
 
         intrinsics["type"] = "Transaction"
-        intrinsics["name"] = self.path
+        intrinsics["name"] = intern_string(self.path)
         intrinsics["totalTime"] = self.total_time
 
         def _add_if_not_empty(key, value):
@@ -555,7 +557,7 @@ class TransactionNode(_TransactionNode):
         intrinsics["error.class"] = error.type
         intrinsics["error.message"] = error.message
         intrinsics["error.expected"] = error.expected
-        intrinsics["transactionName"] = self.path
+        intrinsics["transactionName"] = intern_string(self.path)
         intrinsics["spanId"] = error.span_id
 
         intrinsics["nr.transactionGuid"] = self.guid
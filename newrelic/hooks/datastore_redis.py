@@ -14,11 +14,13 @@
 
 import re
 
-from newrelic.api.datastore_trace import DatastoreTrace, DatastoreTraceWrapper, wrap_datastore_trace
+from newrelic.api.datastore_trace import DatastoreTrace, DatastoreTraceWrapper
 from newrelic.api.time_trace import current_trace
 from newrelic.api.transaction import current_transaction
 from newrelic.common.object_wrapper import wrap_function_wrapper
 from newrelic.common.async_wrapper import coroutine_wrapper, async_generator_wrapper, generator_wrapper
+from newrelic.common.async_wrapper import async_wrapper as get_async_wrapper
+from newrelic.core.attribute import truncate
 
 _redis_client_sync_methods = {
     "acl_dryrun",
@@ -487,6 +489,12 @@ _redis_multipart_commands = set(["client", "cluster", "command", "config", "debu
 
 _redis_operation_re = re.compile(r"[-\s]+")
 
+# Pipeline classes for which commands are counted rather than traced as
+# they are queued when pipeline mode is enabled. Populated as the client
+# modules are instrumented.
+
+_redis_pipeline_classes = ()
+
 
 def _conn_attrs_to_dict(connection):
     return {
@@ -505,6 +513,79 @@ def _instance_info(kwargs):
     return (host, port_path_or_id, db)
 
 
+def _connection_instance_info(connection):
+    # The instance info is cached on the connection, and is cleared
+    # whenever the connection is (re)connected.
+
+    info = getattr(connection, "_nr_instance_info", None)
+    if info is None:
+        info = _instance_info(_conn_attrs_to_dict(connection))
+        try:
+            connection._nr_instance_info = info
+        except Exception:
+            pass
+    return info
+
+
+def _instance_reporting_enabled(transaction):
+    dt = transaction.settings.datastore_tracer
+    return dt.instance_reporting.enabled or dt.database_name_reporting.enabled
+
+
+def _queue_pipeline_operation(instance, operation):
+    # Returns True if the operation was counted against the pipeline,
+    # in which case it should not be traced separately. Commands run
+    # while a pipeline is watching keys are executed immediately, so are
+    # still traced.
+
+    transaction = current_transaction()
+    if transaction is None or not transaction.settings.datastore_tracer.pipeline_mode.enabled:
+        return False
+
+    if getattr(instance, "watching", False):
+        return False
+
+    operations = getattr(instance, "_nr_pipeline_operations", None)
+    if operations is None:
+        operations = instance._nr_pipeline_operations = {}
+    operations[operation] = operations.get(operation, 0) + 1
+
+    return True
+
+
+def _pipeline_trace(instance, transaction, source):
+    operations = getattr(instance, "_nr_pipeline_operations", None)
+    instance._nr_pipeline_operations = None
+
+    if not operations:
+        return None
+
+    host, port_path_or_id, db = (None, None, None)
+
+    try:
+        if _instance_reporting_enabled(transaction):
+            host, port_path_or_id, db = _instance_info(instance.connection_pool.connection_kwargs)
+    except Exception:
+        pass
+
+    trace = DatastoreTrace(
+        product="Redis",
+        target=None,
+        operation="pipeline",
+        host=host,
+        port_path_or_id=port_path_or_id,
+        database_name=db,
+        source=source,
+    )
+    # The histogram of queued operations is reported as a string of the
+    # form "get:2,set:1".
+
+    histogram = ",".join("%s:%d" % item for item in sorted(operations.items()))
+    trace._add_agent_attribute("redis.pipeline.operations", truncate(histogram))
+
+    return trace
+
+
 def _wrap_Redis_method_wrapper_(module, instance_class_name, operation):
     name = "%s.%s" % (instance_class_name, operation)
     if operation in _redis_client_gen_methods:
@@ -512,7 +593,31 @@ def _wrap_Redis_method_wrapper_(module, instance_class_name, operation):
     else:
         async_wrapper = None
 
-    wrap_datastore_trace(module, name, product="Redis", target=None, operation=operation, async_wrapper=async_wrapper)
+    # The trace is created directly rather than through a datastore trace
+    # wrapper, so that checking for pipeline operations does not add a
+    # further wrapper to the call of each command.
+
+    def _nr_wrapper_Redis_method_(wrapped, instance, args, kwargs):
+        if isinstance(instance, _redis_pipeline_classes) and _queue_pipeline_operation(instance, operation):
+            return wrapped(*args, **kwargs)
+
+        wrapper = async_wrapper if async_wrapper is not None else get_async_wrapper(wrapped)
+        if not wrapper:
+            parent = current_trace()
+            if not parent:
+                return wrapped(*args, **kwargs)
+        else:
+            parent = None
+
+        trace = DatastoreTrace("Redis", None, operation, parent=parent, source=wrapped)
+
+        if wrapper:
+            return wrapper(wrapped, trace)(*args, **kwargs)
+
+        with trace:
+            return wrapped(*args, **kwargs)
+
+    wrap_function_wrapper(module, name, _nr_wrapper_Redis_method_)
 
 
 def _wrap_asyncio_Redis_method_wrapper(module, instance_class_name, operation):
@@ -520,6 +625,7 @@ def _wrap_asyncio_Redis_method_wrapper(module, instance_class_name, operation):
         from redis.asyncio.client import Pipeline
 
         if isinstance(instance, Pipeline):
+            _queue_pipeline_operation(instance, operation)
             return wrapped(*args, **kwargs)
 
         # Method should be run when awaited or iterated, therefore we wrap in an async wrapper.
@@ -542,10 +648,8 @@ async def wrap_async_Connection_send_command(wrapped, instance, args, kwargs):
     host, port_path_or_id, db = (None, None, None)
 
     try:
-        dt = transaction.settings.datastore_tracer
-        if dt.instance_reporting.enabled or dt.database_name_reporting.enabled:
-            conn_kwargs = _conn_attrs_to_dict(instance)
-            host, port_path_or_id, db = _instance_info(conn_kwargs)
+        if _instance_reporting_enabled(transaction):
+            host, port_path_or_id, db = _connection_instance_info(instance)
     except Exception:
         pass
 
@@ -561,16 +665,17 @@ async def wrap_async_Connection_send_command(wrapped, instance, args, kwargs):
     if (
         operation.split()[0] not in _redis_multipart_commands
     ):  # Set the datastore info on the DatastoreTrace containing this function call.
-        trace = current_trace()
+        if host is not None or db is not None:
+            trace = current_trace()
 
-        # Find DatastoreTrace no matter how many other traces are inbetween
-        while trace is not None and not isinstance(trace, DatastoreTrace):
-            trace = getattr(trace, "parent", None)
+            # Find DatastoreTrace no matter how many other traces are inbetween
+            while trace is not None and not isinstance(trace, DatastoreTrace):
+                trace = getattr(trace, "parent", None)
 
-        if trace is not None:
-            trace.host = host
-            trace.port_path_or_id = port_path_or_id
-            trace.database_name = db
+            if trace is not None:
+                trace.host = host
+                trace.port_path_or_id = port_path_or_id
+                trace.database_name = db
 
         return await wrapped(*args, **kwargs)
 
@@ -596,22 +701,23 @@ def _nr_Connection_send_command_wrapper_(wrapped, instance, args, kwargs):
     host, port_path_or_id, db = (None, None, None)
 
     try:
-        dt = transaction.settings.datastore_tracer
-        if dt.instance_reporting.enabled or dt.database_name_reporting.enabled:
-            conn_kwargs = _conn_attrs_to_dict(instance)
-            host, port_path_or_id, db = _instance_info(conn_kwargs)
+        if _instance_reporting_enabled(transaction):
+            host, port_path_or_id, db = _connection_instance_info(instance)
     except:
         pass
 
-    # Find DatastoreTrace no matter how many other traces are inbetween
-    trace = current_trace()
-    while trace is not None and not isinstance(trace, DatastoreTrace):
-        trace = getattr(trace, "parent", None)
+    # Find DatastoreTrace no matter how many other traces are inbetween.
+    # There is nothing to set on it if instance reporting is disabled.
 
-    if trace is not None:
-        trace.host = host
-        trace.port_path_or_id = port_path_or_id
-        trace.database_name = db
+    if host is not None or db is not None:
+        trace = current_trace()
+        while trace is not None and not isinstance(trace, DatastoreTrace):
+            trace = getattr(trace, "parent", None)
+
+        if trace is not None:
+            trace.host = host
+            trace.port_path_or_id = port_path_or_id
+            trace.database_name = db
 
     # Older Redis clients would when sending multi part commands pass
     # them in as separate arguments to send_command(). Need to therefore
@@ -644,6 +750,59 @@ def _nr_Connection_send_command_wrapper_(wrapped, instance, args, kwargs):
         return wrapped(*args, **kwargs)
 
 
+def _nr_Connection_connect_wrapper_(wrapped, instance, args, kwargs):
+    instance._nr_instance_info = None
+    return wrapped(*args, **kwargs)
+
+
+def _nr_Pipeline_execute_wrapper_(wrapped, instance, args, kwargs):
+    transaction = current_transaction()
+    if transaction is None:
+        instance._nr_pipeline_operations = None
+        return wrapped(*args, **kwargs)
+
+    trace = _pipeline_trace(instance, transaction, wrapped)
+    if trace is None:
+        return wrapped(*args, **kwargs)
+
+    with trace:
+        return wrapped(*args, **kwargs)
+
+
+async def wrap_async_Pipeline_execute(wrapped, instance, args, kwargs):
+    transaction = current_transaction()
+    if transaction is None:
+        instance._nr_pipeline_operations = None
+        return await wrapped(*args, **kwargs)
+
+    trace = _pipeline_trace(instance, transaction, wrapped)
+    if trace is None:
+        return await wrapped(*args, **kwargs)
+
+    with trace:
+        return await wrapped(*args, **kwargs)
+
+
+def _nr_Pipeline_reset_wrapper_(wrapped, instance, args, kwargs):
+    instance._nr_pipeline_operations = None
+    return wrapped(*args, **kwargs)
+
+
+def _instrument_redis_pipeline(module, class_name, execute_wrapper):
+    global _redis_pipeline_classes
+
+    if hasattr(module, class_name):
+        class_ = getattr(module, class_name)
+        if class_ not in _redis_pipeline_classes:
+            _redis_pipeline_classes += (class_,)
+
+        if hasattr(class_, "execute"):
+            wrap_function_wrapper(module, "%s.execute" % class_name, execute_wrapper)
+
+        if hasattr(class_, "reset"):
+            wrap_function_wrapper(module, "%s.reset" % class_name, _nr_Pipeline_reset_wrapper_)
+
+
 def instrument_redis_client(module):
     if hasattr(module, "StrictRedis"):
         for name in _redis_client_methods:
@@ -655,6 +814,8 @@ def instrument_redis_client(module):
             if name in vars(module.Redis):
                 _wrap_Redis_method_wrapper_(module, "Redis", name)
 
+    _instrument_redis_pipeline(module, "Pipeline", _nr_Pipeline_execute_wrapper_)
+
 
 def instrument_asyncio_redis_client(module):
     if hasattr(module, "Redis"):
@@ -663,6 +824,14 @@ def instrument_asyncio_redis_client(module):
             if hasattr(class_, operation):
                 _wrap_asyncio_Redis_method_wrapper(module, "Redis", operation)
 
+    if getattr(module, "__name__", None) == "redis.asyncio.client":
+        _instrument_redis_pipeline(module, "Pipeline", wrap_async_Pipeline_execute)
+
+
+def instrument_redis_cluster(module):
+    _instrument_redis_pipeline(module, "ClusterPipeline", _nr_Pipeline_execute_wrapper_)
+
+
 def instrument_redis_commands_core(module):
     _instrument_redis_commands_module(module, "CoreCommands")
 
@@ -712,8 +881,14 @@ def instrument_redis_connection(module):
         if hasattr(module.Connection, "send_command"):
             wrap_function_wrapper(module, "Connection.send_command", _nr_Connection_send_command_wrapper_)
 
+        if hasattr(module.Connection, "connect"):
+            wrap_function_wrapper(module, "Connection.connect", _nr_Connection_connect_wrapper_)
+
 
 def instrument_asyncio_redis_connection(module):
     if hasattr(module, "Connection"):
         if hasattr(module.Connection, "send_command"):
             wrap_function_wrapper(module, "Connection.send_command", wrap_async_Connection_send_command)
+
+        if hasattr(module.Connection, "connect"):
+            wrap_function_wrapper(module, "Connection.connect", _nr_Connection_connect_wrapper_)
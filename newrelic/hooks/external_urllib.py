@@ -12,16 +12,12 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-try:
-    import urlparse
-except ImportError:
-    import urllib.parse as urlparse
-
 import newrelic.packages.six as six
 
 from newrelic.api.external_trace import ExternalTraceWrapper
 from newrelic.api.transaction import current_transaction
 from newrelic.common.object_wrapper import wrap_function_wrapper
+from newrelic.core.external_node import external_url
 
 def _nr_wrapper_factory(bind_params_fn, library):
     # Wrapper functions will be similar for monkeypatching the different
@@ -42,7 +38,7 @@ def _nr_wrapper_factory(bind_params_fn, library):
 
         url = bind_params_fn(*args, **kwargs)
 
-        details = urlparse.urlparse(url)
+        details = external_url(url)
 
         if details.hostname is None:
             return wrapped(*args, **kwargs)
@@ -12,16 +12,12 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-try:
-    import urlparse
-except ImportError:
-    import urllib.parse as urlparse
-
 import newrelic.packages.six as six
 
 from newrelic.api.external_trace import ExternalTraceWrapper
 from newrelic.api.transaction import current_transaction
 from newrelic.common.object_wrapper import wrap_function_wrapper
+from newrelic.core.external_node import external_url
 
 def _nr_wrapper_opener_director_open_(wrapped, instance, args, kwargs):
     transaction = current_transaction()
@@ -37,7 +33,7 @@ def _nr_wrapper_opener_director_open_(wrapped, instance, args, kwargs):
 
     url = _bind_params(*args, **kwargs)
 
-    details = urlparse.urlparse(url)
+    details = external_url(url)
 
     if details.hostname is None:
         return wrapped(*args, **kwargs)
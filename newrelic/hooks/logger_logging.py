@@ -13,7 +13,7 @@
 # limitations under the License.
 
 from newrelic.api.application import application_instance
-from newrelic.api.time_trace import get_linking_metadata
+from newrelic.api.time_trace import _linking_metadata
 from newrelic.api.transaction import current_transaction, record_log_event
 from newrelic.common.object_wrapper import function_wrapper, wrap_function_wrapper
 from newrelic.core.config import global_settings
@@ -24,15 +24,46 @@ except ImportError:
     from urllib.parse import quote
 
 
+# The decoration derived from the service linking metadata, keyed by the
+# id() of the metadata. Each entry holds a reference to the metadata, so
+# the id cannot be reused by another object while it is cached.
+
+_linking_decoration_cache = {}
+
+_LINKING_DECORATION_CACHE_MAXIMUM = 100
+
+
+def _linking_decoration(service_metadata):
+    # The service linking metadata is shared until the settings change,
+    # so the parts of the decoration derived from it are only rebuilt
+    # when a different metadata object is returned.
+
+    cache = _linking_decoration_cache.get(id(service_metadata))
+    if cache is None:
+        prefix = "|".join(
+            (
+                "NR-LINKING",
+                service_metadata.get("entity.guid", ""),
+                service_metadata.get("hostname", ""),
+            )
+        )
+        entity_name = quote(service_metadata.get("entity.name", ""))
+        cache = (service_metadata, prefix, entity_name)
+
+        if len(_linking_decoration_cache) >= _LINKING_DECORATION_CACHE_MAXIMUM:
+            _linking_decoration_cache.clear()
+        _linking_decoration_cache[id(service_metadata)] = cache
+
+    return cache[1], cache[2]
+
+
 def add_nr_linking_metadata(message):
-    available_metadata = get_linking_metadata()
-    entity_name = quote(available_metadata.get("entity.name", ""))
-    entity_guid = available_metadata.get("entity.guid", "")
-    span_id = available_metadata.get("span.id", "")
-    trace_id = available_metadata.get("trace.id", "")
-    hostname = available_metadata.get("hostname", "")
-
-    nr_linking_str = "|".join(("NR-LINKING", entity_guid, hostname, trace_id, span_id, entity_name))
+    service_metadata, trace_metadata = _linking_metadata()
+    prefix, entity_name = _linking_decoration(service_metadata)
+    span_id = trace_metadata.get("span.id", "")
+    trace_id = trace_metadata.get("trace.id", "")
+
+    nr_linking_str = "|".join((prefix, trace_id, span_id, entity_name))
     return "%s %s|" % (message, nr_linking_str)
 
 
@@ -74,8 +105,11 @@ def wrap_callHandlers(wrapped, instance, args, kwargs):
 
         if settings.application_logging.forwarding and settings.application_logging.forwarding.enabled:
             try:
-                message = record.getMessage()
-                record_log_event(message, level_name, int(record.created * 1000))
+                # The message is only formatted if the log event is
+                # retained, as most are discarded once the reservoir for
+                # log events has filled.
+
+                record_log_event(record.getMessage, level_name, int(record.created * 1000))
             except Exception:
                 pass
 
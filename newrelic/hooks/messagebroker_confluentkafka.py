@@ -23,6 +23,12 @@ from newrelic.api.time_trace import notice_error
 from newrelic.api.transaction import current_transaction
 from newrelic.common.object_wrapper import function_wrapper, wrap_function_wrapper
 from newrelic.common.package_version_utils import get_package_version
+from newrelic.hooks.messagebroker_kafka_common import (
+    KafkaMessage,
+    consume_batch,
+    message_size,
+    should_record_batch,
+)
 
 _logger = logging.getLogger(__name__)
 
@@ -130,7 +136,7 @@ def wrap_Consumer_poll(wrapped, instance, args, kwargs):
         library = "Kafka"
         destination_type = "Topic"
         destination_name = record.topic()
-        received_bytes = len(str(record.value()).encode("utf-8"))
+        received_bytes = message_size(record.value())
         message_count = 1
 
         headers = record.headers()
@@ -169,6 +175,38 @@ def wrap_Consumer_poll(wrapped, instance, args, kwargs):
     return record
 
 
+def wrap_Consumer_consume(wrapped, instance, args, kwargs):
+    if hasattr(instance, "_nr_transaction") and not instance._nr_transaction.stopped:
+        instance._nr_transaction.__exit__(*sys.exc_info())
+
+    try:
+        records = wrapped(*args, **kwargs)
+    except Exception:
+        if current_transaction():
+            notice_error()
+        else:
+            notice_error(application=application_instance(activate=False))
+        raise
+
+    if records and should_record_batch():
+        messages = [
+            KafkaMessage(
+                topic=record.topic(),
+                key=record.key(),
+                headers=record.headers(),
+                size=message_size(record.value()),
+                partition=record.partition(),
+                offset=record.offset(),
+            )
+            for record in records
+            if not record.error()
+        ]
+
+        consume_batch(instance, wrapped, messages, "Confluent-Kafka", get_package_version("confluent-kafka"))
+
+    return records
+
+
 def wrap_DeserializingConsumer_poll(wrapped, instance, args, kwargs):
     try:
         return wrapped(*args, **kwargs)
@@ -232,6 +270,7 @@ def instrument_confluentkafka_cimpl(module):
     if hasattr(module, "Consumer"):
         wrap_immutable_class(module, "Consumer")
         wrap_function_wrapper(module, "Consumer.poll", wrap_Consumer_poll)
+        wrap_function_wrapper(module, "Consumer.consume", wrap_Consumer_consume)
 
 
 def instrument_confluentkafka_serializing_producer(module):
@@ -0,0 +1,139 @@
+# Copyright 2010 New Relic, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Helpers shared by the kafka-python and confluent-kafka consumer
+instrumentation for measuring messages and for reporting messages
+received as a batch.
+
+"""
+
+from collections import OrderedDict, namedtuple
+
+from newrelic.api.application import application_instance
+from newrelic.api.message_transaction import MessageTransaction
+from newrelic.api.transaction import current_transaction
+from newrelic.core.config import global_settings
+
+KafkaMessage = namedtuple("KafkaMessage", ["topic", "key", "headers", "size", "partition", "offset"])
+
+
+def message_size(value):
+    """Returns the size in bytes of a message value. The size of bytes
+    like values is obtained without copying them, with other values being
+    converted to a string and encoded as a fallback.
+
+    """
+
+    if value is None:
+        return 0
+
+    if isinstance(value, memoryview):
+        return value.nbytes
+
+    if isinstance(value, (bytes, bytearray)):
+        return len(value)
+
+    return len(str(value).encode("utf-8"))
+
+
+def batch_mode_enabled():
+    settings = global_settings()
+    return settings.kafka_batch_mode.enabled
+
+
+def _record_topic_metrics(transaction, topic, sizes):
+    group = "Message/Kafka/Topic"
+    name = "Named/%s" % topic
+    count = len(sizes)
+
+    transaction.record_custom_metric(
+        "%s/%s/Received/Bytes" % (group, name),
+        {
+            "count": count,
+            "total": sum(sizes),
+            "min": min(sizes),
+            "max": max(sizes),
+            "sum_of_squares": sum(size**2 for size in sizes),
+        },
+    )
+    transaction.record_custom_metric(
+        "%s/%s/Received/Messages" % (group, name),
+        {"count": count, "total": count, "min": 1, "max": 1, "sum_of_squares": count},
+    )
+
+
+def should_record_batch():
+    """Returns whether a batch of messages returned by the consumer would
+    be recorded, which is only the case within an active transaction, or
+    outside of any transaction when batch mode is enabled. This is checked
+    before the messages in the batch are measured, so that doing so adds
+    no overhead to each call to the consumer otherwise.
+
+    """
+
+    if current_transaction():
+        return True
+
+    return batch_mode_enabled() and not current_transaction(active_only=False)
+
+
+def consume_batch(instance, wrapped, messages, client_name, client_version, client_id=None):
+    """Records a batch of messages returned by a single call to the
+    consumer. Outside of a transaction, and when batch mode is enabled,
+    one message transaction is started for the whole batch, which is then
+    stopped on the next call to the consumer. The metrics for the batch
+    are recorded per topic.
+
+    """
+
+    if not messages:
+        return
+
+    topics = OrderedDict()
+    for message in messages:
+        topics.setdefault(message.topic, []).append(message.size)
+
+    transaction = current_transaction(active_only=False)
+
+    if not transaction and batch_mode_enabled():
+        first = messages[0]
+
+        transaction = MessageTransaction(
+            application=application_instance(),
+            library="Kafka",
+            destination_type="Topic",
+            destination_name=first.topic if len(topics) == 1 else "Multiple",
+            headers=dict(first.headers) if first.headers else {},
+            transport_type="Kafka",
+            routing_key=first.key if len(messages) == 1 else None,
+            source=wrapped,
+        )
+        instance._nr_transaction = transaction
+        transaction.__enter__()  # pylint: disable=C2801
+
+        if client_id is not None:
+            transaction._add_agent_attribute("kafka.consume.client_id", client_id)
+
+        transaction._add_agent_attribute("kafka.consume.byteCount", sum(message.size for message in messages))
+        transaction._add_agent_attribute("kafka.consume.messageCount", len(messages))
+
+    transaction = current_transaction()
+
+    if not transaction:
+        return
+
+    for topic, sizes in topics.items():
+        _record_topic_metrics(transaction, topic, sizes)
+
+    transaction.add_messagebroker_info(client_name, client_version)
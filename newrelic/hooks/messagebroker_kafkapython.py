@@ -27,6 +27,12 @@ from newrelic.common.object_wrapper import (
     wrap_function_wrapper,
 )
 from newrelic.common.package_version_utils import get_package_version
+from newrelic.hooks.messagebroker_kafka_common import (
+    KafkaMessage,
+    consume_batch,
+    message_size,
+    should_record_batch,
+)
 
 HEARTBEAT_POLL = "MessageBroker/Kafka/Heartbeat/Poll"
 HEARTBEAT_SENT = "MessageBroker/Kafka/Heartbeat/Sent"
@@ -68,10 +74,25 @@ def wrap_KafkaProducer_send(wrapped, instance, args, kwargs):
             raise
 
 
+def _record_size(record):
+    # The size of the serialized value is recorded on the record by the
+    # consumer, which avoids needing to measure a deserialized value.
+
+    size = getattr(record, "serialized_value_size", None)
+    if size is not None and size >= 0:
+        return size
+    return message_size(record.value)
+
+
 def wrap_kafkaconsumer_next(wrapped, instance, args, kwargs):
     if hasattr(instance, "_nr_transaction") and not instance._nr_transaction.stopped:
         instance._nr_transaction.__exit__(*sys.exc_info())
 
+    # The iterator fetches records using poll(), which should not then
+    # itself be treated as consuming a batch.
+
+    instance._nr_iterating = True
+
     try:
         record = wrapped(*args, **kwargs)
     except Exception as e:
@@ -85,6 +106,8 @@ def wrap_kafkaconsumer_next(wrapped, instance, args, kwargs):
                 # Report error on application
                 notice_error(application=application_instance(activate=False))
         raise
+    finally:
+        instance._nr_iterating = False
 
     if record:
         # This iterator can be called either outside of a transaction, or
@@ -111,7 +134,7 @@ def wrap_kafkaconsumer_next(wrapped, instance, args, kwargs):
         library = "Kafka"
         destination_type = "Topic"
         destination_name = record.topic
-        received_bytes = len(str(record.value).encode("utf-8"))
+        received_bytes = _record_size(record)
         message_count = 1
 
         transaction = current_transaction(active_only=False)
@@ -152,6 +175,48 @@ def wrap_kafkaconsumer_next(wrapped, instance, args, kwargs):
     return record
 
 
+def wrap_KafkaConsumer_poll(wrapped, instance, args, kwargs):
+    if getattr(instance, "_nr_iterating", False):
+        return wrapped(*args, **kwargs)
+
+    if hasattr(instance, "_nr_transaction") and not instance._nr_transaction.stopped:
+        instance._nr_transaction.__exit__(*sys.exc_info())
+
+    try:
+        records = wrapped(*args, **kwargs)
+    except Exception:
+        if current_transaction():
+            notice_error()
+        else:
+            notice_error(application=application_instance(activate=False))
+        raise
+
+    if records and should_record_batch():
+        messages = [
+            KafkaMessage(
+                topic=record.topic,
+                key=record.key,
+                headers=record.headers,
+                size=_record_size(record),
+                partition=record.partition,
+                offset=record.offset,
+            )
+            for partition_records in records.values()
+            for record in partition_records
+        ]
+
+        # Obtain consumer client_id to send up as agent attribute
+        client_id = None
+        if hasattr(instance, "config"):
+            client_id = instance.config.get("client_id")
+
+        consume_batch(
+            instance, wrapped, messages, "Kafka-Python", get_package_version("kafka-python"), client_id=client_id
+        )
+
+    return records
+
+
 def wrap_KafkaProducer_init(wrapped, instance, args, kwargs):
     get_config_key = lambda key: kwargs.get(key, instance.DEFAULT_CONFIG[key])  # pylint: disable=C3001 # noqa: E731
 
@@ -248,6 +313,7 @@ def instrument_kafka_producer(module):
 def instrument_kafka_consumer_group(module):
     if hasattr(module, "KafkaConsumer"):
         wrap_function_wrapper(module, "KafkaConsumer.__next__", wrap_kafkaconsumer_next)
+        wrap_function_wrapper(module, "KafkaConsumer.poll", wrap_KafkaConsumer_poll)
 
 
 def instrument_kafka_heartbeat(module):
@@ -0,0 +1,319 @@
+# Copyright 2010 New Relic, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""This module implements a data source for generating metrics about CPU
+and memory usage relative to the limits of the cgroup the process is
+running in. Inside of a container the host level totals reported by the
+CPU and memory usage data sources do not reflect the quota the process is
+actually constrained by.
+
+"""
+
+import os
+
+from newrelic.common.stopwatch import start_timer
+from newrelic.common.system_info import logical_processor_count
+from newrelic.core.config import global_settings
+from newrelic.samplers.decorators import data_source_factory
+
+CGROUP_ROOT = "/sys/fs/cgroup"
+
+# Memory limits at or above this value are how cgroup v1 represents an
+# unlimited cgroup (PAGE_COUNTER_MAX rounded to the page size).
+
+_UNLIMITED_MEMORY = 1 << 60
+
+
+class _CgroupFile(object):
+    """Wraps a file in the cgroup filesystem, holding the file handle open
+    between reads so that sampling does not need to reopen the file each
+    harvest. Seeking back to the start causes the kernel to regenerate the
+    contents of the file.
+
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._fp = None
+
+    def read(self):
+        try:
+            if self._fp is None:
+                self._fp = open(self.path, "r")
+            else:
+                self._fp.seek(0)
+            return self._fp.read()
+        except (IOError, OSError, ValueError):
+            self.close()
+            return None
+
+    def read_int(self):
+        value = self.read()
+        if value is None:
+            return None
+        value = value.strip()
+        if value == "max":
+            return None
+        try:
+            return int(value)
+        except ValueError:
+            return None
+
+    def read_keyed(self):
+        value = self.read()
+        if value is None:
+            return {}
+        result = {}
+        for line in value.splitlines():
+            try:
+                key, number = line.split()
+                result[key] = int(number)
+            except ValueError:
+                continue
+        return result
+
+    def close(self):
+        if self._fp is not None:
+            try:
+                self._fp.close()
+            except Exception:
+                pass
+        self._fp = None
+
+
+def _first_existing(root, candidates):
+    for candidate in candidates:
+        path = os.path.join(root, candidate)
+        if os.path.exists(path):
+            return _CgroupFile(path)
+
+
+class _CgroupV2Reader(object):
+    """Reads the unified hierarchy files of cgroup v2."""
+
+    version = 2
+
+    def __init__(self, root):
+        self.cpu_max = _CgroupFile(os.path.join(root, "cpu.max"))
+        self.cpu_stat = _CgroupFile(os.path.join(root, "cpu.stat"))
+        self.memory_current = _CgroupFile(os.path.join(root, "memory.current"))
+        self.memory_max = _CgroupFile(os.path.join(root, "memory.max"))
+
+    @classmethod
+    def detect(cls, root):
+        return os.path.exists(os.path.join(root, "cgroup.controllers"))
+
+    def cpu_limit(self):
+        # The cpu.max file contains "$MAX $PERIOD", where $MAX may be the
+        # string "max" to indicate that there is no quota.
+
+        value = self.cpu_max.read()
+        if not value:
+            return None
+        try:
+            quota, period = value.split()
+            if quota == "max":
+                return None
+            return float(quota) / float(period)
+        except (ValueError, ZeroDivisionError):
+            return None
+
+    def cpu_times(self):
+        # Returns (usage, periods, throttled periods, throttled time) with
+        # times in seconds.
+
+        stat = self.cpu_stat.read_keyed()
+        if "usage_usec" not in stat:
+            return None
+        return (
+            stat["usage_usec"] / 1.0e6,
+            stat.get("nr_periods", 0),
+            stat.get("nr_throttled", 0),
+            stat.get("throttled_usec", 0) / 1.0e6,
+        )
+
+    def memory_usage(self):
+        return self.memory_current.read_int()
+
+    def memory_limit(self):
+        return self.memory_max.read_int()
+
+    def close(self):
+        for fp in (self.cpu_max, self.cpu_stat, self.memory_current, self.memory_max):
+            fp.close()
+
+
+class _CgroupV1Reader(object):
+    """Reads the per controller hierarchy files of cgroup v1."""
+
+    version = 1
+
+    _CPU_DIRECTORIES = ("cpu,cpuacct", "cpuacct,cpu", "cpu")
+    _CPUACCT_DIRECTORIES = ("cpu,cpuacct", "cpuacct,cpu", "cpuacct")
+
+    def __init__(self, root):
+        def _files(directories, name):
+            return [os.path.join(directory, name) for directory in directories]
+
+        self.cfs_quota = _first_existing(root, _files(self._CPU_DIRECTORIES, "cpu.cfs_quota_us"))
+        self.cfs_period = _first_existing(root, _files(self._CPU_DIRECTORIES, "cpu.cfs_period_us"))
+        self.cpu_stat = _first_existing(root, _files(self._CPU_DIRECTORIES, "cpu.stat"))
+        self.cpuacct_usage = _first_existing(root, _files(self._CPUACCT_DIRECTORIES, "cpuacct.usage"))
+        self.memory_usage_in_bytes = _first_existing(root, ["memory/memory.usage_in_bytes"])
+        self.memory_limit_in_bytes = _first_existing(root, ["memory/memory.limit_in_bytes"])
+
+    @classmethod
+    def detect(cls, root):
+        return any(
+            os.path.exists(os.path.join(root, directory))
+            for directory in cls._CPU_DIRECTORIES + cls._CPUACCT_DIRECTORIES + ("memory",)
+        )
+
+    def cpu_limit(self):
+        if self.cfs_quota is None or self.cfs_period is None:
+            return None
+        quota = self.cfs_quota.read_int()
+        period = self.cfs_period.read_int()
+        if quota is None or quota <= 0 or not period:
+            return None
+        return float(quota) / float(period)
+
+    def cpu_times(self):
+        if self.cpuacct_usage is None:
+            return None
+        usage = self.cpuacct_usage.read_int()
+        if usage is None:
+            return None
+        stat = self.cpu_stat.read_keyed() if self.cpu_stat is not None else {}
+        return (
+            usage / 1.0e9,
+            stat.get("nr_periods", 0),
+            stat.get("nr_throttled", 0),
+            stat.get("throttled_time", 0) / 1.0e9,
+        )
+
+    def memory_usage(self):
+        if self.memory_usage_in_bytes is None:
+            return None
+        return self.memory_usage_in_bytes.read_int()
+
+    def memory_limit(self):
+        if self.memory_limit_in_bytes is None:
+            return None
+        limit = self.memory_limit_in_bytes.read_int()
+        if limit is None or limit >= _UNLIMITED_MEMORY:
+            return None
+        return limit
+
+    def close(self):
+        for fp in (
+            self.cfs_quota,
+            self.cfs_period,
+            self.cpu_stat,
+            self.cpuacct_usage,
+            self.memory_usage_in_bytes,
+            self.memory_limit_in_bytes,
+        ):
+            if fp is not None:
+                fp.close()
+
+
+def cgroup_reader(root=None):
+    """Returns a reader for the cgroup hierarchy mounted at root, or None
+    if no supported cgroup hierarchy could be found.
+
+    """
+
+    root = root or CGROUP_ROOT
+
+    for reader in (_CgroupV2Reader, _CgroupV1Reader):
+        if reader.detect(root):
+            return reader(root)
+
+
+@data_source_factory(name="Cgroup Usage")
+class _CgroupUsageDataSource(object):
+    def __init__(self, settings, environ):
+        self._reader = None
+        self._timer = None
+        self._times = None
+
+    @property
+    def enabled(self):
+        settings = global_settings()
+        if not settings:
+            return False
+        return settings.cgroup_runtime_metrics.enabled
+
+    def start(self):
+        self._reader = cgroup_reader()
+        if self._reader is None:
+            return
+        self._timer = start_timer()
+        self._times = self._reader.cpu_times()
+
+    def stop(self):
+        if self._reader is not None:
+            self._reader.close()
+        self._reader = None
+        self._timer = None
+        self._times = None
+
+    def __call__(self):
+        if self._reader is None or not self.enabled:
+            return
+
+        reader = self._reader
+
+        cpu_limit = reader.cpu_limit()
+        new_times = reader.cpu_times()
+        elapsed_time = self._timer.restart_timer()
+
+        if cpu_limit is not None:
+            yield ("CPU/Cgroup/Limit", cpu_limit)
+
+        if new_times is not None and self._times is not None:
+            usage = new_times[0] - self._times[0]
+            periods = new_times[1] - self._times[1]
+            throttled_periods = new_times[2] - self._times[2]
+            throttled_time = new_times[3] - self._times[3]
+
+            yield ("CPU/Cgroup/Usage Time", usage)
+
+            # Utilization is relative to the quota when one is set and
+            # otherwise to all the processors visible to the process.
+
+            available_time = elapsed_time * (cpu_limit or logical_processor_count())
+            if available_time > 0:
+                yield ("CPU/Cgroup/Utilization", usage / available_time)
+
+            yield ("CPU/Cgroup/Throttled/Periods", {"count": throttled_periods})
+            yield ("CPU/Cgroup/Throttled Time", throttled_time)
+            if periods > 0:
+                yield ("CPU/Cgroup/Throttled/Ratio", float(throttled_periods) / periods)
+
+        self._times = new_times
+
+        memory = reader.memory_usage()
+        if memory is not None:
+            memory_limit = reader.memory_limit()
+
+            yield ("Memory/Cgroup/Used", memory / (1024.0 * 1024.0))
+
+            if memory_limit:
+                yield ("Memory/Cgroup/Limit", memory_limit / (1024.0 * 1024.0))
+                yield ("Memory/Cgroup/Utilization", float(memory) / memory_limit)
+
+
+cgroup_usage_data_source = _CgroupUsageDataSource
@@ -15,22 +15,51 @@
 import gc
 import os
 import platform
-import time
+from bisect import bisect_left
 from collections import Counter
 
 from newrelic.common.object_names import callable_name
+from newrelic.common.stopwatch import default_timer, start_timer
 from newrelic.core.config import global_settings
-from newrelic.core.stats_engine import CustomMetrics
+from newrelic.core.stats_engine import TimeStats
 from newrelic.samplers.decorators import data_source_factory
 
+# Upper bounds in seconds of the buckets used for the histogram of garbage
+# collector pause times. Buckets are on a log scale from 0.1ms to ~200ms,
+# with a final bucket for any pauses longer than that.
+
+GC_PAUSE_BUCKETS = tuple(0.0001 * 2**i for i in range(12))
+
+_GENERATIONS = 3
+
+
+class _GCStats(object):
+    """Preallocated accumulators for the values reported from the garbage
+    collector callback. A new instance is swapped in each harvest so that
+    the callback never has to create any entries itself.
+
+    """
+
+    def __init__(self):
+        # The final entry in the time table holds the total for all
+        # generations.
+
+        self.time = [TimeStats() for _ in range(_GENERATIONS + 1)]
+        self.pauses = [[0] * (len(GC_PAUSE_BUCKETS) + 1) for _ in range(_GENERATIONS)]
+        self.collected = [TimeStats() for _ in range(_GENERATIONS)]
+        self.uncollectable = [TimeStats() for _ in range(_GENERATIONS)]
+
 
 @data_source_factory(name="Garbage Collector Metrics")
 class _GCDataSource(object):
     def __init__(self, settings, environ):
-        self.gc_time_metrics = CustomMetrics()
+        self.gc_stats = _GCStats()
         self.start_time = 0.0
         self.previous_stats = {}
         self.pid = os.getpid()
+        self._timer = None
+        self._previous_allocations = 0
+        self._metric_names = None
 
     @property
     def enabled(self):
@@ -49,20 +78,60 @@ class _GCDataSource(object):
         if not self.enabled:
             return
 
-        current_generation = info["generation"]
-
         if phase == "start":
-            self.start_time = time.time()
+            self.start_time = default_timer()
         elif phase == "stop":
-            total_time = time.time() - self.start_time
-            self.gc_time_metrics.record_custom_metric("GC/time/%d/all" % self.pid, total_time)
-            for gen in range(0, 3):
+            total_time = default_timer() - self.start_time
+            current_generation = info["generation"]
+            stats = self.gc_stats
+
+            stats.time[_GENERATIONS].merge_raw_time_metric(total_time)
+            for gen in range(_GENERATIONS):
                 if gen <= current_generation:
-                    self.gc_time_metrics.record_custom_metric("GC/time/%d/%d" % (self.pid, gen), total_time)
+                    stats.time[gen].merge_raw_time_metric(total_time)
                 else:
-                    self.gc_time_metrics.record_custom_metric("GC/time/%d/%d" % (self.pid, gen), 0)
+                    stats.time[gen].merge_raw_time_metric(0)
+
+            stats.pauses[current_generation][bisect_left(GC_PAUSE_BUCKETS, total_time)] += 1
+
+            stats.collected[current_generation].merge_raw_time_metric(info.get("collected", 0))
+            stats.uncollectable[current_generation].merge_raw_time_metric(info.get("uncollectable", 0))
+
+    def _precompute_metric_names(self):
+        pid = self.pid = os.getpid()
+        generations = range(_GENERATIONS)
+
+        bucket_labels = ["%gms" % (bound * 1000) for bound in GC_PAUSE_BUCKETS] + ["inf"]
+
+        self._metric_names = {
+            "time": ["GC/time/%d/%d" % (pid, gen) for gen in generations] + ["GC/time/%d/all" % pid],
+            "pauses": [["GC/pause/%d/%d/%s" % (pid, gen, label) for label in bucket_labels] for gen in generations],
+            "collected": ["GC/collected_per_collection/%d/%d" % (pid, gen) for gen in generations],
+            "uncollectable": ["GC/uncollectable_per_collection/%d/%d" % (pid, gen) for gen in generations],
+            "allocations": "GC/allocations/%d" % pid,
+            "allocation_rate": "GC/allocation_rate/%d" % pid,
+        }
+
+    def _allocations(self, collections):
+        # The garbage collector does not expose a count of allocations, so
+        # estimate it from the generation 0 count, which is the number of
+        # container allocations less deallocations since generation 0 was
+        # last collected. Every collection resets that count after it
+        # reaches the generation 0 threshold.
+
+        if not hasattr(gc, "get_count"):
+            return None
+
+        count = gc.get_count()[0]
+        allocations = collections * gc.get_threshold()[0] + count - self._previous_allocations
+        self._previous_allocations = count
+        return max(allocations, 0)
 
     def start(self):
+        self._precompute_metric_names()
+        self._timer = start_timer()
+        if hasattr(gc, "get_count"):
+            self._previous_allocations = gc.get_count()[0]
         if hasattr(gc, "callbacks"):
             gc.callbacks.append(self.record_gc)
 
@@ -73,8 +142,9 @@ class _GCDataSource(object):
         if hasattr(gc, "callbacks") and self.record_gc in gc.callbacks:
             gc.callbacks.remove(self.record_gc)
 
-        self.gc_time_metrics.reset_metric_stats()
+        self.gc_stats = _GCStats()
         self.start_time = 0.0
+        self._timer = None
 
     def __call__(self):
         if not self.enabled:
@@ -127,22 +197,47 @@ class _GCDataSource(object):
                         )
 
         # In order to avoid a concurrency issue with getting interrupted by the
-        # garbage collector, we save a reference to the old metrics table, and overwrite
-        # self.gc_time_metrics with a new empty table via reset_metric_stats().
+        # garbage collector, we save a reference to the old stats, and swap
+        # in a new preallocated set of accumulators for the callback to use.
         # This guards against losing data points, or having inconsistent data points
         # reported between /all and the totals of /generation/%d metrics.
-        gc_time_metrics = self.gc_time_metrics.metrics()
-        self.gc_time_metrics.reset_metric_stats()
-
-        for metric in gc_time_metrics:
-            raw_metric = metric[1]
-            yield metric[0], {
-                "count": raw_metric.call_count,
-                "total": raw_metric.total_call_time,
-                "min": raw_metric.min_call_time,
-                "max": raw_metric.max_call_time,
-                "sum_of_squares": raw_metric.sum_of_squares,
+        gc_stats = self.gc_stats
+        self.gc_stats = _GCStats()
+
+        if self._metric_names is None:
+            self._precompute_metric_names()
+        names = self._metric_names
+
+        def _time_stats(stats):
+            return {
+                "count": stats.call_count,
+                "total": stats.total_call_time,
+                "min": stats.min_call_time,
+                "max": stats.max_call_time,
+                "sum_of_squares": stats.sum_of_squares,
             }
 
+        for name, stats in zip(names["time"], gc_stats.time):
+            if stats.call_count:
+                yield name, _time_stats(stats)
+
+        for gen_names, pauses in zip(names["pauses"], gc_stats.pauses):
+            for name, count in zip(gen_names, pauses):
+                if count:
+                    yield name, {"count": count}
+
+        for key in ("collected", "uncollectable"):
+            for name, stats in zip(names[key], getattr(gc_stats, key)):
+                if stats.call_count:
+                    yield name, _time_stats(stats)
+
+        if self._timer is not None:
+            allocations = self._allocations(gc_stats.time[_GENERATIONS].call_count)
+            elapsed_time = self._timer.restart_timer()
+            if allocations is not None:
+                yield names["allocations"], {"count": allocations}
+                if elapsed_time > 0:
+                    yield names["allocation_rate"], allocations / elapsed_time
+
 
 garbage_collector_data_source = _GCDataSource
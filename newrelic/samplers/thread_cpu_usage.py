@@ -0,0 +1,167 @@
+# Copyright 2010 New Relic, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""This module implements a data source for generating metrics about the
+CPU time consumed by each category of thread in the process. Threads are
+categorised the same way as for the thread profiler, which allows the CPU
+overhead of the agent's own threads to be seen separately from threads
+handling requests and background tasks.
+
+"""
+
+import os
+import sys
+import threading
+
+from newrelic.common.stopwatch import start_timer
+from newrelic.core.config import global_settings
+from newrelic.core.trace_cache import trace_cache
+from newrelic.samplers.decorators import data_source_factory
+
+PROC_TASK_ROOT = "/proc/self/task"
+
+_CATEGORIES = ("REQUEST", "BACKGROUND", "AGENT", "OTHER")
+
+
+def _clock_ticks():
+    try:
+        return float(os.sysconf("SC_CLK_TCK"))
+    except (AttributeError, ValueError, OSError):
+        return 100.0
+
+
+def thread_cpu_time(native_id, root=None, clock_ticks=None):
+    """Returns the user plus system CPU time in seconds consumed by the
+    thread with the given native thread ID, or None if it could not be
+    determined.
+
+    """
+
+    path = os.path.join(root or PROC_TASK_ROOT, str(native_id), "stat")
+
+    try:
+        with open(path, "r") as fp:
+            data = fp.read()
+    except (IOError, OSError):
+        return None
+
+    # The command name in the second field is enclosed in parentheses
+    # and can itself contain spaces or parentheses, so only split the
+    # fields after the last closing parenthesis. The utime and stime
+    # fields are the 14th and 15th fields of the file, measured in clock
+    # ticks.
+
+    try:
+        fields = data[data.rindex(")") + 2 :].split()
+        ticks = int(fields[11]) + int(fields[12])
+    except (ValueError, IndexError):
+        return None
+
+    return ticks / (clock_ticks or _clock_ticks())
+
+
+@data_source_factory(name="Thread CPU Usage")
+class _ThreadCPUUsageDataSource(object):
+    def __init__(self, settings, environ):
+        self._timer = None
+        self._clock_ticks = None
+        self._cpu_times = {}
+        self._categories = {}
+
+    @property
+    def enabled(self):
+        settings = global_settings()
+        if not settings or not sys.platform.startswith("linux"):
+            return False
+        return settings.thread_runtime_metrics.enabled
+
+    def start(self):
+        self._timer = start_timer()
+        self._clock_ticks = _clock_ticks()
+        self._cpu_times = {}
+        self._categories = {}
+
+    def stop(self):
+        self._timer = None
+        self._cpu_times = {}
+        self._categories = {}
+
+    def _categorize(self):
+        # A request handling thread which happens to be idle at the time
+        # of sampling would otherwise be seen as OTHER, so once a thread
+        # has been seen running a transaction it keeps that category.
+
+        previous = self._categories
+        categories = {}
+
+        for _, thread_id, category, _ in trace_cache().active_threads():
+            if category == "OTHER":
+                category = previous.get(thread_id, category)
+            categories[thread_id] = category
+
+        self._categories = categories
+        return categories
+
+    def __call__(self):
+        if self._timer is None or not self.enabled:
+            return
+
+        categories = self._categorize()
+        elapsed_time = self._timer.restart_timer()
+
+        totals = dict((category, 0.0) for category in _CATEGORIES)
+        agent_totals = {}
+        cpu_times = {}
+
+        for thread in threading.enumerate():
+            native_id = getattr(thread, "native_id", None)
+            if native_id is None:
+                continue
+
+            cpu_time = thread_cpu_time(native_id, clock_ticks=self._clock_ticks)
+            if cpu_time is None:
+                continue
+
+            # Native thread IDs can be reused by the operating system, so
+            # key the previous value on the Python thread as well.
+
+            key = (thread.ident, native_id)
+            cpu_times[key] = cpu_time
+
+            # CPU time used by a thread before the first sample it was
+            # seen in cannot be attributed to this harvest period.
+
+            if key not in self._cpu_times:
+                continue
+
+            used = max(cpu_time - self._cpu_times[key], 0.0)
+            category = categories.get(thread.ident, "OTHER")
+            totals[category] += used
+
+            if category == "AGENT":
+                name = thread.name.split("/", 1)[0]
+                agent_totals[name] = agent_totals.get(name, 0.0) + used
+
+        self._cpu_times = cpu_times
+
+        for category in _CATEGORIES:
+            yield ("CPU/Thread/%s/Time" % category, totals[category])
+            if elapsed_time > 0:
+                yield ("CPU/Thread/%s/Utilization" % category, totals[category] / elapsed_time)
+
+        for name, used in agent_totals.items():
+            yield ("CPU/Thread/AGENT/%s" % name, used)
+
+
+thread_cpu_usage_data_source = _ThreadCPUUsageDataSource
@@ -0,0 +1,80 @@
+# Copyright 2010 New Relic, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from testing_support.fixtures import override_application_settings
+from testing_support.validators.validate_transaction_event_attributes import (
+    validate_transaction_event_attributes,
+)
+from testing_support.validators.validate_transaction_metrics import (
+    validate_transaction_metrics,
+)
+
+from newrelic.api.background_task import background_task
+from newrelic.api.function_trace import FunctionTrace
+from newrelic.api.transaction import (
+    add_custom_attribute,
+    current_transaction,
+)
+
+_overhead_metrics = [
+    ("Supportability/Python/AgentOverhead/all", 1),
+    ("Supportability/Python/AgentOverhead/TimeTrace/Enter", 1),
+    ("Supportability/Python/AgentOverhead/TimeTrace/Exit", 1),
+    ("Supportability/Python/AgentOverhead/Attributes", 1),
+    ("Supportability/Python/AgentOverhead/DistributedTrace/CreateHeaders", 1),
+]
+
+
+@override_application_settings(
+    {
+        "agent_overhead.enabled": True,
+        "account_id": "1",
+        "trusted_account_key": "1",
+        "primary_application_id": "1",
+        "distributed_tracing.enabled": True,
+    }
+)
+@validate_transaction_event_attributes(required_params={"agent": ["agent.overhead"], "user": [], "intrinsic": []})
+@validate_transaction_metrics(
+    "test_agent_overhead:test_agent_overhead_enabled",
+    custom_metrics=_overhead_metrics,
+    background_task=True,
+)
+@background_task(name="test_agent_overhead:test_agent_overhead_enabled")
+def test_agent_overhead_enabled():
+    with FunctionTrace("function"):
+        pass
+
+    add_custom_attribute("key", "value")
+
+    headers = []
+    current_transaction().insert_distributed_trace_headers(headers)
+    assert headers
+
+    assert current_transaction()._agent_overhead.total > 0
+
+
+@override_application_settings({"agent_overhead.enabled": False})
+@validate_transaction_event_attributes(forgone_params={"agent": ["agent.overhead"], "user": [], "intrinsic": []})
+@validate_transaction_metrics(
+    "test_agent_overhead:test_agent_overhead_disabled",
+    custom_metrics=[("Supportability/Python/AgentOverhead/all", None)],
+    background_task=True,
+)
+@background_task(name="test_agent_overhead:test_agent_overhead_disabled")
+def test_agent_overhead_disabled():
+    with FunctionTrace("function"):
+        pass
+
+    assert current_transaction()._agent_overhead is None
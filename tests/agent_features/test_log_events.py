@@ -12,10 +12,12 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+from newrelic.api.application import application_instance
 from newrelic.api.background_task import background_task
 from newrelic.api.time_trace import current_trace
 from newrelic.api.transaction import current_transaction, record_log_event, ignore_transaction
-from testing_support.fixtures import override_application_settings, reset_core_stats_engine
+from newrelic.core.stats_engine import SampledDataSet
+from testing_support.fixtures import core_application_stats_engine, override_application_settings, reset_core_stats_engine
 from testing_support.validators.validate_log_event_count import validate_log_event_count
 from testing_support.validators.validate_log_event_count_outside_transaction import validate_log_event_count_outside_transaction
 from testing_support.validators.validate_log_events import validate_log_events
@@ -183,3 +185,95 @@ def test_record_log_event_outside_transaction():
         exercise_record_log_event()
 
     test()
+
+
+class LazyMessage(object):
+    def __init__(self, message):
+        self.message = message
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        return self.message
+
+
+_test_record_log_event_lazy_message_events = [{"message": "A", "level": "ERROR"}]
+_test_record_log_event_lazy_message_events[0].update(_common_attributes_trace_linking)
+
+@enable_log_forwarding
+def test_record_log_event_lazy_message():
+    message = LazyMessage("A")
+
+    @validate_log_events(_test_record_log_event_lazy_message_events)
+    @validate_log_event_count(1)
+    @background_task()
+    def test():
+        exercise_record_log_event(message)
+
+    test()
+
+    assert message.calls == 1
+
+
+@enable_log_forwarding
+@override_application_settings({"event_harvest_config.harvest_limits.log_event_data": 1})
+def test_record_log_event_lazy_message_not_sampled():
+    messages = [LazyMessage("A"), LazyMessage("B"), LazyMessage("C")]
+
+    @validate_log_events([{"message": "C", "level": "ERROR"}])
+    @validate_log_event_count(1)
+    @background_task()
+    def test():
+        transaction = current_transaction()
+        for message, priority in zip(messages, (0.5, 0.1, 0.9)):
+            transaction.record_log_event(message, "ERROR", priority=priority)
+
+    test()
+
+    # The message for an event which would be discarded is never formatted.
+
+    assert [message.calls for message in messages] == [1, 0, 1]
+
+
+@enable_log_forwarding
+@reset_core_stats_engine()
+def test_record_log_event_lazy_message_harvest_reservoir_full():
+    message = LazyMessage("A")
+    stats = core_application_stats_engine()
+
+    # Fill the harvest reservoir with an event of a priority no event
+    # recorded in a transaction can reach once merged.
+
+    stats._log_events = SampledDataSet(capacity=1)
+    stats._log_events.add(None, priority=10.0)
+
+    try:
+
+        @validate_log_event_count(0)
+        @background_task()
+        def test():
+            exercise_record_log_event(message)
+
+        test()
+
+    finally:
+        stats.reset_log_events()
+
+    assert message.calls == 0
+
+
+@enable_log_forwarding
+@reset_core_stats_engine()
+def test_record_log_event_lazy_message_outside_lock():
+    api_application = application_instance()
+    core_application = api_application._agent.application(api_application.name)
+
+    def message():
+        assert not core_application._stats_custom_lock._is_owned()
+        return "A"
+
+    @validate_log_event_count_outside_transaction(1)
+    def test():
+        exercise_record_log_event(message)
+
+    test()
@@ -21,6 +21,11 @@ from newrelic.agent import get_linking_metadata
 from newrelic.api.background_task import background_task
 from newrelic.api.function_trace import FunctionTrace
 from newrelic.api.log import NewRelicContextFormatter
+from newrelic.api.time_trace import (
+    _service_linking_metadata,
+    get_service_linking_metadata,
+)
+from newrelic.core.config import finalize_application_settings
 from newrelic.packages import six
 
 if six.PY2:
@@ -252,3 +257,39 @@ def test_get_linking_metadata_api_inside_transaction():
 def test_get_linking_metadata_api_outside_transaction():
     metadata = get_linking_metadata()
     validate_metadata(metadata, EXPECTED_KEYS_NO_TXN)
+
+
+def test_service_linking_metadata_cached():
+    settings = finalize_application_settings({"app_name": "Linking App"})
+
+    metadata = get_service_linking_metadata(settings=settings)
+    assert metadata["entity.name"] == "Linking App"
+
+    # Each caller is given its own copy of the cached metadata.
+
+    metadata["entity.name"] = "Modified"
+    assert get_service_linking_metadata(settings=settings)["entity.name"] == "Linking App"
+
+    # The cached metadata is rebuilt when the settings change.
+
+    settings.app_name = "Renamed App"
+    assert get_service_linking_metadata(settings=settings)["entity.name"] == "Renamed App"
+
+    other = finalize_application_settings({"app_name": "Other App"})
+    assert get_service_linking_metadata(settings=other)["entity.name"] == "Other App"
+
+
+def test_service_linking_metadata_read_only():
+    settings = finalize_application_settings({"app_name": "Linking App"})
+    other = finalize_application_settings({"app_name": "Other App"})
+
+    metadata = _service_linking_metadata(settings=settings)
+
+    with pytest.raises(TypeError):
+        metadata["entity.name"] = "Modified"
+
+    # The metadata for each settings object is cached separately, so is
+    # not rebuilt when they are used in turn.
+
+    assert _service_linking_metadata(settings=other)["entity.name"] == "Other App"
+    assert _service_linking_metadata(settings=settings) is metadata
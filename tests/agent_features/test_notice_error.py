@@ -41,6 +41,7 @@ from newrelic.api.background_task import background_task
 from newrelic.api.settings import STRIP_EXCEPTION_MESSAGE
 from newrelic.api.time_trace import notice_error
 from newrelic.common.object_names import callable_name
+from newrelic.core.config import finalize_application_settings, should_ignore_error
 
 _runtime_error_name = callable_name(RuntimeError)
 _type_error_name = callable_name(TypeError)
@@ -452,3 +453,25 @@ def test_application_notice_error_params_not_a_dict():
         raise RuntimeError()
     except RuntimeError:
         notice_error(sys.exc_info(), attributes=[1, 2, 3], application=application())
+
+
+# =============== Test error rules cache ===============
+
+
+def test_error_rules_cache_replaced_with_rules():
+    try:
+        raise RuntimeError("one")
+    except RuntimeError:
+        exc_info = sys.exc_info()
+
+    settings = finalize_application_settings({"error_collector.ignore_classes": [_runtime_error_name]})
+    assert should_ignore_error(exc_info, settings=settings)
+    assert should_ignore_error(exc_info, settings=settings)
+
+    settings = finalize_application_settings({"error_collector.ignore_classes": [_type_error_name]})
+    assert not should_ignore_error(exc_info, settings=settings)
+
+    # Status codes are not cached, so are always checked.
+
+    assert should_ignore_error(exc_info, status_code=404, settings=settings)
+    assert not should_ignore_error(exc_info, status_code=500, settings=settings)
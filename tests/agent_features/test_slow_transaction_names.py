@@ -0,0 +1,123 @@
+# Copyright 2010 New Relic, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import time
+
+from testing_support.fixtures import (
+    core_application_stats_engine,
+    override_application_settings,
+    reset_core_stats_engine,
+)
+
+from newrelic.api.application import application_instance
+from newrelic.api.background_task import BackgroundTask
+from newrelic.core.stats_engine import SlowTransactionTable, StatsEngine
+
+
+def _run_transaction(name, duration):
+    with BackgroundTask(application_instance(), name):
+        time.sleep(duration)
+
+
+def _trace_names():
+    trace_data = core_application_stats_engine().transaction_trace_data(None)
+    return sorted(trace[2] for trace in trace_data)
+
+
+@override_application_settings(
+    {
+        "agent_limits.slow_transaction_names": 2,
+        "transaction_tracer.transaction_threshold": 0.0,
+    }
+)
+@reset_core_stats_engine()
+def test_slow_transaction_names():
+    _run_transaction("first", 0.01)
+    _run_transaction("second", 0.05)
+    _run_transaction("third", 0.02)
+    _run_transaction("first", 0.03)
+
+    # The slowest transaction is retained as before, along with the
+    # slowest for each of the two slowest transaction names.
+
+    assert _trace_names() == [
+        "OtherTransaction/Function/first",
+        "OtherTransaction/Function/second",
+    ]
+
+
+@override_application_settings(
+    {
+        "agent_limits.slow_transaction_names": 0,
+        "transaction_tracer.transaction_threshold": 0.0,
+    }
+)
+@reset_core_stats_engine()
+def test_slow_transaction_names_disabled():
+    _run_transaction("first", 0.01)
+    _run_transaction("second", 0.02)
+
+    assert _trace_names() == ["OtherTransaction/Function/second"]
+
+
+@override_application_settings(
+    {
+        "agent_limits.slow_transaction_names": 2,
+        "transaction_tracer.transaction_threshold": 0.0,
+    }
+)
+@reset_core_stats_engine()
+def test_slow_transaction_encoded_outside_lock(monkeypatch):
+    api_application = application_instance()
+    core_application = api_application._agent.application(api_application.name)
+
+    encoded = []
+    encode = StatsEngine._encode_transaction_trace
+
+    def _encode_transaction_trace(self, trace, connections):
+        assert not core_application._stats_lock._is_owned()
+        encoded.append(trace.path)
+        return encode(self, trace, connections)
+
+    monkeypatch.setattr(StatsEngine, "_encode_transaction_trace", _encode_transaction_trace)
+
+    _run_transaction("first", 0.02)
+    _run_transaction("first", 0.01)
+
+    # The faster trace for the same name is not encoded at all.
+
+    assert encoded == ["OtherTransaction/Function/first"]
+
+
+def test_slow_transaction_table():
+    table = SlowTransactionTable()
+
+    table.add("a", 0.1, "guid-a", ["a"], 2)
+    table.add("b", 0.3, "guid-b", ["b"], 2)
+
+    assert not table.should_retain("a", 0.05, 2)
+    assert not table.should_retain("c", 0.05, 2)
+    assert table.should_retain("c", 0.2, 2)
+
+    table.add("c", 0.2, "guid-c", ["c"], 2)
+    assert table.durations() == {"b": 0.3, "c": 0.2}
+
+    other = SlowTransactionTable()
+    other.add("c", 0.4, "guid-c2", ["c2"], 2)
+    other.add("d", 0.1, "guid-d", ["d"], 2)
+
+    table.merge(other, 2)
+    assert table.durations() == {"b": 0.3, "c": 0.4}
+
+    assert sorted(table.trace_data(exclude_guids={"guid-b"})) == [["c2"]]
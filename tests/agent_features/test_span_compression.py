@@ -0,0 +1,117 @@
+# Copyright 2010 New Relic, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+from testing_support.fixtures import dt_enabled, override_application_settings
+from testing_support.validators.validate_span_events import validate_span_events
+from testing_support.validators.validate_transaction_metrics import (
+    validate_transaction_metrics,
+)
+
+from newrelic.api.background_task import background_task
+from newrelic.api.datastore_trace import DatastoreTrace
+from newrelic.api.external_trace import ExternalTrace
+from newrelic.api.function_trace import FunctionTrace
+from newrelic.api.transaction import current_transaction
+
+_test_span_compression_scoped_metrics = [
+    ("Datastore/operation/Redis/get", 7),
+    ("Datastore/operation/Redis/set", 1),
+    ("Function/between", 1),
+]
+
+_test_span_compression_rollup_metrics = [
+    ("Datastore/all", 8),
+    ("Datastore/allOther", 8),
+    ("Datastore/Redis/all", 8),
+    ("Datastore/operation/Redis/get", 7),
+]
+
+
+@override_application_settings({"span_compression.enabled": True})
+@dt_enabled
+@validate_transaction_metrics(
+    "test_span_compression",
+    scoped_metrics=_test_span_compression_scoped_metrics,
+    rollup_metrics=_test_span_compression_rollup_metrics,
+    background_task=True,
+)
+@validate_span_events(
+    count=1,
+    exact_intrinsics={"name": "Datastore/operation/Redis/get", "nr.aggregate.count": 4},
+)
+@validate_span_events(
+    count=1,
+    exact_intrinsics={"name": "Datastore/operation/Redis/get", "nr.aggregate.count": 2},
+)
+@validate_span_events(count=3, exact_intrinsics={"name": "Datastore/operation/Redis/get"})
+@validate_span_events(count=1, exact_intrinsics={"name": "Datastore/operation/Redis/set"})
+@background_task(name="test_span_compression")
+def test_span_compression():
+    for _ in range(4):
+        with DatastoreTrace("Redis", None, "get", host="localhost", port_path_or_id="6379"):
+            pass
+
+    # Calls to another destination, or separated by other calls, are not
+    # compressed together.
+
+    with DatastoreTrace("Redis", None, "get", host="otherhost", port_path_or_id="6379"):
+        pass
+
+    with DatastoreTrace("Redis", None, "set", host="localhost", port_path_or_id="6379"):
+        pass
+
+    with FunctionTrace("between"):
+        with DatastoreTrace("Redis", None, "get", host="localhost", port_path_or_id="6379"):
+            pass
+        with DatastoreTrace("Redis", None, "get", host="localhost", port_path_or_id="6379"):
+            pass
+
+    transaction = current_transaction()
+    assert len(transaction.root_span.children) == 4
+
+
+@override_application_settings({"span_compression.enabled": True})
+@dt_enabled
+@validate_transaction_metrics(
+    "test_span_compression_propagated",
+    scoped_metrics=[("External/example.com/library/GET", 3)],
+    rollup_metrics=[("External/example.com/all", 3)],
+    background_task=True,
+)
+@validate_span_events(count=3, exact_intrinsics={"name": "External/example.com/library/GET"})
+@validate_span_events(count=0, exact_intrinsics={"nr.aggregate.count": 2})
+@background_task(name="test_span_compression_propagated")
+def test_span_compression_propagated():
+    # Spans whose ids were sent to other services must be kept.
+
+    for _ in range(3):
+        with ExternalTrace("library", "http://example.com/", "GET"):
+            headers = []
+            current_transaction().insert_distributed_trace_headers(headers)
+            assert headers
+
+    transaction = current_transaction()
+    assert len(transaction.root_span.children) == 3
+
+
+@override_application_settings({"span_compression.enabled": False})
+@background_task(name="test_span_compression_disabled")
+def test_span_compression_disabled():
+    for _ in range(3):
+        with DatastoreTrace("Redis", None, "get"):
+            pass
+
+    transaction = current_transaction()
+    assert len(transaction.root_span.children) == 3
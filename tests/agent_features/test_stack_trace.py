@@ -17,7 +17,7 @@ import sys
 from newrelic.core.config import global_settings
 from newrelic.core.stack_trace import (exception_stack, current_stack,
     _format_stack_trace as _format_stack_trace_from_dicts, _extract_stack,
-    _extract_tb)
+    _extract_tb, capture_exception_stack, format_exception_stack)
 
 
 def _format_stack_trace_from_tuples(frames):
@@ -311,3 +311,24 @@ def test_trace_current_plus_traceback():
             _extract_stack(frame, 0, limit)+_extract_tb(tb, limit))
 
     assert actual == require, (actual, require)
+
+# The stack captured by capture_exception_stack() must format the same as
+# that returned by exception_stack(), with the frame line numbers being
+# those at the time of capture.
+
+def test_trace_capture_exception_stack():
+    try:
+        function5()
+    except RuntimeError:
+        tb = sys.exc_info()[2]
+
+    for limit in (1, 5, 15, 1000):
+        stack = capture_exception_stack(tb, limit=limit)
+        assert len(stack.frames) <= limit
+
+        actual = format_exception_stack(stack)
+        require = exception_stack(tb, limit=limit)
+
+        assert actual == require, (actual, require)
+
+    assert format_exception_stack(["Traceback"]) == ["Traceback"]
@@ -0,0 +1,100 @@
+# Copyright 2010 New Relic, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from testing_support.fixtures import dt_enabled, override_application_settings
+from testing_support.validators.validate_span_events import validate_span_events
+from testing_support.validators.validate_transaction_metrics import (
+    validate_transaction_metrics,
+)
+
+from newrelic.api.background_task import background_task
+from newrelic.api.datastore_trace import DatastoreTrace
+from newrelic.api.function_trace import FunctionTrace
+from newrelic.api.transaction import current_transaction, set_transaction_name
+
+_test_transaction_node_budget_scoped_metrics = [
+    ("Function/child", 10),
+    ("Function/nested", 2),
+    ("Datastore/operation/Redis/get", 5),
+]
+
+_test_transaction_node_budget_rollup_metrics = [
+    ("Function/child", 10),
+    ("Function/nested", 2),
+    ("Datastore/all", 5),
+    ("Datastore/allOther", 5),
+    ("Datastore/Redis/all", 5),
+    ("Datastore/operation/Redis/get", 5),
+]
+
+
+@override_application_settings({"agent_limits.transaction_node_budget": 2})
+@dt_enabled
+@validate_transaction_metrics(
+    "renamed",
+    scoped_metrics=_test_transaction_node_budget_scoped_metrics,
+    rollup_metrics=_test_transaction_node_budget_rollup_metrics,
+    background_task=True,
+)
+@validate_span_events(
+    count=1,
+    exact_intrinsics={"name": "Function/child", "nr.aggregate.count": 10},
+)
+@validate_span_events(
+    count=1,
+    exact_intrinsics={"name": "Datastore/operation/Redis/get", "nr.aggregate.count": 5},
+)
+@validate_span_events(count=0, exact_intrinsics={"name": "Function/nested"})
+@background_task(name="test_transaction_node_budget")
+def test_transaction_node_budget():
+    # The children of the first node are within the budget and retained,
+    # but their metrics must still be recorded when their parent is folded.
+
+    with FunctionTrace("child"):
+        with FunctionTrace("nested"):
+            pass
+        with FunctionTrace("nested"):
+            pass
+
+    for _ in range(9):
+        with FunctionTrace("child"):
+            pass
+
+    for _ in range(5):
+        with DatastoreTrace("Redis", None, "get"):
+            pass
+
+    transaction = current_transaction()
+    assert len(transaction._folded_nodes) == 2
+    assert not transaction.root_span.children
+
+    set_transaction_name("renamed")
+
+
+@override_application_settings({"agent_limits.transaction_node_budget": None})
+@validate_transaction_metrics(
+    "test_transaction_node_budget:test_transaction_node_budget_disabled",
+    scoped_metrics=[("Function/child", 10)],
+    rollup_metrics=[("Function/child", 10)],
+    background_task=True,
+)
+@background_task(name="test_transaction_node_budget:test_transaction_node_budget_disabled")
+def test_transaction_node_budget_disabled():
+    for _ in range(10):
+        with FunctionTrace("child"):
+            pass
+
+    transaction = current_transaction()
+    assert not transaction._folded_nodes
+    assert len(transaction.root_span.children) == 10
@@ -0,0 +1,132 @@
+# Copyright 2010 New Relic, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import time
+
+import pytest
+
+from newrelic.common.streaming_utils import SpanRetentionBuffer, StreamBuffer
+from newrelic.core.config import finalize_application_settings
+
+settings = finalize_application_settings(
+    {
+        "infinite_tracing.tail_sampling.hold_time": 60.0,
+        "infinite_tracing.tail_sampling.max_spans": 6,
+        "infinite_tracing.tail_sampling.duration_threshold": 1.0,
+        "infinite_tracing.tail_sampling.transaction_names": ["WebTransaction/Function/app:checkout*"],
+    }
+)
+
+
+class Transaction(object):
+    def __init__(self, trace_id, path="WebTransaction/Function/app:index", duration=0.1, errors=(), spans=2):
+        self.trace_id = trace_id
+        self.path = path
+        self.duration = duration
+        self.errors = errors
+        self.spans = ["%s-%d" % (trace_id, i) for i in range(spans)]
+
+    def span_protos(self, settings):
+        for span in self.spans:
+            yield span
+
+
+@pytest.fixture()
+def span_retention():
+    return SpanRetentionBuffer(StreamBuffer(100), settings)
+
+
+def _streamed(span_retention):
+    return list(span_retention.stream_buffer._queue)
+
+
+@pytest.mark.parametrize(
+    "transaction",
+    (
+        Transaction("a", errors=(object(),)),
+        Transaction("a", duration=2.0),
+        Transaction("a", path="WebTransaction/Function/app:checkout/confirm"),
+    ),
+)
+def test_span_retention_forwards_interesting(span_retention, transaction):
+    span_retention.put_transaction(transaction, settings)
+
+    assert _streamed(span_retention) == ["a-0", "a-1"]
+    assert span_retention.stats() == (2, 0, 0)
+
+
+def test_span_retention_holds_until_trace_interesting(span_retention):
+    span_retention.put_transaction(Transaction("a"), settings)
+    span_retention.put_transaction(Transaction("b"), settings)
+
+    assert not _streamed(span_retention)
+    assert len(span_retention) == 4
+
+    # The held spans are forwarded with those of the transaction which
+    # made the trace interesting, as are those of later transactions.
+    span_retention.put_transaction(Transaction("a", duration=2.0, spans=1), settings)
+    span_retention.put_transaction(Transaction("a", spans=1), settings)
+
+    assert _streamed(span_retention) == ["a-0", "a-1", "a-0", "a-0"]
+    assert len(span_retention) == 2
+    assert span_retention.stats() == (4, 0, 0)
+
+
+def test_span_retention_drops_expired(span_retention):
+    span_retention.hold_time = 0.0
+    span_retention.put_transaction(Transaction("a"), settings)
+    span_retention.put_transaction(Transaction("b"), settings)
+
+    time.sleep(0.01)
+
+    assert span_retention.stats() == (0, 4, 0)
+    assert not _streamed(span_retention)
+    assert len(span_retention) == 0
+
+
+def test_span_retention_evicts_oldest(span_retention):
+    for trace_id in "abcd":
+        span_retention.put_transaction(Transaction(trace_id), settings)
+
+    assert len(span_retention) == 6
+    assert span_retention.stats() == (0, 0, 2)
+
+    span_retention.put_transaction(Transaction("a", duration=2.0, spans=1), settings)
+    assert _streamed(span_retention) == ["a-0"]
+
+
+def test_span_retention_evicts_large_transaction(span_retention):
+    # The spans held for a single transaction are limited to the maximum,
+    # without evicting the spans of other traces.
+
+    span_retention.put_transaction(Transaction("a"), settings)
+    span_retention.put_transaction(Transaction("b", spans=10), settings)
+
+    assert len(span_retention) == 6
+    assert span_retention.stats() == (0, 0, 6)
+
+    span_retention.put_transaction(Transaction("b", duration=2.0, spans=0), settings)
+    assert _streamed(span_retention) == ["b-0", "b-1", "b-2", "b-3", "b-4", "b-5"]
+    assert len(span_retention) == 0
+
+
+def test_span_retention_sample_rate(span_retention):
+    span_retention.sample_rate = 0.5
+
+    span_retention.put_transaction(Transaction("0000000000000000000000007fffffff"), settings)
+    span_retention.put_transaction(Transaction("00000000000000000000000080000000"), settings)
+
+    assert len(_streamed(span_retention)) == 2
+    assert len(span_retention) == 2
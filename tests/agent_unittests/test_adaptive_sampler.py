@@ -0,0 +1,130 @@
+# Copyright 2010 New Relic, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import random
+import threading
+import time
+
+from newrelic.core.adaptive_sampler import SamplingBudgets, ThreadLocalSampler
+from newrelic.core.config import _parse_sampling_budgets
+
+
+def test_thread_local_sampler_first_period():
+    sampler = ThreadLocalSampler(10, 60.0)
+
+    assert all(sampler.compute_sampled() for _ in range(10))
+    assert not any(sampler.compute_sampled() for _ in range(10))
+    assert sampler.computed_count() == 20
+
+
+def test_thread_local_sampler_reconcile(monkeypatch):
+    sampler = ThreadLocalSampler(10, 60.0)
+
+    for _ in range(100):
+        sampler.compute_sampled()
+
+    sampler.last_reset = time.time() - sampler.period
+    sampler.reconcile()
+
+    assert sampler.epoch == 1
+    assert sampler.probability == 0.1
+    assert sampler.max_sampled == 20
+    assert sampler.sampled_count() == 0
+
+    # Subsequent periods allow sampling of 2X the target.
+    monkeypatch.setattr(random, "random", lambda: 0.0)
+    assert sum(sampler.compute_sampled() for _ in range(30)) == 20
+
+    # Nothing was computed in the period prior to the current one.
+    sampler.last_reset = time.time() - 2 * sampler.period
+    sampler.reconcile()
+    assert sampler.probability == 1.0
+
+
+def test_thread_local_sampler_threads():
+    sampler = ThreadLocalSampler(10, 60.0)
+    results = []
+
+    def compute():
+        results.extend(sampler.compute_sampled() for _ in range(10))
+
+    threads = [threading.Thread(target=compute) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # The cap is checked without a lock, so racing threads may exceed it
+    # by less than the number of threads.
+    assert 10 <= sum(results) <= 10 + len(threads) - 1
+    assert sampler.computed_count() == 40
+
+    # Counts for threads which did not compute anything in the period are
+    # dropped once the period is reconciled.
+    sampler.last_reset = time.time() - sampler.period
+    sampler.reconcile()
+    sampler.last_reset = time.time() - sampler.period
+    sampler.reconcile()
+    assert not sampler._counts
+
+
+def test_thread_local_sampler_register_during_reconcile():
+    sampler = ThreadLocalSampler(10, 60.0)
+    sampler.compute_sampled()
+
+    threads = []
+    iterations = []
+
+    class Counts(list):
+        # Starts a thread computing its first transaction after the active
+        # counts have been collected but before the list is replaced.
+
+        def __iter__(self):
+            iterations.append(None)
+            if len(iterations) == 2:
+                threads.append(threading.Thread(target=sampler.compute_sampled))
+                threads[0].start()
+                threads[0].join(0.1)
+            return super(Counts, self).__iter__()
+
+    sampler._counts = Counts(sampler._counts)
+    sampler.last_reset = time.time() - sampler.period
+    sampler.reconcile()
+
+    threads[0].join()
+
+    # The counts of the thread are not dropped after being registered.
+    assert len(sampler._counts) == 2
+    assert all(counts.registered for counts in sampler._counts)
+
+
+def test_sampling_budgets_matching():
+    default = ThreadLocalSampler(10, 60.0)
+    budgets = SamplingBudgets(
+        {"WebTransaction/Uri/*": 1, "WebTransaction/Uri/health*": 2, "OtherTransaction/Function/job": 3},
+        default,
+        60.0,
+    )
+
+    assert budgets.sampler("WebTransaction/Uri/health/live").sampling_target == 2
+    assert budgets.sampler("WebTransaction/Uri/users").sampling_target == 1
+    assert budgets.sampler("OtherTransaction/Function/job").sampling_target == 3
+    assert budgets.sampler("OtherTransaction/Function/job2") is default
+
+
+def test_parse_sampling_budgets():
+    assert _parse_sampling_budgets("WebTransaction/Uri/*=5 OtherTransaction/Function/a=b=2 bad") == {
+        "WebTransaction/Uri/*": 5,
+        "OtherTransaction/Function/a=b": 2,
+    }
@@ -14,6 +14,7 @@
 
 import pytest
 from newrelic.core.agent import Agent
+from newrelic.core.application import Application
 from newrelic.core.config import finalize_application_settings
 from testing_support.fixtures import override_generic_settings
 
@@ -73,3 +74,109 @@ def test_agent_final_harvest(agent):
 
     assert agent._applications['fake'].harvest_flexible == 1
     assert agent._applications['fake'].harvest_default == 1
+
+
+@override_generic_settings(SETTINGS, {
+    'harvest_scheduler.enabled': True,
+    'event_harvest_config.report_period_ms': 80.0 * 1000.0,
+})
+def test_agent_final_harvest_scheduler(agent):
+    agent.activate_agent()
+    assert agent._harvest_thread.is_alive()
+
+    agent.shutdown_agent(timeout=5)
+    assert not agent._harvest_thread.is_alive()
+
+    assert agent._applications['fake'].harvest_flexible == 1
+    assert agent._applications['fake'].harvest_default == 1
+
+
+class FakeForkApplication(object):
+    def __init__(self, active):
+        self.active = active
+        self.activated = []
+
+    def reset_after_fork(self):
+        return self.active
+
+    def activate_session(self, activate_agent=None, timeout=0.0):
+        self.activated.append(activate_agent)
+
+
+FORK_SETTINGS = finalize_application_settings({
+    'enabled': True,
+    'fork_handling.enabled': True,
+})
+
+
+def test_agent_after_fork_in_child():
+    agent = Agent(FORK_SETTINGS)
+
+    active = FakeForkApplication(active=True)
+    inactive = FakeForkApplication(active=False)
+    agent._applications = {'active': active, 'inactive': inactive}
+
+    harvest_thread = agent._harvest_thread
+    lock = agent._lock
+
+    agent._after_fork_in_child()
+
+    assert agent._harvest_thread is not harvest_thread
+    assert not agent._harvest_thread.is_alive()
+    assert agent._lock is not lock
+
+    # Only applications which were connected in the parent process are
+    # reconnected, with the harvest thread started once connected.
+
+    assert active.activated == [agent.activate_agent]
+    assert inactive.activated == []
+
+
+@override_generic_settings(FORK_SETTINGS, {'fork_handling.enabled': False})
+def test_agent_after_fork_in_child_disabled():
+    agent = Agent(FORK_SETTINGS)
+
+    active = FakeForkApplication(active=True)
+    agent._applications = {'active': active}
+
+    harvest_thread = agent._harvest_thread
+
+    agent._after_fork_in_child()
+
+    assert agent._harvest_thread is harvest_thread
+    assert active.activated == []
+
+
+def test_application_reset_after_fork():
+    application = Application('Fork App')
+    application._active_session = object()
+    application._environment = [['Agent Version', 'test']]
+
+    stats_engine = application._stats_engine
+    stats_lock = application._stats_lock
+
+    assert application.reset_after_fork()
+
+    assert application._active_session is None
+    assert application._inherited_environment == [['Agent Version', 'test']]
+    assert application._stats_engine is not stats_engine
+    assert application._stats_lock is not stats_lock
+
+    # The environment is only inherited where the application connected
+    # in the parent process.
+
+    assert not application.reset_after_fork()
+    assert application._inherited_environment is None
+
+
+def test_application_reset_after_fork_connecting():
+    application = Application('Fork App')
+
+    # An application which was still connecting in the parent process at
+    # the time of the fork is also reconnected.
+
+    application._activation_requested = True
+
+    assert application.reset_after_fork()
+    assert application._active_session is None
+    assert application._inherited_environment is None
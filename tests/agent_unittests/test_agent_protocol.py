@@ -24,6 +24,7 @@ from newrelic.common import certs, system_info
 from newrelic.common.agent_http import DeveloperModeClient
 from newrelic.common.encoding_utils import json_decode, serverless_payload_decode
 from newrelic.common.utilization import CommonUtilization
+from newrelic.core import agent_protocol
 from newrelic.core.agent_protocol import AgentProtocol, ServerlessModeProtocol
 from newrelic.core.config import finalize_application_settings, global_settings
 from newrelic.core.internal_metrics import InternalTraceContext
@@ -501,6 +502,28 @@ def test_connect_metadata(monkeypatch):
     assert connect_payload["metadata"] == {"NEW_RELIC_METADATA_FOOBAR": "foobar"}
 
 
+@pytest.mark.parametrize("fork_handling", (True, False))
+def test_connect_payload_host_utilization_cached(monkeypatch, fork_handling):
+    calls = []
+    gather = agent_protocol._gather_host_utilization
+
+    def _gather_host_utilization(settings):
+        calls.append(settings)
+        return gather(settings)
+
+    monkeypatch.setattr(agent_protocol, "_gather_host_utilization", _gather_host_utilization)
+    monkeypatch.setattr(agent_protocol, "_host_utilization_cache", {})
+
+    settings = finalize_application_settings({"fork_handling.enabled": fork_handling})
+
+    first = AgentProtocol._connect_payload(APP_NAME, LINKED_APPS, ENVIRONMENT, settings)[0]
+    second = AgentProtocol._connect_payload(APP_NAME, LINKED_APPS, ENVIRONMENT, settings)[0]
+
+    assert first["utilization"] == second["utilization"]
+    assert first["utilization"] is not second["utilization"]
+    assert len(calls) == (1 if fork_handling else 2)
+
+
 def test_serverless_protocol_connect():
     settings = global_settings()
     protocol = ServerlessModeProtocol.connect(
@@ -0,0 +1,103 @@
+# Copyright 2010 New Relic, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import pytest
+from testing_support.fixtures import override_generic_settings
+
+from newrelic.core import external_node
+from newrelic.core.config import global_settings
+from newrelic.core.external_node import (
+    ExternalNode,
+    external_metric_name,
+    external_url,
+)
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    external_node._external_url_cache.clear()
+    yield
+    external_node._external_url_cache.clear()
+
+
+@pytest.mark.parametrize(
+    "url,netloc,url_with_path",
+    (
+        ("http://example.com:80/path?q=1", "example.com", "http://example.com:80/path"),
+        ("https://example.com:443/", "example.com", "https://example.com:443/"),
+        ("https://example.com:8443/a#frag", "example.com:8443", "https://example.com:8443/a"),
+        ("/relative", "unknown", "/relative"),
+        (None, "unknown", ""),
+    ),
+)
+def test_external_url_decomposition(url, netloc, url_with_path):
+    details = external_url(url)
+
+    assert details.netloc == netloc
+    assert details.url_with_path == url_with_path
+    assert details.http_url == url_with_path
+    assert details.all_metric_name == "External/%s/all" % netloc
+    assert external_metric_name(details, "requests", "GET") == "External/%s/requests/GET" % netloc
+    assert external_metric_name(details, "urllib", None) == "External/%s/urllib/" % netloc
+
+
+def test_external_url_cache_ignores_query():
+    first = external_url("http://example.com/path?q=1")
+    second = external_url("http://example.com/path?q=2")
+
+    assert first is second
+    assert len(external_node._external_url_cache) == 1
+
+
+def _external_node(url):
+    return ExternalNode(
+        library="requests",
+        url=url,
+        method="GET",
+        children=[],
+        start_time=0.0,
+        end_time=1.0,
+        duration=1.0,
+        exclusive=1.0,
+        params={},
+        guid=None,
+        agent_attributes={},
+        user_attributes={},
+    )
+
+
+def test_external_node_details_not_shared():
+    first = _external_node("http://example.com/path?q=1#a")
+    second = _external_node("http://example.com/path?q=2#b")
+
+    assert first.external_url is second.external_url
+    assert first.details.query == "q=1"
+    assert first.details.fragment == "a"
+    assert second.details.query == "q=2"
+    assert second.details.fragment == "b"
+
+
+@override_generic_settings(global_settings(), {"agent_limits.external_url_cache_maximum": 2})
+def test_external_url_cache_bounded():
+    for i in range(5):
+        external_url("http://example.com/%d" % i)
+
+    assert len(external_node._external_url_cache) <= 2
+
+
+@override_generic_settings(global_settings(), {"agent_limits.external_url_cache_maximum": 0})
+def test_external_url_cache_disabled():
+    assert external_url("http://example.com/") is not external_url("http://example.com/")
+    assert not external_node._external_url_cache
@@ -24,6 +24,7 @@ from testing_support.fixtures import (
 )
 
 from newrelic.common.agent_http import DeveloperModeClient
+from newrelic.common.encoding_utils import json_decode, json_encode
 from newrelic.common.object_wrapper import function_wrapper, transient_function_wrapper
 from newrelic.core.application import Application
 from newrelic.core.config import finalize_application_settings, global_settings
@@ -31,8 +32,17 @@ from newrelic.core.custom_event import create_custom_event
 from newrelic.core.error_node import ErrorNode
 from newrelic.core.function_node import FunctionNode
 from newrelic.core.log_event_node import LogEventNode
+from newrelic.core.metric import TimeMetric
 from newrelic.core.root_node import RootNode
-from newrelic.core.stats_engine import CustomMetrics, SampledDataSet, DimensionalMetrics
+from newrelic.core.rules_engine import RulesEngine
+from newrelic.core.stats_engine import (
+    CustomMetrics,
+    METRIC_OVERFLOW_TAGS,
+    DimensionalMetrics,
+    SampledDataSet,
+    StatsEngine,
+    metric_data_json,
+)
 from newrelic.core.transaction_node import TransactionNode
 from newrelic.network.exceptions import RetryDataForRequest
 
@@ -680,6 +690,36 @@ def test_compute_sampled_no_reset():
     assert app.compute_sampled() is True
 
 
+@override_generic_settings(
+    settings,
+    {
+        "developer_mode": True,
+        "license_key": "**NOT A LICENSE KEY**",
+        "feature_flag": set(),
+        "sampling_budgets.enabled": True,
+        "sampling_budgets.targets": {"WebTransaction/Function/health": 1, "WebTransaction/Uri/*": 2},
+    },
+)
+def test_adaptive_sampling_budgets():
+    app = Application("Python Agent Test (Harvest Loop)")
+    app.connect_to_data_collector(None)
+
+    # High volume health checks cannot use up the default sampling target.
+    for _ in range(5):
+        app.compute_sampled("WebTransaction/Function/health")
+
+    assert app.sampling_budgets.sampler("WebTransaction/Function/health").sampled_count() == 1
+
+    for _ in range(3):
+        app.compute_sampled("WebTransaction/Uri/a")
+    assert app.sampling_budgets.sampler("WebTransaction/Uri/b").sampled_count() == 2
+
+    for _ in range(settings.sampling_target):
+        assert app.compute_sampled("WebTransaction/Function/checkout") is True
+
+    assert app.compute_sampled("WebTransaction/Function/checkout") is False
+
+
 def test_analytic_event_sampling_info():
     synthetics_limit = 10
     transactions_limit = 20
@@ -996,3 +1036,119 @@ def test_get_agent_commands_raises():
     app.connect_to_data_collector(None)
     with pytest.raises(RetryDataForRequest):
         app.process_agent_commands()
+
+
+def test_metric_data_json():
+    stats = StatsEngine()
+    stats.reset_stats(settings)
+
+    stats.record_custom_metric("Custom/Metric", 1)
+    stats.record_custom_metric(u"Custom/Unicode/\u00e9", {"count": 2, "total": 3.5, "min": 1, "max": 2.5})
+    stats.record_custom_metric("Custom/NaN", float("nan"))
+    stats.record_custom_metric("Custom/Boolean", True)
+
+    metric_data = stats.metric_data()
+
+    # The cached name and scope are used for the second encoding.
+
+    for _ in range(2):
+        encoded = metric_data_json(metric_data)
+        assert json_decode(encoded) == json_decode(json_encode(metric_data))
+
+
+def test_metric_data_normalizer_cached():
+    app = Application("Python Agent Test (Harvest Loop)")
+    app._active_session = object()
+    app._rules_engine["metric"] = RulesEngine(
+        [
+            {
+                "match_expression": "^Custom/[0-9]+$",
+                "replacement": "Custom/*",
+                "ignore": False,
+                "eval_order": 0,
+                "terminate_chain": True,
+                "each_segment": False,
+                "replace_all": False,
+            }
+        ]
+    )
+
+    calls = []
+    normalize_name = app.normalize_name
+
+    def _normalize_name(name, rule_type):
+        calls.append(name)
+        return normalize_name(name, rule_type)
+
+    app.normalize_name = _normalize_name
+
+    stats = StatsEngine()
+    stats.reset_stats(settings)
+
+    stats.record_custom_metric("Custom/1", 1)
+    stats.record_custom_metric("Custom/2", 2)
+
+    for _ in range(2):
+        metric_data = dict(
+            (key["name"], value) for key, value in stats.metric_data(app._metric_normalizer())
+        )
+        assert metric_data["Custom/*"][0] == 2
+
+    assert sorted(calls) == ["Custom/1", "Custom/2"]
+
+    # The stats merged under the normalized name are a copy.
+
+    assert stats.stats_table[("Custom/1", "")][0] == 1
+    assert stats.stats_table[("Custom/2", "")][0] == 1
+
+
+def test_metric_names_overflow():
+    stats = StatsEngine()
+    stats.reset_stats(finalize_application_settings({"agent_limits.metric_names_maximum": 2}))
+
+    for i in range(4):
+        stats.record_custom_metric("Custom/%d" % i, 1)
+        stats.record_time_metric(
+            TimeMetric(name="Function/%d" % i, scope="WebTransaction/Test", duration=1.0, exclusive=None)
+        )
+
+    # Merged metrics are subject to the same limit.
+
+    workarea = stats.create_workarea()
+    workarea.record_custom_metric("Custom/4", 1)
+    stats.merge(workarea)
+
+    stats_table = stats.stats_table
+
+    assert ("Custom/1", "") in stats_table
+    assert ("Custom/2", "") not in stats_table
+    assert stats_table[("Custom/overflow", "")][0] == 3
+
+    # The data for scoped metrics is only counted.
+
+    assert ("Function/1", "WebTransaction/Test") in stats_table
+    assert ("Function/2", "WebTransaction/Test") not in stats_table
+    assert ("Function/overflow", "") not in stats_table
+
+    assert stats_table[("Supportability/Python/MetricCardinality/Overflow/Custom", "")][0] == 3
+    assert stats_table[("Supportability/Python/MetricCardinality/Overflow/Function", "")][0] == 2
+
+
+def test_metric_tag_sets_overflow():
+    stats = StatsEngine()
+    stats.reset_stats(finalize_application_settings({"agent_limits.metric_tag_sets_maximum": 2}))
+
+    for i in range(3):
+        stats.record_dimensional_metric("Dimensional/Metric", 1, tags={"index": i})
+
+    workarea = stats.create_workarea()
+    workarea.record_dimensional_metric("Dimensional/Metric", 1, tags={"index": 3})
+    stats.merge(workarea)
+
+    tag_sets = stats.dimensional_stats_table.get("Dimensional/Metric")
+
+    assert len(tag_sets) == 3
+    assert tag_sets[METRIC_OVERFLOW_TAGS][0] == 2
+
+    stats_table = stats.stats_table
+    assert stats_table[("Supportability/Python/MetricCardinality/TagSets/Overflow", "")][0] == 2
@@ -0,0 +1,101 @@
+# Copyright 2010 New Relic, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import random
+
+import pytest
+
+from newrelic.core import harvest_scheduler
+from newrelic.core.harvest_scheduler import HarvestScheduler
+
+START = 1000.0
+FLEXIBLE_PERIOD = 5.0
+
+
+class FakeClock(object):
+    def __init__(self, until):
+        self.now = START
+        self.until = until
+
+    def time(self):
+        return self.now
+
+    def is_set(self):
+        return self.now >= self.until
+
+    def wait(self, timeout):
+        self.now += timeout
+
+
+@pytest.fixture()
+def clock(monkeypatch):
+    clock = FakeClock(until=START + 130.0)
+    monkeypatch.setattr(harvest_scheduler, "time", clock)
+    return clock
+
+
+def _run(clock, applications, jitter=0.0, slow=None):
+    harvests = []
+
+    def harvest(application, flexible, lag, skipped):
+        harvests.append((application, flexible, clock.now, lag, skipped))
+        if application == slow and flexible:
+            clock.now += 3 * FLEXIBLE_PERIOD - 3.0
+
+    scheduler = HarvestScheduler(lambda: applications, clock, lambda: FLEXIBLE_PERIOD, jitter)
+    scheduler.run(harvest)
+
+    return harvests
+
+
+def _times(harvests, application, flexible):
+    return [entry[2] for entry in harvests if entry[0] == application and entry[1] == flexible]
+
+
+def test_harvest_scheduler_independent_deadlines(clock):
+    random.seed(0)
+
+    harvests = _run(clock, ["a", "b"], jitter=10.0)
+
+    for application in ("a", "b"):
+        flexible = _times(harvests, application, True)
+        default = _times(harvests, application, False)
+
+        # The first harvest is offset by up to the period, after which the
+        # harvests run on time.
+
+        assert START + FLEXIBLE_PERIOD <= flexible[0] <= START + 2 * FLEXIBLE_PERIOD
+        assert START + 60.0 <= default[0] <= START + 70.0
+
+        assert all(b - a == pytest.approx(FLEXIBLE_PERIOD) for a, b in zip(flexible, flexible[1:]))
+
+    assert _times(harvests, "a", False) != _times(harvests, "b", False)
+    assert all(entry[3] < 1.0 and entry[4] == 0 for entry in harvests)
+
+
+def test_harvest_scheduler_overdue_skipped(clock):
+    clock.until = START + 18.0
+
+    harvests = _run(clock, ["slow", "other"], slow="slow")
+
+    # The slow harvest delays that of the other application, which then
+    # runs once with the missed cycles skipped, as does the next harvest
+    # of the slow application.
+
+    assert [(entry[0], entry[4]) for entry in harvests] == [("slow", 0), ("other", 2), ("slow", 1)]
+
+    lag = harvests[1][3]
+    assert lag == pytest.approx(3 * FLEXIBLE_PERIOD - 3.0)
+
+    assert _times(harvests, "other", True) == [pytest.approx(START + 3 * FLEXIBLE_PERIOD + 2.0)]
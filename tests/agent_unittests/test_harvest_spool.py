@@ -0,0 +1,223 @@
+# Copyright 2010 New Relic, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import stat
+
+import pytest
+from test_agent_protocol import HttpClientRecorder
+
+from newrelic.core import harvest_spool
+from newrelic.core.agent_protocol import AgentProtocol
+from newrelic.core.config import finalize_application_settings
+from newrelic.core.harvest_spool import HarvestSpool
+from newrelic.network.exceptions import RetryDataForRequest
+
+# A process ID above the maximum which can be configured for Linux.
+
+DEAD_PID = 4194305
+
+
+@pytest.fixture(autouse=True)
+def clear_sent_values():
+    yield
+    HttpClientRecorder.SENT[:] = []
+    HttpClientRecorder.STATUS_CODE = None
+
+
+def _settings(directory, run_id):
+    return finalize_application_settings(
+        {
+            "app_name": "Spool App",
+            "agent_run_id": run_id,
+            "harvest_spool.enabled": True,
+            "harvest_spool.directory": str(directory),
+        }
+    )
+
+
+def _segments(spool):
+    return sorted(name.split(".")[-1] for name in os.listdir(spool.directory))
+
+
+def test_spool_payloads_during_outage(tmpdir):
+    protocol = AgentProtocol(_settings(tmpdir, "old-run"), client_cls=HttpClientRecorder)
+
+    HttpClientRecorder.STATUS_CODE = 503
+
+    assert protocol.send("metric_data", ("old-run", 1.0, 2.0, [])) is None
+    assert len(HttpClientRecorder.SENT) == 1
+
+    # While backing off the payloads are spooled without being sent.
+
+    assert protocol.send("analytic_event_data", ("old-run", {}, [])) is None
+    assert len(HttpClientRecorder.SENT) == 1
+
+    # Other endpoints are not spooled.
+
+    with pytest.raises(RetryDataForRequest):
+        protocol._spool.succeeded()
+        protocol.send("get_agent_commands", ("old-run",))
+
+    HttpClientRecorder.STATUS_CODE = None
+    HttpClientRecorder.SENT[:] = []
+
+    # The payloads are sent by the session of a restarted process with
+    # the run ID replaced.
+
+    protocol = AgentProtocol(_settings(tmpdir, "new-run"), client_cls=HttpClientRecorder)
+
+    assert protocol.drain_spool() == 2
+
+    methods = [request.params["method"] for request in HttpClientRecorder.SENT]
+    assert methods == ["metric_data", "analytic_event_data"]
+
+    for request in HttpClientRecorder.SENT:
+        assert request.params["run_id"] == "new-run"
+        assert request.payload.startswith(b'["new-run",')
+
+    assert protocol.drain_spool() == 0
+    assert not os.listdir(protocol._spool.directory)
+
+
+def test_spool_backoff_reset_on_send(tmpdir):
+    protocol = AgentProtocol(_settings(tmpdir, "run"), client_cls=HttpClientRecorder)
+    spool = protocol._spool
+
+    HttpClientRecorder.STATUS_CODE = 503
+
+    protocol.send("metric_data", ("run", 1.0, 2.0, []))
+    assert spool.in_backoff()
+
+    # The backoff starts over once a payload is sent successfully, even
+    # where there were no spooled payloads to drain.
+
+    spool._next_attempt = 0.0
+    HttpClientRecorder.STATUS_CODE = None
+
+    protocol.send("metric_data", ("run", 1.0, 2.0, []))
+    assert spool._backoff == 0.0
+
+    HttpClientRecorder.STATUS_CODE = 503
+
+    protocol.send("metric_data", ("run", 1.0, 2.0, []))
+    assert spool._backoff == harvest_spool._BACKOFF_INITIAL
+
+
+def test_spool_bounded(tmpdir):
+    spool = HarvestSpool(str(tmpdir), max_bytes=1024, segment_bytes=1)
+
+    payload = os.urandom(400)
+
+    for _ in range(4):
+        assert spool.append("metric_data", "run", payload)
+
+    # Only the newest segments which fit in the spool are kept.
+
+    assert _segments(spool) == ["seg", "seg"]
+
+    assert not spool.append("metric_data", "run", os.urandom(2048))
+
+
+def test_spool_abandoned_segments(tmpdir):
+    spool = HarvestSpool(str(tmpdir), max_bytes=1024 * 1024, segment_bytes=1024 * 1024)
+
+    spool.append("metric_data", "run", b"[1]")
+    spool.append("error_data", "run", b"[2]")
+
+    # A segment left open by a process which has exited is sent, as is
+    # one left by a prior process with the same process ID.
+
+    name = [name for name in os.listdir(spool.directory) if name.startswith("metric_data")][0]
+    parts = name.split(".")
+    parts[1] = str(DEAD_PID)
+    os.rename(os.path.join(spool.directory, name), os.path.join(spool.directory, ".".join(parts)))
+
+    sent = []
+
+    recycled = HarvestSpool(str(tmpdir), max_bytes=1024 * 1024, segment_bytes=1024 * 1024)
+    assert recycled.drain(lambda *args: sent.append(args), 10) == 2
+
+    assert sorted(sent) == [("error_data", "run", b"[2]"), ("metric_data", "run", b"[1]")]
+
+
+def test_spool_drain_retry(tmpdir):
+    spool = HarvestSpool(str(tmpdir), max_bytes=1024 * 1024, segment_bytes=1024 * 1024)
+
+    for i in range(3):
+        spool.append("metric_data", "run", b"[%d]" % i)
+
+    sent = []
+
+    def send(method, run_id, payload):
+        if len(sent) == 1:
+            raise RetryDataForRequest
+        sent.append(payload)
+
+    assert spool.drain(send, 10) == 1
+    assert spool.in_backoff()
+    assert spool.drain(send, 10) == 0
+
+    spool.succeeded()
+
+    assert spool.drain(lambda method, run_id, payload: sent.append(payload), 1) == 1
+    assert spool.drain(lambda method, run_id, payload: sent.append(payload), 10) == 1
+
+    assert sent == [b"[0]", b"[1]", b"[2]"]
+
+
+def test_spool_private(tmpdir, monkeypatch):
+    spool = HarvestSpool(str(tmpdir.join("spool")), max_bytes=1024 * 1024, segment_bytes=1024 * 1024)
+
+    assert spool.append("metric_data", "run", b"[1]")
+
+    assert stat.S_IMODE(os.stat(spool.directory).st_mode) == 0o700
+    for name in os.listdir(spool.directory):
+        assert stat.S_IMODE(os.stat(os.path.join(spool.directory, name)).st_mode) == 0o600
+
+    # A directory owned by another user is not used.
+
+    monkeypatch.setattr(os, "getuid", lambda: os.stat(spool.directory).st_uid + 1)
+
+    assert not spool.append("metric_data", "run", b"[2]")
+    assert spool.drain(lambda *args: None, 10) == 0
+
+
+def test_spool_configured_directory(tmpdir):
+    configured = tmpdir.mkdir("configured")
+    configured.chmod(0o755)
+
+    spool = HarvestSpool(str(configured.join("app")), max_bytes=1024 * 1024, segment_bytes=1024 * 1024)
+
+    assert spool.append("metric_data", "run", b"[1]")
+
+    # Only the spool directory is made private where the directory
+    # containing it was configured.
+
+    assert stat.S_IMODE(os.stat(str(configured)).st_mode) == 0o755
+    assert stat.S_IMODE(os.stat(spool.directory).st_mode) == 0o700
+
+
+def test_spool_default_directory(tmpdir, monkeypatch):
+    default = tmpdir.mkdir("default")
+    default.chmod(0o755)
+
+    monkeypatch.setattr(harvest_spool, "default_spool_directory", lambda: str(default))
+
+    spool = HarvestSpool(str(default.join("app")), max_bytes=1024 * 1024, segment_bytes=1024 * 1024)
+
+    assert spool.append("metric_data", "run", b"[1]")
+
+    assert stat.S_IMODE(os.stat(str(default)).st_mode) == 0o700
+    assert stat.S_IMODE(os.stat(spool.directory).st_mode) == 0o700
@@ -0,0 +1,136 @@
+# Copyright 2010 New Relic, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from testing_support.fixtures import override_generic_settings
+
+from newrelic.api.function_trace import FunctionTrace
+from newrelic.core import string_table
+from newrelic.core.attribute import process_user_attribute
+from newrelic.core.config import global_settings
+from newrelic.core.database_utils import SQLDatabase, SQLStatement
+from newrelic.core.string_table import InternPool, intern_string
+
+
+def _copy(value):
+    # Builds an equal string which is not the same object.
+    return "".join(list(value))
+
+
+def test_intern_pool_hits_and_misses():
+    pool = InternPool(maximum=10)
+
+    first = _copy("WebTransaction/Function/app:index")
+    second = _copy("WebTransaction/Function/app:index")
+    assert first is not second
+
+    assert pool.intern(first) is first
+    assert pool.intern(second) is first
+
+    hits, misses, resets, entries, size = pool.stats()
+    assert (hits, misses, resets, entries) == (1, 1, 0, 1)
+    assert size == len(first)
+
+    # The counters are reset once reported.
+
+    assert pool.stats()[:3] == (0, 0, 0)
+
+
+def test_intern_pool_size_in_bytes():
+    pool = InternPool(maximum=10)
+
+    value = _copy(u"Custom/caf\u00e9")
+    pool.intern(value)
+
+    assert pool.stats()[4] == len(value.encode("utf-8"))
+
+    pool.intern(bytes(bytearray(b"Custom/bytes")))
+
+    assert pool.stats()[4] == len(value.encode("utf-8")) + len(b"Custom/bytes")
+
+
+def test_intern_pool_reset_when_full():
+    pool = InternPool(maximum=2)
+
+    for value in ("a", "b", "c"):
+        pool.intern(_copy(value))
+
+    hits, misses, resets, entries, _ = pool.stats()
+    assert (misses, resets, entries) == (3, 1, 1)
+
+
+def test_intern_pool_ignores_other_types():
+    pool = InternPool(maximum=10)
+
+    value = (1, 2)
+    assert pool.intern(value) is value
+    assert pool.intern([1]) == [1]
+    assert len(pool) == 0
+
+
+def test_intern_pool_disabled():
+    pool = InternPool(maximum=0)
+
+    first = _copy("name")
+    assert pool.intern(first) is first
+    assert pool.intern(_copy("name")) is not first
+    assert len(pool) == 0
+
+
+def test_intern_pool_after_fork_in_child():
+    pool = InternPool(maximum=10)
+
+    # A lock held by another thread at the time of a fork is replaced.
+
+    pool._lock.acquire()
+    pool._after_fork_in_child()
+
+    value = _copy("Custom/Value")
+    assert pool.intern(value) is value
+
+
+@override_generic_settings(global_settings(), {"fork_handling.enabled": False})
+def test_intern_pool_after_fork_in_child_disabled():
+    lock = string_table.intern_pool()._lock
+
+    # The pool is only reset where fork handling has been enabled.
+
+    string_table._after_fork_in_child()
+    assert string_table.intern_pool()._lock is lock
+
+
+def test_user_attribute_name_interned():
+    name, _ = process_user_attribute(_copy("user.attribute"), 1)
+    other, _ = process_user_attribute(_copy("user.attribute"), 2)
+
+    assert name is other
+    assert intern_string(_copy("user.attribute")) is name
+
+
+def test_function_node_name_interned():
+    first = FunctionTrace(_copy("Function/app:index")).create_node()
+    second = FunctionTrace(_copy("Function/app:index")).create_node()
+
+    assert first.name is second.name
+
+
+def test_sql_statement_interned():
+    database = SQLDatabase(None)
+    sql = "select * from table where a = 1"
+
+    first = SQLStatement(_copy(sql), database)
+    second = SQLStatement(_copy(sql), database)
+
+    assert first.obfuscated is second.obfuscated
+    assert first.operation is second.operation
+    assert first.target is second.target
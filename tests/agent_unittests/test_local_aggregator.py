@@ -0,0 +1,215 @@
+# Copyright 2010 New Relic, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import shutil
+import socket
+import stat
+import tempfile
+
+import pytest
+
+from newrelic.core import local_aggregator
+from newrelic.core.application import Application
+from newrelic.core.config import finalize_application_settings
+from newrelic.core.local_aggregator import (
+    LocalAggregator,
+    harvest_payload,
+    send_payload,
+)
+from newrelic.core.stats_engine import StatsEngine
+
+
+@pytest.fixture()
+def path():
+    # UNIX socket paths are limited in length so the pytest temporary
+    # directory can't be relied upon.
+
+    directory = tempfile.mkdtemp()
+    yield os.path.join(directory, "aggregator.sock")
+    shutil.rmtree(directory)
+
+
+def _stats_engine(settings):
+    stats = StatsEngine()
+    stats.reset_stats(settings)
+    return stats
+
+
+class FakeSession(object):
+    def __init__(self, configuration):
+        self.configuration = configuration
+        self.closed = 0
+
+    def close_connection(self):
+        self.closed += 1
+
+
+class FakeApplication(object):
+    def __init__(self, settings):
+        self.active = True
+        self.stats = _stats_engine(settings)
+
+    def merge_local_harvest_data(self, data):
+        self.stats.merge_local_harvest_data(data)
+        return True
+
+
+class FakeAgent(object):
+    def __init__(self):
+        self.applications = {}
+        self.activated = []
+
+    def application(self, app_name):
+        return self.applications.get(app_name)
+
+    def activate_application(self, app_name, linked_applications=None):
+        self.activated.append((app_name, linked_applications))
+
+
+@pytest.fixture()
+def settings():
+    return finalize_application_settings()
+
+
+@pytest.fixture()
+def aggregator(path, settings):
+    agent = FakeAgent()
+    aggregator = LocalAggregator(path, agent, timeout=5.0)
+    aggregator.start()
+    yield aggregator, agent
+    aggregator.stop()
+
+
+def test_local_harvest_data_merge(settings):
+    aggregated = _stats_engine(settings)
+
+    for worker in range(3):
+        stats = _stats_engine(settings)
+        stats.record_custom_metric("Custom/Worker", 1)
+        stats.record_dimensional_metric("Dimensional/Worker", 1, tags={"worker": worker})
+        stats.custom_events.add(["event-%d" % worker], priority=worker)
+
+        aggregated.merge_local_harvest_data(stats.local_harvest_data())
+
+    assert aggregated.stats_table[("Custom/Worker", "")][0] == 3
+    assert len(aggregated.dimensional_stats_table.get("Dimensional/Worker")) == 3
+    assert sorted(aggregated.custom_events) == [["event-0"], ["event-1"], ["event-2"]]
+    assert aggregated.custom_events.num_seen == 3
+
+
+def test_local_aggregator_activates_application(aggregator, settings):
+    aggregator, agent = aggregator
+
+    stats = _stats_engine(settings)
+    stats.record_custom_metric("Custom/Worker", 1)
+
+    payload = harvest_payload("Aggregated App", ["Linked App"], stats)
+
+    # Data for an application which is not yet active is rejected, but
+    # triggers the activation of the application.
+
+    assert not send_payload(aggregator.path, payload, timeout=5.0)
+    assert agent.activated == [("Aggregated App", ["Linked App"])]
+
+    application = agent.applications["Aggregated App"] = FakeApplication(settings)
+
+    assert send_payload(aggregator.path, payload, timeout=5.0)
+    assert application.stats.stats_table[("Custom/Worker", "")][0] == 1
+
+
+def test_local_aggregator_harvest(aggregator, settings):
+    aggregator, agent = aggregator
+
+    aggregated = agent.applications["Worker App"] = FakeApplication(settings)
+
+    configuration = finalize_application_settings(
+        {
+            "local_aggregator.enabled": True,
+            "local_aggregator.socket_path": aggregator.path,
+            "collect_traces": False,
+        }
+    )
+
+    application = Application("Worker App")
+    application._active_session = FakeSession(configuration)
+    application._harvest_enabled = True
+    application._stats_engine.reset_stats(configuration)
+    application._stats_custom_engine.reset_stats(configuration)
+
+    application.record_custom_metric("Custom/Worker", 1)
+
+    application.harvest()
+
+    assert aggregated.stats.stats_table[("Custom/Worker", "")][0] == 1
+    assert ("Instance/Reporting", "") in aggregated.stats.stats_table
+    assert application._active_session.closed == 1
+
+    # Where the aggregator can't be reached the data is retained for the
+    # next harvest.
+
+    aggregator.stop()
+
+    application.record_custom_metric("Custom/Worker", 1)
+
+    application.harvest()
+
+    stats_table = application._stats_engine.stats_table
+    assert stats_table[("Custom/Worker", "")][0] == 1
+    assert stats_table[("Supportability/Python/LocalAggregator/Rejected", "")][0] == 1
+
+
+def test_send_payload_no_aggregator(path, settings):
+    payload = harvest_payload("Worker App", [], _stats_engine(settings))
+
+    with pytest.raises(Exception):
+        send_payload(path, payload, timeout=1.0)
+
+
+def test_local_aggregator_other_user(aggregator, settings, monkeypatch):
+    aggregator, agent = aggregator
+
+    payload = harvest_payload("Aggregated App", [], _stats_engine(settings))
+
+    # Harvest data is neither sent to nor accepted from a process of
+    # another user.
+
+    monkeypatch.setattr(local_aggregator, "_peer_uid", lambda sock: os.getuid() + 1)
+
+    with pytest.raises(socket.error):
+        send_payload(aggregator.path, payload, timeout=5.0)
+
+    server, client = socket.socketpair(socket.AF_UNIX, socket.SOCK_STREAM)
+
+    try:
+        aggregator._handle(server)
+    finally:
+        server.close()
+        client.close()
+
+    assert not agent.activated
+
+
+def test_default_socket_path_private():
+    directory = os.path.dirname(local_aggregator.default_socket_path())
+
+    assert directory.endswith("-%d" % os.getuid())
+
+    aggregator = LocalAggregator(local_aggregator.default_socket_path(), FakeAgent(), timeout=5.0)
+    aggregator.start()
+
+    try:
+        assert stat.S_IMODE(os.stat(directory).st_mode) == 0o700
+    finally:
+        aggregator.stop()
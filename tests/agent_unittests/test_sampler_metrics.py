@@ -15,15 +15,21 @@
 import gc
 import os
 import platform
+import sys
+import threading
+import time
 
 import pytest
 from testing_support.fixtures import override_generic_settings
 
 from newrelic.core.config import global_settings
 from newrelic.packages import six
+from newrelic.samplers import cgroup_usage
+from newrelic.samplers.cgroup_usage import cgroup_usage_data_source
 from newrelic.samplers.cpu_usage import cpu_usage_data_source
 from newrelic.samplers.gc_data import garbage_collector_data_source
 from newrelic.samplers.memory_usage import memory_usage_data_source
+from newrelic.samplers.thread_cpu_usage import thread_cpu_usage_data_source
 
 settings = global_settings()
 
@@ -50,6 +56,14 @@ def memory_data_source():
     yield sampler
 
 
+@pytest.fixture
+def thread_cpu_data_source():
+    sampler = thread_cpu_usage_data_source(settings=())["factory"](environ=())
+    sampler.start()
+    yield sampler
+    sampler.stop()
+
+
 PID = os.getpid()
 
 if six.PY2:
@@ -133,6 +147,49 @@ def test_gc_metrics_config(gc_data_source, enabled):
     _test()
 
 
+@pytest.mark.skipif(
+    platform.python_implementation() == "PyPy" or six.PY2,
+    reason="GC callbacks are not available",
+)
+def test_gc_pause_histogram_and_allocations(gc_data_source):
+    @override_generic_settings(
+        settings,
+        {
+            "gc_runtime_metrics.enabled": True,
+            "gc_runtime_metrics.top_object_count_limit": 0,
+        },
+    )
+    def _test():
+        # Clear out any collections from before the test.
+        list(gc_data_source())
+
+        gc.collect()
+        gc.collect(0)
+        objects = [[] for _ in range(100)]
+
+        metrics_table = dict(gc_data_source() or ())
+        del objects
+
+        pause_counts = [0, 0, 0]
+        for name, value in metrics_table.items():
+            if name.startswith("GC/pause/%d/" % PID):
+                gen = int(name.split("/")[3])
+                pause_counts[gen] += value["count"]
+
+        assert pause_counts[0] >= 1
+        assert pause_counts[2] >= 1
+        assert sum(pause_counts) == metrics_table["GC/time/%d/all" % PID]["count"]
+
+        collected = metrics_table["GC/collected_per_collection/%d/2" % PID]
+        assert collected["count"] == pause_counts[2]
+        assert "GC/uncollectable_per_collection/%d/2" % PID in metrics_table
+
+        assert metrics_table["GC/allocations/%d" % PID]["count"] >= 100
+        assert metrics_table["GC/allocation_rate/%d" % PID] > 0
+
+    _test()
+
+
 EXPECTED_CPU_METRICS = (
     "CPU/User Time",
     "CPU/User/Utilization",
@@ -163,3 +220,182 @@ def test_memory_metrics_collection(memory_data_source):
 
     for metric in EXPECTED_MEMORY_METRICS:
         assert metric in metrics_table
+
+
+def _write_cgroup_files(root, files):
+    for name, contents in files.items():
+        path = root.join(*name.split("/"))
+        path.dirpath().ensure(dir=True)
+        path.write(contents)
+
+
+CGROUP_V2_FILES = {
+    "cgroup.controllers": "cpu memory\n",
+    "cpu.max": "200000 100000\n",
+    "cpu.stat": "usage_usec 1000000\nuser_usec 600000\nsystem_usec 400000\n"
+    "nr_periods 100\nnr_throttled 10\nthrottled_usec 50000\n",
+    "memory.current": "%d\n" % (256 * 1024 * 1024),
+    "memory.max": "%d\n" % (1024 * 1024 * 1024),
+}
+
+CGROUP_V2_FILES_UPDATED = {
+    "cpu.stat": "usage_usec 3000000\nuser_usec 1800000\nsystem_usec 1200000\n"
+    "nr_periods 200\nnr_throttled 60\nthrottled_usec 550000\n",
+    "memory.current": "%d\n" % (512 * 1024 * 1024),
+}
+
+CGROUP_V1_FILES = {
+    "cpu,cpuacct/cpu.cfs_quota_us": "50000\n",
+    "cpu,cpuacct/cpu.cfs_period_us": "100000\n",
+    "cpu,cpuacct/cpu.stat": "nr_periods 100\nnr_throttled 10\nthrottled_time 50000000\n",
+    "cpu,cpuacct/cpuacct.usage": "1000000000\n",
+    "memory/memory.usage_in_bytes": "%d\n" % (256 * 1024 * 1024),
+    "memory/memory.limit_in_bytes": "%d\n" % (1024 * 1024 * 1024),
+}
+
+CGROUP_V1_FILES_UPDATED = {
+    "cpu,cpuacct/cpu.stat": "nr_periods 200\nnr_throttled 60\nthrottled_time 550000000\n",
+    "cpu,cpuacct/cpuacct.usage": "3000000000\n",
+    "memory/memory.usage_in_bytes": "%d\n" % (512 * 1024 * 1024),
+}
+
+
+@pytest.fixture
+def cgroup_data_source(tmpdir, monkeypatch):
+    monkeypatch.setattr(cgroup_usage, "CGROUP_ROOT", str(tmpdir))
+
+    samplers = []
+
+    def _cgroup_data_source(files):
+        _write_cgroup_files(tmpdir, files)
+        sampler = cgroup_usage_data_source(settings=())["factory"](environ=())
+        sampler.start()
+        samplers.append(sampler)
+        return sampler
+
+    yield _cgroup_data_source
+
+    for sampler in samplers:
+        sampler.stop()
+
+
+@pytest.mark.parametrize(
+    "files,updated_files,cpu_limit",
+    (
+        (CGROUP_V2_FILES, CGROUP_V2_FILES_UPDATED, 2.0),
+        (CGROUP_V1_FILES, CGROUP_V1_FILES_UPDATED, 0.5),
+    ),
+    ids=("v2", "v1"),
+)
+def test_cgroup_metrics_collection(tmpdir, cgroup_data_source, files, updated_files, cpu_limit):
+    @override_generic_settings(settings, {"cgroup_runtime_metrics.enabled": True})
+    def _test():
+        sampler = cgroup_data_source(files)
+
+        # Files are held open between harvests, so updated contents must be
+        # picked up from the existing file handles.
+
+        _write_cgroup_files(tmpdir, updated_files)
+        metrics_table = dict(sampler() or ())
+
+        assert metrics_table["CPU/Cgroup/Limit"] == cpu_limit
+        assert metrics_table["CPU/Cgroup/Usage Time"] == pytest.approx(2.0)
+        assert "CPU/Cgroup/Utilization" in metrics_table
+        assert metrics_table["CPU/Cgroup/Throttled/Periods"] == {"count": 50}
+        assert metrics_table["CPU/Cgroup/Throttled Time"] == pytest.approx(0.5)
+        assert metrics_table["CPU/Cgroup/Throttled/Ratio"] == pytest.approx(0.5)
+        assert metrics_table["Memory/Cgroup/Used"] == 512.0
+        assert metrics_table["Memory/Cgroup/Limit"] == 1024.0
+        assert metrics_table["Memory/Cgroup/Utilization"] == 0.5
+
+    _test()
+
+
+def test_cgroup_metrics_unlimited(cgroup_data_source):
+    files = dict(CGROUP_V2_FILES)
+    files["cpu.max"] = "max 100000\n"
+    files["memory.max"] = "max\n"
+
+    @override_generic_settings(settings, {"cgroup_runtime_metrics.enabled": True})
+    def _test():
+        sampler = cgroup_data_source(files)
+        metrics_table = dict(sampler() or ())
+
+        assert "CPU/Cgroup/Limit" not in metrics_table
+        assert "CPU/Cgroup/Utilization" in metrics_table
+        assert "Memory/Cgroup/Limit" not in metrics_table
+        assert metrics_table["Memory/Cgroup/Used"] == 256.0
+
+    _test()
+
+
+@pytest.mark.parametrize("enabled", (True, False))
+def test_cgroup_metrics_config(cgroup_data_source, enabled):
+    @override_generic_settings(settings, {"cgroup_runtime_metrics.enabled": enabled})
+    def _test():
+        sampler = cgroup_data_source(CGROUP_V2_FILES)
+        metrics_table = dict(sampler() or ())
+        assert bool(metrics_table) == enabled
+
+    _test()
+
+
+def test_cgroup_metrics_no_cgroup(cgroup_data_source):
+    @override_generic_settings(settings, {"cgroup_runtime_metrics.enabled": True})
+    def _test():
+        sampler = cgroup_data_source({})
+        assert not list(sampler() or ())
+
+    _test()
+
+
+@pytest.mark.skipif(
+    not sys.platform.startswith("linux") or not hasattr(threading.Thread, "native_id"),
+    reason="Per thread CPU times are only available on Linux",
+)
+def test_thread_cpu_metrics_collection(thread_cpu_data_source):
+    started = threading.Event()
+    finished = threading.Event()
+
+    def _busy():
+        started.set()
+        deadline = time.time() + 0.1
+        while time.time() < deadline:
+            pass
+        finished.wait()
+
+    thread = threading.Thread(target=_busy, name="NR-Test-Thread")
+    thread.start()
+    try:
+
+        @override_generic_settings(settings, {"thread_runtime_metrics.enabled": True})
+        def _test():
+            started.wait()
+
+            # The first sample establishes the baseline CPU time of threads.
+            list(thread_cpu_data_source())
+
+            time.sleep(0.2)
+            metrics_table = dict(thread_cpu_data_source() or ())
+
+            for category in ("REQUEST", "BACKGROUND", "AGENT", "OTHER"):
+                assert "CPU/Thread/%s/Time" % category in metrics_table
+                assert "CPU/Thread/%s/Utilization" % category in metrics_table
+
+            assert "CPU/Thread/AGENT/NR-Test-Thread" in metrics_table
+
+        _test()
+    finally:
+        finished.set()
+        thread.join()
+
+
+def test_thread_cpu_time_parsing(tmpdir):
+    tmpdir.join("1234").ensure(dir=True).join("stat").write(
+        "1234 (python (worker)) S 1 1234 1234 0 -1 4194560 1 0 0 0 250 50 0 0 20 0 1 0 1 0 0\n"
+    )
+
+    from newrelic.samplers.thread_cpu_usage import thread_cpu_time
+
+    assert thread_cpu_time(1234, root=str(tmpdir), clock_ticks=100.0) == 3.0
+    assert thread_cpu_time(4321, root=str(tmpdir), clock_ticks=100.0) is None
@@ -0,0 +1,103 @@
+# Copyright 2010 New Relic, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from collections import namedtuple
+
+import pytest
+
+from newrelic.core.config import finalize_application_settings
+from newrelic.core.stats_engine import SlowSqlTable, StatsEngine
+
+SlowSqlNode = namedtuple(
+    "SlowSqlNode",
+    [
+        "identifier",
+        "duration",
+        "statement",
+        "connect_params",
+        "cursor_params",
+        "sql_parameters",
+        "execute_params",
+        "sql_format",
+    ],
+)
+
+
+def slow_sql_node(identifier, duration):
+    return SlowSqlNode(identifier, duration, None, None, None, None, None, "obfuscated")
+
+
+@pytest.fixture()
+def stats_engine():
+    settings = finalize_application_settings({"agent_limits.slow_sql_data": 3})
+    stats_engine = StatsEngine()
+    stats_engine.reset_stats(settings)
+    return stats_engine
+
+
+def _retained(stats_engine):
+    table = stats_engine._StatsEngine__sql_stats_table
+    return dict((key, stats.max_call_time) for key, stats in table.items())
+
+
+def test_slowest_sql_retained(stats_engine):
+    for identifier, duration in enumerate((0.5, 0.1, 0.3, 0.2, 0.7, 0.05, 0.4)):
+        stats_engine.record_slow_sql_node(slow_sql_node(identifier, duration))
+
+    assert _retained(stats_engine) == {0: 0.5, 4: 0.7, 6: 0.4}
+
+
+def test_slow_sql_updated_entry_not_evicted(stats_engine):
+    for identifier, duration in enumerate((0.1, 0.2, 0.3)):
+        stats_engine.record_slow_sql_node(slow_sql_node(identifier, duration))
+
+    # The fastest statement becomes the slowest, so the next new
+    # statement must evict the second fastest instead.
+
+    stats_engine.record_slow_sql_node(slow_sql_node(0, 0.9))
+    stats_engine.record_slow_sql_node(slow_sql_node(3, 0.25))
+
+    assert _retained(stats_engine) == {0: 0.9, 2: 0.3, 3: 0.25}
+
+    stats = stats_engine._StatsEngine__sql_stats_table.get(0)
+    assert stats.call_count == 2
+    assert stats.min_call_time == 0.1
+
+
+def test_slow_sql_merge(stats_engine):
+    for identifier, duration in enumerate((0.1, 0.2, 0.3)):
+        stats_engine.record_slow_sql_node(slow_sql_node(identifier, duration))
+
+    snapshot = StatsEngine()
+    snapshot.reset_stats(stats_engine.settings)
+    snapshot.record_slow_sql_node(slow_sql_node(1, 0.6))
+    snapshot.record_slow_sql_node(slow_sql_node(5, 0.15))
+    snapshot.record_slow_sql_node(slow_sql_node(6, 0.05))
+
+    stats_engine.merge(snapshot)
+
+    assert _retained(stats_engine) == {1: 0.6, 2: 0.3, 5: 0.15}
+
+    stats = stats_engine._StatsEngine__sql_stats_table.get(1)
+    assert stats.call_count == 2
+
+
+def test_slow_sql_table_heap_compaction():
+    table = SlowSqlTable()
+
+    for i in range(1000):
+        table.merge_slow_sql_node(i % 2, slow_sql_node(i % 2, i * 0.001), 2)
+
+    assert len(table) == 2
+    assert len(table._SlowSqlTable__heap) <= 2 * len(table) + 16
@@ -0,0 +1,136 @@
+# Copyright 2010 New Relic, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import json
+import os
+
+import pytest
+
+from newrelic.common.encoding_utils import (
+    DistributedTracePayload,
+    NrTraceState,
+    TraceContextTemplate,
+    TraceStateCache,
+    W3CTraceParent,
+    W3CTraceState,
+)
+
+CURRENT_DIR = os.path.dirname(os.path.realpath(__file__))
+JSON_DIR = os.path.normpath(os.path.join(CURRENT_DIR, "fixtures", "distributed_tracing"))
+
+
+def load_inbound_headers():
+    result = []
+    path = os.path.join(JSON_DIR, "trace_context.json")
+    with open(path, "r") as fh:
+        tests = json.load(fh)
+
+    for test in tests:
+        for index, headers in enumerate(test.get("inbound_headers") or ()):
+            param = pytest.param(
+                test["trusted_account_key"], headers, id="%s-%d" % (test["test_name"], index)
+            )
+            result.append(param)
+
+    return result
+
+
+@pytest.mark.parametrize("trusted_account_key,headers", load_inbound_headers())
+def test_traceparent_decode(trusted_account_key, headers):
+    # Version 00 headers are validated with a single regular expression.
+    traceparent = (headers.get("traceparent") or "").strip()
+    if not traceparent.startswith("00-"):
+        return
+
+    expected = None
+
+    fields = traceparent.split("-")
+    if (
+        len(traceparent) == 55
+        and len(fields) == 4
+        and [len(f) for f in fields] == [2, 32, 16, 2]
+        and all(f == f.lower() and all(c in "0123456789abcdef" for c in f) for f in fields)
+        and fields[1] != "0" * 32
+        and fields[2] != "0" * 16
+    ):
+        expected = {"tr": fields[1], "id": fields[2]}
+
+    assert W3CTraceParent.decode(traceparent) == expected
+
+
+@pytest.mark.parametrize("trusted_account_key,headers", load_inbound_headers())
+def test_tracestate_decode(trusted_account_key, headers):
+    tracestate = headers.get("tracestate")
+    if not tracestate:
+        return
+
+    vendors = W3CTraceState.decode(tracestate)
+    payload = vendors.pop(trusted_account_key + "@nr", "")
+    expected = (payload, ",".join(vendors.keys()), vendors.text(limit=31))
+
+    cache = TraceStateCache()
+
+    # The second decode is served from the cache.
+    assert cache.decode(tracestate, trusted_account_key) == expected
+    assert cache.decode(tracestate, trusted_account_key) == expected
+
+
+def test_tracestate_cache_bounded():
+    cache = TraceStateCache(maximum=2)
+
+    for i in range(5):
+        cache.decode("33@nr=0-0-33-2827902-%d,vendor%d=value" % (i, i), "33")
+
+    assert len(cache._cache) == 2
+
+
+@pytest.mark.parametrize("span_id", (None, "7d3efb1b173fecfa"))
+@pytest.mark.parametrize("tracestate", ("", "dd=YzRiMTIxODk1NmVmZTE4ZQ,rojo=00f067aa0ba902b7"))
+@pytest.mark.parametrize("trusted_account_key", (None, "33"))
+def test_outbound_headers(span_id, tracestate, trusted_account_key):
+    data = dict(
+        ty="App",
+        ac="1",
+        ap="2827902",
+        tr="da8bc8cc6d062849b0efcf3c169afb5a",
+        sa=True,
+        pr=1.234567,
+        tx="e8b91a159289ff74",
+        ti=1518469636035,
+    )
+    if trusted_account_key:
+        data["tk"] = trusted_account_key
+    if span_id:
+        data["id"] = span_id
+
+    template = TraceContextTemplate(data, tracestate)
+
+    for ti in (1518469636035, 1518469636999):
+        data["ti"] = ti
+
+        if span_id:
+            assert template.traceparent(data) == W3CTraceParent(data).text()
+        else:
+            assert len(template.traceparent(data)) == 55
+
+        expected = NrTraceState(data).text()
+        if tracestate:
+            expected += "," + tracestate
+        assert template.tracestate(data) == expected
+
+        payload = DistributedTracePayload.decode(template.payload(data))
+        assert payload == json.loads(
+            json.dumps(DistributedTracePayload(v=DistributedTracePayload.version, d=data))
+        )
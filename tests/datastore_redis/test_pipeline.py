@@ -0,0 +1,125 @@
+# Copyright 2010 New Relic, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import redis
+
+from newrelic.api.background_task import background_task
+from newrelic.api.transaction import current_transaction
+
+from testing_support.fixtures import override_application_settings
+from testing_support.validators.validate_span_events import validate_span_events
+from testing_support.validators.validate_transaction_metrics import validate_transaction_metrics
+from testing_support.db_settings import redis_settings
+
+DB_SETTINGS = redis_settings()[0]
+
+# Settings
+
+_enable_pipeline_settings = {
+    'datastore_tracer.pipeline_mode.enabled': True,
+    'distributed_tracing.enabled': True,
+    'span_events.enabled': True,
+}
+_disable_pipeline_settings = {
+    'datastore_tracer.pipeline_mode.enabled': False,
+}
+
+# Metrics
+
+_enable_scoped_metrics = (
+        ('Datastore/operation/Redis/pipeline', 1),
+        ('Datastore/operation/Redis/get', None),
+        ('Datastore/operation/Redis/set', None),
+)
+
+_enable_rollup_metrics = (
+        ('Datastore/all', 1),
+        ('Datastore/allOther', 1),
+        ('Datastore/Redis/all', 1),
+        ('Datastore/Redis/allOther', 1),
+        ('Datastore/operation/Redis/pipeline', 1),
+)
+
+_disable_scoped_metrics = (
+        ('Datastore/operation/Redis/pipeline', None),
+        ('Datastore/operation/Redis/get', 2),
+        ('Datastore/operation/Redis/set', 1),
+)
+
+_disable_rollup_metrics = (
+        ('Datastore/all', 3),
+        ('Datastore/allOther', 3),
+        ('Datastore/Redis/all', 3),
+        ('Datastore/Redis/allOther', 3),
+        ('Datastore/operation/Redis/get', 2),
+        ('Datastore/operation/Redis/set', 1),
+)
+
+# Operations
+
+
+def exercise_pipeline(client):
+    with client.pipeline(transaction=False) as pipeline:
+        pipeline.set('key', 'value')
+        pipeline.get('key')
+        pipeline.get('key')
+        assert pipeline.execute() == [True, b'value', b'value']
+
+
+def _client():
+    # The pipeline is run once outside of a transaction, so that the
+    # commands sent when a connection is first made are not recorded.
+
+    client = redis.StrictRedis(host=DB_SETTINGS['host'],
+            port=DB_SETTINGS['port'], db=0)
+    exercise_pipeline(client)
+    return client
+
+
+# Tests
+
+
+def test_pipeline_mode_enabled():
+    client = _client()
+
+    @override_application_settings(_enable_pipeline_settings)
+    @validate_span_events(count=1, exact_agents={
+            'redis.pipeline.operations': 'get:2,set:1'})
+    @validate_transaction_metrics(
+            'test_pipeline:test_pipeline_mode_enabled',
+            scoped_metrics=_enable_scoped_metrics,
+            rollup_metrics=_enable_rollup_metrics,
+            background_task=True)
+    @background_task(name='test_pipeline:test_pipeline_mode_enabled')
+    def _test():
+        current_transaction()._sampled = True
+        exercise_pipeline(client)
+
+    _test()
+
+
+def test_pipeline_mode_disabled():
+    client = _client()
+
+    @override_application_settings(_disable_pipeline_settings)
+    @validate_transaction_metrics(
+            'test_pipeline:test_pipeline_mode_disabled',
+            scoped_metrics=_disable_scoped_metrics,
+            rollup_metrics=_disable_rollup_metrics,
+            background_task=True)
+    @background_task(name='test_pipeline:test_pipeline_mode_disabled')
+    def _test():
+        exercise_pipeline(client)
+
+    _test()
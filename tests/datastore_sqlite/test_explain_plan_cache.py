@@ -0,0 +1,206 @@
+# Copyright 2010 New Relic, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import sqlite3 as database
+import time
+
+import pytest
+from testing_support.fixtures import override_generic_settings
+
+from newrelic.core import database_utils
+from newrelic.core.config import global_settings
+from newrelic.core.database_utils import (
+    ExplainPlanCache,
+    SQLConnections,
+    explain_plan,
+    sql_statement,
+)
+
+SQL = "select * from datastore_sqlite where a = ?"
+
+
+@pytest.fixture()
+def database_name(tmpdir, monkeypatch):
+    monkeypatch.setattr(database_utils, "_explain_plan_cache", None)
+    monkeypatch.setattr(database_utils, "_explain_plan_worker", None)
+
+    # Explain plans are not enabled for SQLite by the hook, so the explain
+    # query is registered for the tests only.
+
+    monkeypatch.setattr(database, "_nr_explain_query", "explain query plan", raising=False)
+    monkeypatch.setattr(database, "_nr_explain_stmts", ("select",), raising=False)
+
+    name = str(tmpdir.join("explain.db"))
+
+    connection = database.connect(name)
+    connection.execute("create table datastore_sqlite (a, b, c)")
+    connection.commit()
+    connection.close()
+
+    return name
+
+
+def _explain_plan(database_name):
+    with SQLConnections() as connections:
+        return explain_plan(
+            connections,
+            sql_statement(SQL, database),
+            ((database_name,), {}),
+            None,
+            (1,),
+            None,
+            "obfuscated",
+        )
+
+
+def _cache_key(database_name):
+    return database_utils._explain_plan_cache_key(sql_statement(SQL, database), ((database_name,), {}), "obfuscated")
+
+
+def _drop_table(database_name):
+    connection = database.connect(database_name)
+    connection.execute("drop table datastore_sqlite")
+    connection.commit()
+    connection.close()
+
+
+@override_generic_settings(global_settings(), {"explain_plan_cache.enabled": True})
+def test_explain_plan_cache_hit(database_name):
+    details = _explain_plan(database_name)
+    assert details
+
+    # With the table dropped the explain plan can only be obtained from
+    # the cache.
+
+    _drop_table(database_name)
+
+    assert _explain_plan(database_name) == details
+
+    database_utils.explain_plan_cache().clear()
+
+    assert _explain_plan(database_name) is None
+
+
+@override_generic_settings(global_settings(), {"explain_plan_cache.enabled": True})
+def test_explain_plan_cache_per_database(database_name, tmpdir):
+    assert _explain_plan(database_name)
+
+    # The same SQL run against a database without the table cannot be
+    # explained, so must not be given the plan cached for the first.
+
+    assert _explain_plan(str(tmpdir.join("other.db"))) is None
+
+
+@override_generic_settings(
+    global_settings(),
+    {
+        "explain_plan_cache.enabled": True,
+        "explain_plan_cache.background_worker": True,
+    },
+)
+def test_explain_plan_background_worker(database_name):
+    assert _explain_plan(database_name) is None
+
+    cache = database_utils.explain_plan_cache()
+    key = _cache_key(database_name)
+
+    timeout = time.time() + 10.0
+    while key not in cache and time.time() < timeout:
+        time.sleep(0.01)
+
+    details = _explain_plan(database_name)
+    assert details
+    assert details == cache.get(key)[1]
+
+
+@override_generic_settings(
+    global_settings(),
+    {
+        "explain_plan_cache.enabled": True,
+        "explain_plan_cache.background_worker": True,
+        "fork_handling.enabled": True,
+    },
+)
+def test_explain_plan_worker_after_fork(database_name):
+    cache = database_utils.explain_plan_cache()
+    key = _cache_key(database_name)
+
+    for _ in range(2):
+        assert _explain_plan(database_name) is None
+
+        timeout = time.time() + 10.0
+        while key not in cache and time.time() < timeout:
+            time.sleep(0.01)
+
+        assert key in cache
+
+        # The worker thread is started again once the state inherited from
+        # the parent process is reset.
+
+        database_utils._after_fork_in_child()
+        assert database_utils._explain_plan_worker._thread is None
+
+        cache.clear()
+
+
+@override_generic_settings(
+    global_settings(),
+    {
+        "explain_plan_cache.enabled": True,
+        "explain_plan_cache.background_worker": True,
+        "fork_handling.enabled": False,
+    },
+)
+def test_explain_plan_worker_after_fork_disabled(database_name):
+    assert _explain_plan(database_name) is None
+
+    worker = database_utils._explain_plan_worker
+    lock = database_utils._explain_plan_lock
+
+    # The state inherited from the parent process is left alone where
+    # fork handling has not been enabled.
+
+    database_utils._after_fork_in_child()
+
+    assert database_utils._explain_plan_lock is lock
+    assert worker._thread is not None
+
+
+@override_generic_settings(global_settings(), {"explain_plan_cache.enabled": False})
+def test_explain_plan_cache_disabled(database_name):
+    assert _explain_plan(database_name)
+
+    _drop_table(database_name)
+
+    assert _explain_plan(database_name) is None
+    assert database_utils._explain_plan_cache is None
+
+
+def test_explain_plan_cache_expiry_and_eviction():
+    cache = ExplainPlanCache(ttl=60.0, maximum=2)
+
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == (True, 1)
+
+    # The least recently used entry is dropped.
+
+    cache.put("c", 3)
+    assert "b" not in cache
+    assert "a" in cache
+    assert "c" in cache
+
+    cache.ttl = -1.0
+    cache.put("d", None)
+    assert cache.get("d") == (False, None)
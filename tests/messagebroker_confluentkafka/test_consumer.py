@@ -14,7 +14,11 @@
 
 import pytest
 from conftest import cache_kafka_consumer_headers
-from testing_support.fixtures import reset_core_stats_engine, validate_attributes
+from testing_support.fixtures import (
+    override_generic_settings,
+    reset_core_stats_engine,
+    validate_attributes,
+)
 from testing_support.validators.validate_distributed_trace_accepted import (
     validate_distributed_trace_accepted,
 )
@@ -34,6 +38,8 @@ from testing_support.validators.validate_transaction_metrics import (
 from newrelic.api.background_task import background_task
 from newrelic.api.transaction import end_of_transaction
 from newrelic.common.object_names import callable_name
+from newrelic.core.config import global_settings
+from newrelic.hooks import messagebroker_confluentkafka
 from newrelic.packages import six
 
 
@@ -188,3 +194,66 @@ def test_distributed_tracing_headers(topic, producer, consumer, serialize):
 
     _produce()
     _consume()
+
+
+@pytest.fixture()
+def get_consumer_batch(client_type, topic, send_producer_message, consumer, deserialize):
+    if client_type != "cimpl":
+        pytest.skip("Only the cimpl client supports consume().")
+
+    def _test():
+        send_producer_message()
+
+        record_count = 0
+
+        timeout = 10
+        attempts = 0
+        while not record_count and attempts < timeout:
+            for record in consumer.consume(num_messages=10, timeout=0.5):
+                assert not record.error()
+                assert deserialize(record.value()) == {"foo": 1}
+                record_count += 1
+            attempts += 1
+
+        consumer.consume(num_messages=10, timeout=0.5)  # Exit the transaction.
+
+        assert record_count == 1, "Incorrect count of records consumed: %d. Expected 1." % record_count
+
+    return _test
+
+
+def test_batch_mode(get_consumer_batch, topic):
+    @override_generic_settings(global_settings(), {"kafka_batch_mode.enabled": True})
+    @validate_transaction_metrics(
+        "Named/%s" % topic,
+        group="Message/Kafka/Topic",
+        scoped_metrics=[("MessageBroker/Kafka/Topic/Consume/Named/%s" % topic, None)],
+        custom_metrics=[
+            ("Message/Kafka/Topic/Named/%s/Received/Bytes" % topic, 1),
+            ("Message/Kafka/Topic/Named/%s/Received/Messages" % topic, 1),
+        ],
+        background_task=True,
+    )
+    @validate_attributes("agent", ["kafka.consume.byteCount", "kafka.consume.messageCount"])
+    @validate_transaction_count(1)
+    def _test():
+        get_consumer_batch()
+
+    _test()
+
+
+def test_batch_mode_disabled(get_consumer_batch, topic, monkeypatch):
+    # The messages are not measured at all outside of a transaction when
+    # batch mode is not enabled.
+
+    def _fail(*args, **kwargs):
+        raise AssertionError("Messages measured when batch mode is disabled.")
+
+    monkeypatch.setattr(messagebroker_confluentkafka, "KafkaMessage", _fail)
+
+    @override_generic_settings(global_settings(), {"kafka_batch_mode.enabled": False})
+    @validate_transaction_count(0)
+    def _test():
+        get_consumer_batch()
+
+    _test()